@@ -0,0 +1,180 @@
+"""
+Measure the start-up cost of generate_feedback.py for one utterance, as a per-utterance job runner calls it.
+
+Every run starts a fresh interpreter on a copy of the database and submits a new
+utterance with `--analysis_only`, the path that never sets up the LLM client.
+The script reports the median over --repeat runs of:
+    
+    imports        time spent importing modules (`python -X importtime`), interpreter start-up included
+    first output   wall time until the first line on stdout
+    analysis       wall time until the analysis feedback has been printed and the process exits
+
+and the same for a bare interpreter (`python -c pass`) for reference. It also
+lists the heaviest imports and fails if any module that should be deferred
+(huggingface_hub, asyncio, the personalized generator) was imported. With
+--budget_ms, it exits with status 1 if the median analysis time exceeds the budget.
+
+Usage (from the project directory):
+    python benchmarks/bench_cli_startup.py --database_path data/database.db --repeat 10 --budget_ms 250
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from src.database import Database
+
+SCRIPT = os.path.join(PROJECT_DIR, "generate_feedback.py")
+# Imported only for personalized feedback; an analysis-only run must not load them
+DEFERRED_MODULES = ["huggingface_hub", "asyncio", "src.personalized_gen", "src.response_cache", "src.database_builder"]
+# Numbers the utterances the runs submit, so that every run inserts a new one
+RUN_NUMBERS = itertools.count()
+
+def copy_database(database_path, workdir):
+    """Copy a SQLite database (including its write-ahead log) to <workdir>/data/database.db, where the CLI looks for it."""
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    source = sqlite3.connect(database_path)
+    target = sqlite3.connect(os.path.join(workdir, "data", "database.db"))
+    with target:
+        source.backup(target)
+    source.close()
+    target.close()
+
+def utterance_arguments(utt):
+    """Command-line arguments describing a database utterance (without --utt_id; every run submits a new ID)."""
+    scores = utt["scores"]
+    arguments = ["--speaker_id", utt["speaker_id"], "--text", utt["text"], "--word_scores", json.dumps(scores["word_scores"])]
+    for name in ("accuracy", "fluency", "prosodic", "completeness"):
+        arguments += [f"--{name}", str(scores[name])]
+    return arguments
+
+def parse_importtime(stderr):
+    """
+    Read the `-X importtime` report.
+    
+    Returns:
+        tuple: (total microseconds of the top-level imports, {module: cumulative microseconds} of the top-level imports,
+        set of every imported module).
+    """
+    total = 0
+    top_level = {}
+    imported = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        imported.add(name.strip())
+        # Nested imports are indented by two spaces per level
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+            top_level[name.strip()] = int(cumulative)
+    return total, top_level, imported
+
+def run_once(command, workdir):
+    """
+    Run a command and time it.
+    
+    Returns:
+        tuple: (seconds to the first stdout line, seconds to exit, stderr text).
+    """
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    first_line = process.stdout.readline()
+    first = time.perf_counter() - start if first_line else None
+    stdout, stderr = process.communicate()
+    total = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(command[:3])} ... failed with status {process.returncode}:\n{stderr[-2000:]}")
+    return (first if first is not None else total), total, stderr
+
+def time_cli(workdir, arguments, repeat, importtime=True):
+    """
+    Time `generate_feedback.py --analysis_only` runs, each submitting a new utterance.
+    
+    Args:
+        workdir (str): Directory with data/database.db; runs add utterances to it.
+        arguments (list): Utterance arguments from `utterance_arguments`.
+        repeat (int): Number of runs.
+        importtime (bool): Also measure the imports (adds a little overhead to every run).
+    
+    Returns:
+        dict: Lists of per-run "first_output", "total" and "imports" seconds, the
+        "top_imports" and the set of "imported" modules of the last run.
+    """
+    result = {"first_output": [], "total": [], "imports": [], "top_imports": {}, "imported": set()}
+    for _ in range(repeat):
+        command = [sys.executable] + (["-X", "importtime"] if importtime else []) + [SCRIPT, "--analysis_only", "--quiet",
+                                                                                    "--utt_id", f"CLI{os.getpid()}{next(RUN_NUMBERS):05d}"] + arguments
+        first, total, stderr = run_once(command, workdir)
+        result["first_output"].append(first)
+        result["total"].append(total)
+        if importtime:
+            imports, result["top_imports"], result["imported"] = parse_importtime(stderr)
+            result["imports"].append(imports / 1e6)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database_path", default=os.path.join(PROJECT_DIR, "data", "database.db"), help="Existing SQLite database (it is copied, not modified)")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per measurement (default: 10)")
+    parser.add_argument("--budget_ms", type=float, help="Fail if the median analysis-only run takes longer than this")
+    parser.add_argument("--top", type=int, default=8, help="Number of heaviest imports to list (default: 8)")
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix="pfg_cli_startup_")
+    try:
+        copy_database(args.database_path, workdir)
+        db = Database(database_path=os.path.join(workdir, "data", "database.db"), use_snapshot=False)
+        arguments = utterance_arguments(next(iter(db.data["utterances"].values())))
+        db.storage.close()
+        time_cli(workdir, arguments, 1, importtime=False)  # warm the page cache
+        
+        bare = {"first_output": [], "total": [], "imports": []}
+        for _ in range(args.repeat):
+            _, total, stderr = run_once([sys.executable, "-X", "importtime", "-c", "pass"], workdir)
+            bare["total"].append(total)
+            bare["imports"].append(parse_importtime(stderr)[0] / 1e6)
+        cli = time_cli(workdir, arguments, args.repeat)
+        timed = time_cli(workdir, arguments, args.repeat, importtime=False)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    def ms(values):
+        return f"{statistics.median(values) * 1000:8.1f} ms" if values else " " * 11
+    
+    print(f"\ngenerate_feedback.py --analysis_only, median of {args.repeat} runs:")
+    print(f"  {'':<22} {'imports':>11} {'first output':>13} {'analysis':>11}")
+    print(f"  {'bare interpreter':<22} {ms(bare['imports'])} {'':>13} {ms(bare['total'])}")
+    print(f"  {'analysis only':<22} {ms(cli['imports'])}   {ms(timed['first_output'])} {ms(timed['total'])}")
+    print(f"\nHeaviest imports (cumulative, last run):")
+    for name, microseconds in sorted(cli["top_imports"].items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<30} {microseconds / 1000:8.1f} ms")
+    
+    failed = False
+    loaded = [name for name in DEFERRED_MODULES if name in cli["imported"]]
+    if loaded:
+        print(f"\nImported although only analysis feedback was requested: {', '.join(loaded)}")
+        failed = True
+    if args.budget_ms is not None:
+        median = statistics.median(timed["total"]) * 1000
+        within = median <= args.budget_ms
+        print(f"\nStart-up budget: {median:.1f} ms of {args.budget_ms:g} ms{'' if within else ' - OVER BUDGET'}")
+        failed = failed or not within
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
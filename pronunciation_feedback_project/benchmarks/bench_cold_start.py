@@ -0,0 +1,65 @@
+"""
+Compare Database cold-start time from the binary snapshot, from SQLite and from JSON.
+
+Each measurement starts a fresh interpreter that imports `Database` and loads the
+database, so the numbers include interpreter start-up and imports.
+
+Usage (from the project directory):
+    python benchmarks/bench_cold_start.py --database_path data/database.db --repeat 5
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from src.database import Database
+from src.storage import JSONStorage
+
+LOAD_SCRIPT = "import sys; sys.path.insert(0, sys.argv[1]); from src.database import Database; Database(database_path=sys.argv[2], use_snapshot=sys.argv[3] == '1')"
+
+def time_load(workdir, database_path, use_snapshot, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", LOAD_SCRIPT, PROJECT_DIR, database_path, "1" if use_snapshot else "0"],
+                       cwd=workdir, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database_path", default=os.path.join(PROJECT_DIR, "data", "database.db"), help="Existing SQLite database to benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of cold starts per variant")
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix="pfg_cold_start_")
+    try:
+        os.makedirs(os.path.join(workdir, "data"))
+        sqlite_path = os.path.join(workdir, "data", "database.db")
+        json_path = os.path.join(workdir, "data", "database.json")
+        shutil.copy(args.database_path, sqlite_path)
+        db = Database(database_path=sqlite_path)  # also writes the snapshot
+        JSONStorage(json_path).replace_all(db.data)
+        utterances = len(db.data["utterances"])
+        
+        variants = [
+            ("snapshot", sqlite_path, True),
+            ("sqlite", sqlite_path, False),
+            ("json", json_path, False)
+        ]
+        print(f"\nCold start for {utterances} utterances ({args.repeat} runs each):")
+        for name, path, use_snapshot in variants:
+            timings = time_load(workdir, path, use_snapshot, args.repeat)
+            print(f"  {name:<9} median {statistics.median(timings) * 1000:8.1f} ms   min {min(timings) * 1000:8.1f} ms")
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
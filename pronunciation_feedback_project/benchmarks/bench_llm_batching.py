@@ -0,0 +1,148 @@
+"""
+Measure the throughput of a local generation backend with and without dynamic batching.
+
+Prompts are built by PersonalizedGenerator._create_prompt from synthetic speaker
+histories and sent concurrently, the way the feedback service (threads, through
+`generate_from_prompt`) and `regenerate_personalized.py` (asyncio, through the
+backend's async API) send them. Each --batch_sizes value is one run; batch size
+1 is the single-request path. For every run the script reports prompts per
+second, p50/p99 latency and the mean batch size, and compares the generated
+text with the single-request run (sampling is turned off). The tiny model must
+match exactly; real models may differ in a few outputs because of padding.
+
+The default backend is the deterministic tiny model in benchmarks/tiny_model.py,
+so the script runs offline:
+    
+    python benchmarks/bench_llm_batching.py --prompts 128 --concurrency 16 --batch_sizes 1 4 8 16
+    python benchmarks/bench_llm_batching.py --backend transformers --model_path /models/gemma-2-2b-it --prompts 32
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, os.path.join(PROJECT_DIR, "benchmarks"))
+
+from src.instrumentation import set_quiet
+from src.llm_backends import make_backend
+from src.personalized_gen import PersonalizedGenerator
+from tiny_model import TinyModelBackend
+
+PHONES = ["AA", "AE", "AH", "DH", "ER", "IH", "L", "NG", "R", "TH", "V", "W", "Z", "ZH"]
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def make_prompts(generator, count, seed):
+    rng = random.Random(seed)
+    prompts = []
+    for i in range(count):
+        history = {
+            "speaker_id": f"{i + 1:04d}",
+            "total_attempts": rng.randint(2, 40),
+            "averages": {key: rng.uniform(3, 10) for key in ("accuracy", "fluency", "prosodic")},
+            "phoneme_issues": {phone: rng.randint(1, 20) for phone in rng.sample(PHONES, 4)}
+        }
+        prompts.append(generator._create_prompt(history))
+    return prompts
+
+def open_backend(args, batch_size):
+    if args.backend == "tiny":
+        return TinyModelBackend(max_batch_size=batch_size, max_wait=args.max_wait)
+    return make_backend(args.backend, model_path=args.model_path, threads=args.threads,
+                        max_batch_size=batch_size, max_wait=args.max_wait)
+
+def run_threads(generator, prompts, concurrency):
+    # Returns (texts, latencies) through the synchronous path the feedback service uses
+    def one(prompt):
+        start = time.perf_counter()
+        text = generator.generate_from_prompt(prompt)
+        return text, time.perf_counter() - start
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, prompts))
+    return [text for text, _ in results], [latency for _, latency in results]
+
+def run_async(generator, prompts, concurrency):
+    # Returns (texts, latencies) through the backend's async API, as regenerate_personalized.py uses it
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def one(prompt):
+            async with semaphore:
+                start = time.perf_counter()
+                text = await generator.backend.generate_async(prompt, generator.generation_params)
+                return text, time.perf_counter() - start
+        
+        return await asyncio.gather(*(one(prompt) for prompt in prompts))
+    
+    results = asyncio.run(run())
+    return [text for text, _ in results], [latency for _, latency in results]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", choices=["tiny", "transformers", "llama_cpp"], default="tiny")
+    parser.add_argument("--model_path", help="Model for the transformers and llama_cpp backends")
+    parser.add_argument("--threads", type=int, help="CPU threads for the transformers and llama_cpp backends")
+    parser.add_argument("--prompts", type=int, default=128, help="Prompts per run (default: 128)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Prompts in flight (default: 16)")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 4, 8, 16], help="Maximum batch sizes to compare (default: 1 4 8 16)")
+    parser.add_argument("--max_wait", type=float, default=0.005, help="Seconds the batcher waits for more prompts (default: 0.005)")
+    parser.add_argument("--max_new_tokens", type=int, default=32, help="Tokens generated per prompt (default: 32)")
+    parser.add_argument("--mode", choices=["threads", "async"], default="threads")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.backend != "tiny" and args.model_path is None:
+        parser.error(f"--backend {args.backend} needs --model_path")
+    
+    set_quiet(True)
+    prompts = None
+    run = run_threads if args.mode == "threads" else run_async
+    print(f"{args.backend} backend, {args.prompts} prompts, {args.concurrency} in flight, "
+          f"{args.max_new_tokens} new tokens, {args.mode}")
+    
+    reference = None
+    baseline = None
+    mismatches = 0
+    for batch_size in args.batch_sizes:
+        backend = open_backend(args, batch_size)
+        generator = PersonalizedGenerator(backend=backend)
+        generator.generation_params = {"max_new_tokens": args.max_new_tokens, "do_sample": False}
+        if prompts is None:
+            prompts = make_prompts(generator, args.prompts, args.seed)
+        run(generator, prompts[:min(len(prompts), args.concurrency)], args.concurrency)  # warm-up
+        batches, batched = backend.batcher.batches, backend.batcher.prompts
+        
+        start = time.perf_counter()
+        texts, latencies = run(generator, prompts, args.concurrency)
+        elapsed = time.perf_counter() - start
+        generator.close()
+        
+        throughput = len(prompts) / elapsed
+        baseline = baseline or throughput
+        mean_batch = (backend.batcher.prompts - batched) / max(1, backend.batcher.batches - batches)
+        differing = 0
+        if reference is None:
+            reference = texts
+        else:
+            differing = sum(text != expected for text, expected in zip(texts, reference))
+            mismatches += differing
+        print(f"  batch size {batch_size:>3}: {throughput:8.1f} prompts/s ({throughput / baseline:5.2f}x), "
+              f"p50 {percentile(latencies, 50) * 1000:7.1f} ms, p99 {percentile(latencies, 99) * 1000:7.1f} ms, "
+              f"mean batch {mean_batch:5.1f}" + (f", {differing} outputs differ" if differing else ""))
+    
+    if mismatches:
+        print(f"{mismatches} outputs differ from the single-request run")
+        # Padding can legitimately change a real model's greedy output; the tiny model must match exactly
+        if args.backend == "tiny":
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Compare the resident memory of a loaded database as dictionaries and as compact records.
+
+Each variant loads the database in a fresh interpreter and reports the growth of
+the resident set size (RSS) over the load, the Python heap still allocated
+afterwards (tracemalloc, measured in a separate run because tracing slows the
+load down) and the load time. Then both models are loaded side by side and
+checked to give the same utterances, analysis feedback and speaker aggregates.
+
+Usage (from the project directory):
+    python benchmarks/bench_memory.py --database_path data/database.db
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from src.analysis_gen import AnalysisGenerator
+from src.database import Database
+
+LOAD_SCRIPT = """
+import contextlib, gc, json, os, sys, time, tracemalloc
+sys.path.insert(0, sys.argv[1])
+from src.database import Database
+
+def rss():
+    # Current resident set size; ru_maxrss would report the peak instead
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+database_path, use_snapshot, compact, traced = sys.argv[2], sys.argv[3] == "1", sys.argv[4] == "1", sys.argv[5] == "1"
+gc.collect()
+before = rss()
+if traced:
+    tracemalloc.start()
+start = time.perf_counter()
+with contextlib.redirect_stdout(sys.stderr):
+    db = Database(database_path=database_path, use_snapshot=use_snapshot, compact=compact)
+seconds = time.perf_counter() - start
+gc.collect()
+result = {"rss": rss() - before, "seconds": seconds}
+if traced:
+    result["heap"] = tracemalloc.get_traced_memory()[0]
+print(json.dumps(result))
+"""
+
+VARIANTS = [
+    ("dict, from snapshot", True, False),
+    ("dict, from SQLite", False, False),
+    ("compact records", False, True)
+]
+
+def measure(workdir, database_path, use_snapshot, compact, traced):
+    output = subprocess.run(
+        [sys.executable, "-c", LOAD_SCRIPT, PROJECT_DIR, database_path, "1" if use_snapshot else "0",
+         "1" if compact else "0", "1" if traced else "0"],
+        cwd=workdir, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    ).stdout
+    return json.loads(output)
+
+def verify(database_path):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        plain = Database(database_path=database_path, use_snapshot=False)
+        compact = Database(database_path=database_path, use_snapshot=False, compact=True)
+        generator = AnalysisGenerator()
+        mismatches = 0
+        for utt_id, utt in plain.data["utterances"].items():
+            record = compact.data["utterances"][utt_id]
+            mismatches += record != utt
+            scores = utt["scores"]
+            if scores and all(key in scores for key in ("accuracy", "completeness", "fluency", "prosodic", "word_scores")):
+                mismatches += generator.generate_analysis(utt_id, utt["text"], record["scores"]) != \
+                    generator.generate_analysis(utt_id, utt["text"], scores)
+        for speaker_id in plain.data["speakers"]:
+            a, b = plain.get_speaker_aggregate(speaker_id), compact.get_speaker_aggregate(speaker_id)
+            mismatches += (a.count, a.sums, a.phoneme_issues) != (b.count, b.sums, b.phoneme_issues)
+        converted = sum(type(utt) is not dict for utt in compact.data["utterances"].values())
+    return mismatches, converted, len(plain.data["utterances"])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database_path", default="data/database.db", help="Existing SQLite database to measure")
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix="pfg_memory_")
+    try:
+        os.makedirs(os.path.join(workdir, "data"))
+        database_path = os.path.join(workdir, "data", "database.db")
+        shutil.copy(args.database_path, database_path)
+        measure(workdir, database_path, True, False, False)  # writes the snapshot
+        
+        print(f"Database: {os.path.getsize(database_path) / 1e6:.1f} MB on disk")
+        results = {}
+        for name, use_snapshot, compact in VARIANTS:
+            result = measure(workdir, database_path, use_snapshot, compact, False)
+            result["heap"] = measure(workdir, database_path, use_snapshot, compact, True)["heap"]
+            results[name] = result
+            print(f"  {name:<20} RSS +{result['rss'] / 1e6:6.1f} MB   heap {result['heap'] / 1e6:6.1f} MB   "
+                  f"load {result['seconds'] * 1000:7.1f} ms")
+        plain, compact = results["dict, from SQLite"], results["compact records"]
+        print(f"Compact records use {plain['rss'] / compact['rss']:.1f}x less resident memory "
+              f"and {plain['heap'] / compact['heap']:.1f}x less heap than dictionaries")
+        
+        mismatches, converted, total = verify(database_path)
+        print(f"{converted} of {total} utterances held as records; {mismatches} mismatches against the dict model")
+        sys.exit(1 if mismatches else 0)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
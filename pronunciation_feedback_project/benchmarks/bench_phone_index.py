@@ -0,0 +1,130 @@
+"""
+Benchmark phone error queries on the inverted phone index against a full scan.
+
+Loads the database, times building the PhoneIndex, then answers "top speakers
+for a phone" and "phone errors of a speaker" for every phone and speaker both
+from the index and by scanning every word of every utterance, and checks that
+the answers agree (and that a mispronunciation without an index is located in
+its word instead of counted as a second error). Finally replaces some utterances through insert_utterance
+(on a temporary copy of the database) and checks the index again.
+
+Usage (from the project directory):
+    python benchmarks/bench_phone_index.py --database_path data/database.db
+"""
+import argparse
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from src.database import Database
+from src.phone_index import PhoneIndex
+
+def scan_counts(utterances):
+    # (phone -> {speaker: count}, speaker -> {phone: count}) by walking every word
+    by_phone, by_speaker = {}, {}
+    for utt in utterances:
+        for word in (utt.get("scores") or {}).get("word_scores", []):
+            for phone, _, _ in PhoneIndex.word_errors(word):
+                counts = by_phone.setdefault(phone, {})
+                counts[utt["speaker_id"]] = counts.get(utt["speaker_id"], 0) + 1
+                counts = by_speaker.setdefault(utt["speaker_id"], {})
+                counts[phone] = counts.get(phone, 0) + 1
+    return by_phone, by_speaker
+
+def ranked(counts, k=None):
+    items = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return items if k is None else items[:k]
+
+def verify(db, k):
+    index = db.get_phone_index()
+    by_phone, by_speaker = scan_counts(db.data["utterances"].values())
+    mismatches = 0
+    for phone, counts in by_phone.items():
+        mismatches += index.top_speakers(phone, k) != ranked(counts, k)
+        mismatches += len(index.errors(phone)) != sum(counts.values())
+    for speaker_id, counts in by_speaker.items():
+        mismatches += index.speaker_phone_errors(speaker_id) != ranked(counts)
+    mismatches += set(index.speaker_errors) != set(by_speaker)
+    return mismatches, by_phone, by_speaker
+
+def check_unindexed():
+    # Mispronunciations inserted through generate_feedback.py have no index; one on a phone that is
+    # also scored below the threshold is the same error and must be counted once
+    word = {"word": "HELLO", "accuracy": 7.0, "stress": 8.0, "phones": ["HH", "EH1", "L", "OW0"],
+            "phones-accuracy": [2.0, 1.0, 2.0, 2.0],
+            "mispronunciations": [{"canonical-phone": "EH1", "produced-phone": "<unk>"},
+                                  {"canonical-phone": "OW0", "produced-phone": "AO1"}]}
+    expected = [("EH1", 1, 1.0), ("OW0", 3, 2.0)]
+    actual = PhoneIndex.word_errors(word)
+    if actual != expected:
+        print(f"Unindexed mispronunciations: {actual}, expected {expected}")
+        return 1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database_path", default="data/database.db", help="Existing database to benchmark")
+    parser.add_argument("--k", type=int, default=10, help="Speakers per top-K query")
+    parser.add_argument("--replace", type=int, default=200, help="Utterances replaced through insert_utterance")
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix="pfg_phone_index_")
+    try:
+        database_path = os.path.join(workdir, os.path.basename(args.database_path))
+        shutil.copy(args.database_path, database_path)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            db = Database(database_path=database_path, use_snapshot=False)
+        utterances = list(db.data["utterances"].values())
+        
+        start = time.perf_counter()
+        PhoneIndex.from_utterances(utterances)
+        build = time.perf_counter() - start
+        print(f"Built the phone index for {len(utterances)} utterances in {build * 1000:.1f} ms")
+        
+        index = db.get_phone_index()
+        phones = list(index.phones.names)
+        speakers = list(index.speaker_errors)
+        start = time.perf_counter()
+        for phone in phones:
+            index.top_speakers(phone, args.k)
+        for speaker_id in speakers:
+            index.speaker_phone_errors(speaker_id)
+        indexed = time.perf_counter() - start
+        start = time.perf_counter()
+        by_phone, by_speaker = scan_counts(utterances)
+        for phone in phones:
+            ranked(by_phone.get(phone, {}), args.k)
+        for speaker_id in speakers:
+            ranked(by_speaker.get(speaker_id, {}))
+        scan = time.perf_counter() - start
+        queries = len(phones) + len(speakers)
+        print(f"{queries} queries ({len(phones)} phones, {len(speakers)} speakers): "
+              f"index {indexed / queries * 1e6:.1f} us/query, one full scan {scan * 1000:.1f} ms")
+        
+        mismatches, _, _ = verify(db, args.k)
+        print(f"Index vs scan after load: {mismatches} mismatches")
+        
+        # Replace utterances with altered copies (moving every other one to another speaker)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for i, utt in enumerate(utterances[:args.replace]):
+                scores = dict(utt["scores"])
+                scores["word_scores"] = [dict(word, **{"phones-accuracy": [0.0] * len(word.get("phones", []))})
+                                         for word in scores.get("word_scores", [])]
+                speaker_id = utterances[-1]["speaker_id"] if i % 2 else utt["speaker_id"]
+                db.insert_utterance(utt["utt_id"], speaker_id, utt["text"], scores, None, batch=True)
+        replaced, _, _ = verify(db, args.k)
+        print(f"Index vs scan after replacing {min(args.replace, len(utterances))} utterances: {replaced} mismatches")
+        db.storage.close()
+        unindexed = check_unindexed()
+        sys.exit(1 if mismatches or replaced or unindexed else 0)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
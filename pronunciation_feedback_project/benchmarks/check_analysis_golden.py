@@ -0,0 +1,201 @@
+"""
+Golden-output check for the analysis feedback renderer.
+
+Renders analysis feedback with AnalysisGenerator and with the reference
+implementation below (the string-building version it replaced) and reports
+every utterance whose text differs. Inputs are every utterance of the database,
+a set of hand-written edge cases (range boundaries, out-of-range scores,
+missing mispronunciations, mismatched phone lists, command-line key names) and
+seeded random score dicts. Also times both implementations.
+
+Usage (from the project directory):
+    python benchmarks/check_analysis_golden.py --database_path data/database.db --random 20000
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import random
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from src.analysis_gen import AnalysisGenerator
+from src.rag_setup import RAGSetup
+
+PHONES = ["AA0", "AE1", "AH0", "ER1", "EH1", "HH", "IY1", "L", "OW0", "R", "TH", "W", "<unk>"]
+WORDS = ["HELLO", "WORLD", "THREE", "RED", "WATER", "BIRD"]
+
+def reference_analysis(rag, utt_id, text, scores):
+    # The renderer this check guards, kept verbatim as the golden reference
+    feedback = f"Your sentence ‘{text}’ scores:\n"
+    feedback += f"- Accuracy {scores['accuracy']:.1f}: {rag.lookup('accuracy', scores['accuracy'])}.\n"
+    feedback += f"- Completeness {scores['completeness']:.1f}: {rag.lookup('completeness', scores['completeness'])}.\n"
+    feedback += f"- Fluency {scores['fluency']:.1f}: {rag.lookup('fluency', scores['fluency'])}.\n"
+    feedback += f"- Prosodic {scores['prosodic']:.1f}: {rag.lookup('prosodic', scores['prosodic'])}.\n"
+    
+    for word in scores["word_scores"]:
+        if word["accuracy"] < 8 or word["stress"] < 10:
+            feedback += f"- ‘{word['text']}’ (accuracy: {word['accuracy']:.1f}, stress: {word['stress']:.1f}): "
+            if "mispronunciations" in word and word["mispronunciations"]:
+                for mis in word["mispronunciations"]:
+                    feedback += f"You said ‘{mis['pronounced-phone']}’ instead of ‘{mis['canonical-phone']}’. "
+            else:
+                feedback += "Some phonemes need work. "
+            
+            if len(word["phones"]) != len(word["phones-accuracy"]):
+                print(f"Warning: Mismatch in utterance {utt_id}, word '{word['text']}': "
+                      f"phones={word['phones']}, phones-accuracy={word['phones-accuracy']}")
+                continue
+            
+            for i, score in enumerate(word["phones-accuracy"]):
+                if score < 1.5:
+                    phone = word["phones"][i]
+                    feedback += f"Focus on ‘{phone}’—{'heavy accent' if 0.5 <= score < 1.5 else 'incorrect'} pronunciation.\n"
+    
+    return feedback
+
+def to_input_keys(scores):
+    # The same scores with the key names used by generate_feedback.py
+    words = []
+    for word in scores["word_scores"]:
+        word = dict(word)
+        word["word"] = word.pop("text")
+        word["mispronunciations"] = [
+            {"canonical-phone": mis["canonical-phone"], "produced-phone": mis["pronounced-phone"]}
+            for mis in word.get("mispronunciations", [])
+        ]
+        words.append(word)
+    return {**scores, "word_scores": words}
+
+def make_word(text, accuracy, stress, phones_accuracy, mispronunciations=None, phones=None):
+    word = {
+        "text": text, "accuracy": accuracy, "stress": stress,
+        "phones": phones if phones is not None else PHONES[:len(phones_accuracy)],
+        "phones-accuracy": phones_accuracy
+    }
+    if mispronunciations is not None:
+        word["mispronunciations"] = mispronunciations
+    return word
+
+def edge_cases():
+    cases = []
+    boundaries = [0, 0.5, 2, 2.5, 2.999, 3, 3.9995, 4, 6.999, 7, 7.5, 8, 8.9995, 9, 10, 10.5, 10.999, 11, -1, -0.0, math.nan]
+    for i, score in enumerate(boundaries):
+        scores = {"accuracy": score, "fluency": score, "prosodic": score, "completeness": 1.0, "word_scores": []}
+        cases.append((f"EDGE_SCORE{i}", "HELLO", scores))
+    for i, completeness in enumerate([0, 0.5, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 0.999, 1, 1.0005, 1.001, 1.5]):
+        scores = {"accuracy": 7, "fluency": 7, "prosodic": 7, "completeness": completeness, "word_scores": []}
+        cases.append((f"EDGE_COMPLETENESS{i}", "HELLO", scores))
+    words = [
+        make_word("HELLO", 10, 10, [2.0, 2.0]),                  # not listed
+        make_word("HELLO", 8, 9.9, [2.0, 1.4]),                  # listed for stress only
+        make_word("WORLD", 7.9, 10, [1.5, 1.49, 0.5, 0.49, 0]),  # phone thresholds
+        make_word("RED", 5, 5, [1.0], []),                       # empty mispronunciations
+        make_word("RED", 5, 5, [1.0, 1.0], phones=["R"]),        # mismatched phone lists
+        make_word("BIRD", 3, 8, [0.2, 1.2, 2.0], [
+            {"canonical-phone": "ER1", "index": 1, "pronounced-phone": "AH0"},
+            {"canonical-phone": "B", "index": 0, "pronounced-phone": "<unk>"}
+        ]),
+        make_word("THREE", math.nan, 10, [math.nan, 1.0]),
+        make_word("THREE", 0, -0.0, [0.0])
+    ]
+    for i, word in enumerate(words):
+        scores = {"accuracy": 6, "fluency": 6, "prosodic": 6, "completeness": 0.9, "word_scores": [word]}
+        cases.append((f"EDGE_WORD{i}", WORDS[i % len(WORDS)], scores))
+    cases.append(("EDGE_ALL_WORDS", "HELLO WORLD", {"accuracy": 4, "fluency": 5, "prosodic": 3, "completeness": 0.8, "word_scores": words}))
+    return cases
+
+def random_cases(count, seed):
+    rng = random.Random(seed)
+    cases = []
+    for i in range(count):
+        words = []
+        for _ in range(rng.randint(0, 6)):
+            phones = rng.sample(PHONES, rng.randint(1, 5))
+            mispronunciations = [
+                {"canonical-phone": phone, "index": j, "pronounced-phone": rng.choice(PHONES)}
+                for j, phone in enumerate(phones) if rng.random() < 0.2
+            ]
+            words.append(make_word(rng.choice(WORDS), rng.randint(0, 20) / 2, rng.randint(10, 20) / 2,
+                                   [rng.randint(0, 20) / 10 for _ in phones], mispronunciations, phones))
+        scores = {
+            "accuracy": rng.randint(0, 100) / 10, "fluency": rng.randint(0, 100) / 10,
+            "prosodic": rng.randint(0, 100) / 10, "completeness": rng.choice([1.0, 0.9, 0.8, 0.5, rng.random()]),
+            "word_scores": words
+        }
+        cases.append((f"RANDOM{i:06d}", " ".join(w["text"] for w in words), scores))
+    return cases
+
+def database_cases(database_path):
+    from src.storage import open_storage
+    storage = open_storage(database_path)
+    data = storage.load()
+    storage.close()
+    cases = []
+    for utt_id, utt in sorted(data["utterances"].items()):
+        scores = utt["scores"]
+        # The reference only reads speechocean762 key names
+        if all(key in scores for key in ("accuracy", "completeness", "fluency", "prosodic", "word_scores")) \
+                and all("text" in word for word in scores["word_scores"]):
+            cases.append((utt_id, utt["text"], scores))
+    if len(cases) < len(data["utterances"]):
+        print(f"{database_path}: skipping {len(data['utterances']) - len(cases)} utterances with incomplete scores or command-line key names")
+    return cases
+
+def check(name, cases, generator, rag):
+    mismatches = 0
+    with contextlib.redirect_stdout(io.StringIO()):  # silence the mismatch warnings of both renderers
+        rendered = generator.render_many(cases)
+        for (utt_id, text, scores), actual in zip(cases, rendered):
+            expected = reference_analysis(rag, utt_id, text, scores)
+            single = generator.generate_analysis(utt_id, text, scores)
+            input_keys = generator.generate_analysis(utt_id, text, to_input_keys(scores))
+            for label, value in (("render_many", actual), ("generate_analysis", single), ("input keys", input_keys)):
+                if value != expected:
+                    mismatches += 1
+                    if mismatches <= 5:
+                        sys.stderr.write(f"{name} {utt_id} ({label}):\n--- expected\n{expected}\n--- got\n{value}\n")
+    print(f"{name}: {len(cases)} utterances, {mismatches} mismatches")
+    return mismatches
+
+def bench(cases, generator, rag, repeat):
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for utt_id, text, scores in cases:
+                reference_analysis(rag, utt_id, text, scores)
+        reference = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(repeat):
+            generator.render_many(cases)
+        compiled = time.perf_counter() - start
+    n = len(cases) * repeat
+    print(f"reference: {n / reference:.0f} utterances/s, render_many: {n / compiled:.0f} utterances/s "
+          f"({reference / compiled:.2f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database_path", default="data/database.db", help="Database whose utterances are checked (skipped if missing)")
+    parser.add_argument("--random", type=int, default=20000, help="Number of random score dicts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions")
+    args = parser.parse_args()
+    
+    generator = AnalysisGenerator()
+    rag = RAGSetup()
+    suites = [("edge cases", edge_cases()), ("random", random_cases(args.random, args.seed))]
+    if os.path.exists(args.database_path):
+        suites.append((args.database_path, database_cases(args.database_path)))
+    else:
+        print(f"{args.database_path} not found; checking edge cases and random inputs only")
+    
+    mismatches = sum(check(name, cases, generator, rag) for name, cases in suites)
+    bench([case for _, cases in suites[1:] for case in cases] or suites[0][1], generator, rag, args.repeat)
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Check that the materialized cohort baselines match a recomputation and time them.
+
+Builds a SQLite database from the speechocean762 sources (or a synthetic corpus
+from benchmarks/synthetic_corpus.py) in a temporary directory and checks that:
+    
+    build        the vectorized build equals adding the utterances one at a time
+    updates      after inserting, replacing and deleting utterances, the statistics kept
+                 up to date by the database equal statistics rebuilt from the new contents
+    phone index  the phone error counts equal those of the database's PhoneIndex, also for
+                 inserted utterances whose mispronunciations have no index (as from the CLI)
+    lazy file    a lazy database stores its statistics next to the database file; a later
+                 process replays the utterances added or replaced since (taking a replaced one
+                 out with the contribution stored for it), and rebuilds the statistics when
+                 an utterance was deleted
+    pending      loaded while a batch of writes is uncommitted, the stored statistics are
+                 replayed and the pending writes applied on top, without a rebuild
+
+It reports the build and update times and the cost of the per-request queries
+made for personalized feedback.
+
+Usage (from the project directory):
+    python benchmarks/check_cohort_stats.py --sources data/speechocean762-main --edits 50
+"""
+import argparse
+import contextlib
+import copy
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from src.cohort_stats import SCORE_KEYS, CohortStats
+from src.database import Database
+from src.instrumentation import METRICS
+from src.score_store import ScoreStore
+
+def source_paths(root):
+    return (os.path.join(root, "resource", "scores-detail.json"), os.path.join(root, "resource", "text-phone"),
+            os.path.join(root, "train", "utt2spk"))
+
+def quiet():
+    return contextlib.redirect_stdout(open(os.devnull, "w"))
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    with quiet():
+        result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def open_database(database_path, sources, lazy=False):
+    scores_detail_path, text_phone_path, utt2spk_path = source_paths(sources)
+    return Database(scores_detail_path=scores_detail_path, text_phone_path=text_phone_path, utt2spk_path=utt2spk_path,
+                    database_path=database_path, use_snapshot=False, lazy=lazy)
+
+def rebuilt(db):
+    return CohortStats.from_score_store(ScoreStore.from_utterances(db.data["utterances"].values()))
+
+def compare(name, actual, expected, errors):
+    if actual != expected:
+        differing = [key for key, value in expected.to_dict().items() if actual.to_dict()[key] != value]
+        errors.append(f"{name}: differs from a rebuild ({', '.join(differing)})")
+
+def compare_phone_index(name, stats, index, errors):
+    # Errors on phones of the word (an unresolvable mispronunciation has no phone occurrence to count)
+    counts = {phone: sum(posting[3] is not None for posting in index.errors(phone)) for phone in index.phones.names}
+    expected = {phone: count for phone, count in counts.items() if count}
+    actual = {phone: phone_errors for phone, (_, phone_errors) in stats.phones.items() if phone_errors}
+    if actual != expected:
+        differing = sorted(phone for phone in set(actual) | set(expected) if actual.get(phone) != expected.get(phone))
+        errors.append(f"{name}: phone error counts differ from the phone index ({', '.join(differing[:10])})")
+
+def cohort_sources():
+    # Where the cohort statistics were computed from since the last call
+    return [summary["labels"]["source"] for summary in METRICS.take()["summaries"]
+            if summary["name"] == "pfg_cohort_stats_seconds"]
+
+def add_utterances(db, rng, count, prefix, commit=True):
+    # New utterances copied from existing ones, half of them for speakers that are not in the database yet
+    sources = rng.sample(sorted(db.data["utterances"]), count)
+    for i, utt_id in enumerate(sources):
+        utt = copy.deepcopy(dict(db.data["utterances"][utt_id]))
+        utt["utt_id"] = f"{prefix}{i:06d}"
+        if i % 3 == 0:
+            # Mispronunciations given on the command line carry no index
+            for w in utt["scores"]["word_scores"]:
+                w["mispronunciations"] = [{key: value for key, value in mis.items() if key != "index"}
+                                          for mis in w.get("mispronunciations") or []]
+        if i % 2:
+            utt["speaker_id"] = f"{prefix}{i % 7}"
+        db.replace_utterance(utt, batch=True)
+    if commit:
+        db.batch_save()
+
+def edit_utterances(db, rng, count, commit=True, delete=True):
+    # Rescore some utterances, move some to another speaker and delete some
+    utt_ids = rng.sample(sorted(db.data["utterances"]), count * (3 if delete else 2))
+    speakers = sorted(db.data["speakers"])
+    for utt_id in utt_ids[:count]:
+        utt = copy.deepcopy(dict(db.data["utterances"][utt_id]))
+        utt["scores"]["accuracy"] = max(0, utt["scores"]["accuracy"] - 1.5)
+        for w in utt["scores"]["word_scores"]:
+            w["phones-accuracy"] = [max(0, score - 1) for score in w["phones-accuracy"]]
+        db.replace_utterance(utt, batch=True)
+    for utt_id in utt_ids[count:2 * count]:
+        utt = copy.deepcopy(dict(db.data["utterances"][utt_id]))
+        utt["speaker_id"] = rng.choice(speakers)
+        db.replace_utterance(utt, batch=True)
+    for utt_id in utt_ids[2 * count:]:
+        db.delete_utterance(utt_id, batch=True)
+    if commit:
+        db.batch_save()
+
+def run(sources, edits, seed):
+    rng = random.Random(seed)
+    workdir = tempfile.mkdtemp(prefix="pfg_cohort_")
+    errors = []
+    try:
+        database_path = os.path.join(workdir, "database.db")
+        db, _ = timed(open_database, database_path, sources)
+        utterances = list(db.data["utterances"].values())
+        
+        store, store_time = timed(ScoreStore.from_utterances, utterances)
+        stats, build_time = timed(CohortStats.from_score_store, store)
+        looped, loop_time = timed(CohortStats.from_utterances, utterances)
+        compare("build", stats, looped, errors)
+        
+        db.get_cohort_stats()
+        start = time.perf_counter()
+        with quiet():
+            add_utterances(db, rng, edits, "CHK")
+            edit_utterances(db, rng, edits)
+        update_time = time.perf_counter() - start
+        compare("updates", db.cohort_stats, rebuilt(db), errors)
+        compare_phone_index("phone index", db.cohort_stats, db.get_phone_index(), errors)
+        expected = rebuilt(db)
+        db.storage.close()
+        
+        # The first lazy open rebuilds the statistics and stores them
+        cohort_path = f"{database_path}.cohort"
+        with quiet():
+            lazy = open_database(database_path, sources, lazy=True)
+        _, lazy_build = timed(lazy.get_cohort_stats)
+        compare("lazy rebuild", lazy.cohort_stats, expected, errors)
+        lazy.storage.close()
+        if not os.path.exists(cohort_path):
+            errors.append(f"lazy rebuild: {cohort_path} was not written")
+        
+        # Added utterances are replayed from the stored statistics
+        with quiet():
+            writer = open_database(database_path, sources)
+            add_utterances(writer, rng, edits, "LZY")
+        expected = rebuilt(writer)
+        writer.storage.close()
+        with quiet():
+            lazy = open_database(database_path, sources, lazy=True)
+        cohort_sources()
+        _, lazy_replay = timed(lazy.get_cohort_stats)
+        compare("lazy replay", lazy.cohort_stats, expected, errors)
+        if cohort_sources() != ["file"]:
+            errors.append("lazy replay: the statistics were rebuilt")
+        lazy.storage.close()
+        
+        # Rescored and moved utterances are taken out with their stored contributions and added again
+        with quiet():
+            writer = open_database(database_path, sources)
+            edit_utterances(writer, rng, max(1, edits // 10), delete=False)
+        expected = rebuilt(writer)
+        writer.storage.close()
+        with quiet():
+            lazy = open_database(database_path, sources, lazy=True)
+        cohort_sources()
+        _, lazy_rewrite = timed(lazy.get_cohort_stats)
+        if cohort_sources() != ["file"]:
+            errors.append("lazy rewrite: the statistics were rebuilt")
+        compare("lazy rewrite", lazy.cohort_stats, expected, errors)
+        lazy.storage.close()
+        
+        # A deleted utterance makes them stale
+        with quiet():
+            writer = open_database(database_path, sources)
+            edit_utterances(writer, rng, max(1, edits // 10))
+        expected = rebuilt(writer)
+        writer.storage.close()
+        with quiet():
+            lazy = open_database(database_path, sources, lazy=True)
+            cohort_sources()
+            lazy.get_cohort_stats()
+        compare("lazy stale", lazy.cohort_stats, expected, errors)
+        if cohort_sources() != ["rebuild"]:
+            errors.append("lazy stale: the statistics were not rebuilt")
+        lazy.storage.close()
+        
+        # Writes still pending in the open transaction are applied on top of the stored statistics
+        with quiet():
+            lazy = open_database(database_path, sources, lazy=True)
+            add_utterances(lazy, rng, edits, "PND", commit=False)
+            edit_utterances(lazy, rng, max(1, edits // 10), commit=False)
+        cohort_sources()
+        _, lazy_pending = timed(lazy.get_cohort_stats)
+        if cohort_sources() != ["file"]:
+            errors.append("lazy pending: the statistics were not loaded from the stored file")
+        compare("lazy pending", lazy.cohort_stats, rebuilt(lazy), errors)
+        with quiet():
+            add_utterances(lazy, rng, edits, "PN2")
+        compare("lazy pending, then committed", lazy.cohort_stats, rebuilt(lazy), errors)
+        lazy.storage.close()
+        
+        speakers = sorted(expected.speakers)
+        phones = sorted(expected.phones)
+        start = time.perf_counter()
+        for speaker_id in speakers:
+            for key in SCORE_KEYS:
+                expected.speaker_rank(speaker_id, key)
+            for phone in phones[:3]:
+                expected.phone_error_rate(phone)
+        query_time = (time.perf_counter() - start) / max(1, len(speakers))
+        
+        print(f"{len(utterances)} utterances, {len(speakers)} speakers, {len(phones)} phones, {len(expected.words)} words")
+        print(f"  score store {store_time * 1000:.1f} ms, vectorized build {build_time * 1000:.1f} ms, "
+              f"one utterance at a time {loop_time * 1000:.1f} ms")
+        print(f"  {edits * 4} inserts, replacements and deletions kept up to date in {update_time * 1000:.1f} ms")
+        print(f"  lazy database: rebuild and store {lazy_build * 1000:.1f} ms, "
+              f"load and replay {edits} utterances {lazy_replay * 1000:.1f} ms, "
+              f"{max(1, edits // 10) * 2} rewritten {lazy_rewrite * 1000:.1f} ms, "
+              f"with {edits + max(1, edits // 10) * 3} pending writes {lazy_pending * 1000:.1f} ms")
+        print(f"  speaker percentiles and phone error rates: {query_time * 1e6:.1f} us per request")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    for error in errors[:10]:
+        print(f"  {error}")
+    print(f"  {len(errors)} errors")
+    return len(errors)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sources", default="data/speechocean762-main", help="speechocean762 directory (with resource/ and train/)")
+    parser.add_argument("--edits", type=int, default=50, help="Utterances added, rescored, moved and deleted (each)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    sys.exit(1 if run(args.sources, args.edits, args.seed) else 0)
+
+if __name__ == "__main__":
+    main()
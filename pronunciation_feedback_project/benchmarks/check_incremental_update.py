@@ -0,0 +1,180 @@
+"""
+Check that update_database.py matches a full rebuild and time both.
+
+Copies the speechocean762 sources to a temporary directory, builds a database
+with analysis feedback for every utterance, adds one utterance that is not in
+the sources, then edits the sources: changes the scores of some utterances,
+moves some to another speaker (scores unchanged), removes some and adds new
+ones. The database is then updated incrementally and compared with a database
+built from scratch from the edited sources: every source utterance must match,
+the extra utterance must survive, and analysis feedback must be kept exactly
+where the scores did not change and regenerated where they did. Finally the
+update is repeated with untouched sources and without a manifest.
+
+Usage (from the project directory):
+    python benchmarks/check_incremental_update.py --sources data/speechocean762-main --edits 50 --backend both
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from src.analysis_gen import AnalysisGenerator
+from src.database import Database
+from src.database_updater import update_database
+
+DATABASE_NAMES = {"sqlite": "database.db", "json": "database.json"}
+EXTRA_UTTERANCE = "EXTRA00001"
+
+def source_paths(root):
+    return (os.path.join(root, "resource", "scores-detail.json"), os.path.join(root, "resource", "text-phone"),
+            os.path.join(root, "train", "utt2spk"))
+
+def quiet():
+    return contextlib.redirect_stdout(open(os.devnull, "w"))
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    with quiet():
+        result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def open_database(database_path, sources, lazy=False):
+    scores_detail_path, text_phone_path, utt2spk_path = source_paths(sources)
+    return Database(scores_detail_path=scores_detail_path, text_phone_path=text_phone_path, utt2spk_path=utt2spk_path,
+                    database_path=database_path, use_snapshot=not lazy, lazy=lazy)
+
+def edit_sources(root, edits, seed):
+    # Returns {"rescored": ids, "moved": ids, "removed": ids, "added": ids}
+    rng = random.Random(seed)
+    scores_detail_path, text_phone_path, utt2spk_path = source_paths(root)
+    with open(scores_detail_path, "r") as f:
+        details = json.load(f)
+    with open(utt2spk_path, "r") as f:
+        utt2spk = dict(line.split() for line in f if line.strip())
+    with open(text_phone_path, "r") as f:
+        text_phone = [line for line in f if line.strip()]
+    
+    utt_ids = rng.sample(sorted(details), min(len(details), edits * 3))
+    rescored, moved, removed = utt_ids[:edits], utt_ids[edits:2 * edits], utt_ids[2 * edits:]
+    for utt_id in rescored:
+        detail = details[utt_id]
+        detail["accuracy"] = [max(0, score - 1) for score in detail["accuracy"]] \
+            if isinstance(detail["accuracy"], list) else max(0, detail["accuracy"] - 1)
+    for utt_id in moved:
+        utt2spk[utt_id] = "9999"
+    for utt_id in removed:
+        del details[utt_id]
+        utt2spk.pop(utt_id, None)
+    added = []
+    for i, utt_id in enumerate(rescored):
+        new_id = f"NEW{i:06d}"
+        details[new_id] = details[utt_id]
+        utt2spk[new_id] = "9998"
+        added.append(new_id)
+    
+    with open(scores_detail_path, "w") as f:
+        json.dump(details, f)
+    with open(utt2spk_path, "w") as f:
+        f.writelines(f"{utt_id} {speaker_id}\n" for utt_id, speaker_id in sorted(utt2spk.items()))
+    with open(text_phone_path, "w") as f:
+        f.writelines(text_phone)
+    return {"rescored": rescored, "moved": moved, "removed": removed, "added": added}
+
+def run(backend, sources, edits, seed, workers):
+    workdir = tempfile.mkdtemp(prefix="pfg_update_")
+    try:
+        root = os.path.join(workdir, "speechocean762-main")
+        for sub in ("resource", "train"):
+            shutil.copytree(os.path.join(sources, sub), os.path.join(root, sub))
+        database_path = os.path.join(workdir, DATABASE_NAMES[backend])
+        
+        db, build = timed(open_database, database_path, root)
+        generator = AnalysisGenerator()
+        with quiet():
+            utterances = db.data["utterances"]
+            db.save_analysis_feedback_many(zip(utterances, generator.render_many(
+                [(utt_id, utt["text"], utt["scores"]) for utt_id, utt in utterances.items()])))
+            db.insert_utterance(EXTRA_UTTERANCE, "9997", "HELLO", {"accuracy": 7, "completeness": 1.0, "fluency": 7,
+                                "prosodic": 7, "word_scores": []}, "extra feedback")
+        before = {utt_id: dict(utt) for utt_id, utt in db.data["utterances"].items()}
+        db.storage.close()
+        
+        edited = edit_sources(root, edits, seed)
+        with quiet():
+            # JSON databases have no lazy mode and are loaded whole
+            db = open_database(database_path, root, lazy=True)
+        summary, update = timed(update_database, db, *source_paths(root), workers=workers)
+        _, noop = timed(update_database, db, *source_paths(root))
+        db.storage.close()
+        
+        with quiet():
+            updated = open_database(database_path, root).data["utterances"]
+            expected = open_database(os.path.join(workdir, "rebuilt_" + DATABASE_NAMES[backend]), root).data["utterances"]
+        errors = []
+        for utt_id, utt in expected.items():
+            actual = updated.get(utt_id)
+            if actual is None or {k: v for k, v in actual.items() if k != "analysis_feedback"} != \
+                    {k: v for k, v in utt.items() if k != "analysis_feedback"}:
+                errors.append(f"{utt_id}: differs from the rebuilt database")
+                continue
+            old = before.get(utt_id)
+            if old is not None and old["text"] == utt["text"] and old["scores"] == utt["scores"]:
+                wanted = old["analysis_feedback"]
+            elif old is not None:
+                wanted = generator.generate_analysis(utt_id, utt["text"], utt["scores"])
+            else:
+                wanted = None  # new utterances are left for prepare_data.py
+            if actual["analysis_feedback"] != wanted:
+                errors.append(f"{utt_id}: unexpected analysis feedback")
+        extra = set(updated) - set(expected)
+        if extra != {EXTRA_UTTERANCE} or updated[EXTRA_UTTERANCE]["analysis_feedback"] != "extra feedback":
+            errors.append(f"utterances outside the sources: {sorted(extra)}")
+        wanted = {"added": len(edited["added"]), "changed": len(edited["rescored"]) + len(edited["moved"]),
+                  "removed": len(edited["removed"]), "feedback_kept": len(edited["moved"]),
+                  "feedback_regenerated": len(edited["rescored"])}
+        for key, count in wanted.items():
+            if summary[key] != count:
+                errors.append(f"summary {key}: {summary[key]}, expected {count}")
+        
+        os.remove(f"{database_path}.manifest")
+        with quiet():
+            db = open_database(database_path, root, lazy=True)
+        bootstrap, bootstrap_time = timed(update_database, db, *source_paths(root))
+        db.storage.close()
+        if bootstrap["added"] or bootstrap["changed"] or bootstrap["unchanged"] != len(expected):
+            errors.append(f"update without a manifest changed the database: {bootstrap}")
+        
+        print(f"{backend}: {len(expected)} utterances, {sum(map(len, edited.values()))} edited; "
+              f"full build {build:.2f}s, update {update:.2f}s, update with unchanged sources {noop * 1000:.1f} ms, "
+              f"update without a manifest {bootstrap_time:.2f}s")
+        for error in errors[:10]:
+            print(f"  {error}")
+        print(f"  {len(errors)} errors")
+        return len(errors)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sources", default="data/speechocean762-main", help="speechocean762 directory (with resource/ and train/)")
+    parser.add_argument("--edits", type=int, default=50, help="Utterances rescored, moved, removed and added (each)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for the update")
+    parser.add_argument("--backend", choices=["sqlite", "json", "both"], default="sqlite")
+    args = parser.parse_args()
+    
+    backends = ["sqlite", "json"] if args.backend == "both" else [args.backend]
+    errors = sum(run(backend, args.sources, args.edits, args.seed, args.workers) for backend in backends)
+    sys.exit(1 if errors else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Check that the feedback service rejects malformed requests without leaving a trace.
+
+Builds a database from a small synthetic corpus (benchmarks/synthetic_corpus.py)
+in a temporary directory, starts the service on it over HTTP and checks that:
+    
+    malformed scores   /analysis with non-numeric phone scores gets a 400, the utterance is not
+                       stored, the derived state still matches the utterances (Database.verify)
+                       and no write transaction is left open, so another connection can write
+    valid scores       a well-formed /analysis afterwards is stored and committed by /flush
+    metric labels      invalid JSON and unknown requests on random paths are timed under the
+                       endpoint label "unknown", so they cannot add label values
+
+Usage (from the project directory):
+    python benchmarks/check_service.py --scale 0.05
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.database import DEFAULT_DATABASE_PATH, Database
+from src.instrumentation import METRICS
+from synthetic_corpus import generate_corpus
+
+def quiet():
+    return contextlib.redirect_stdout(open(os.devnull, "w"))
+
+def post(url, path, body):
+    # Returns (status, decoded JSON body)
+    data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+    request = urllib.request.Request(url + path, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def word(phones_accuracy):
+    return {"word": "HELLO", "accuracy": 7.0, "stress": 10.0, "phones": ["HH", "EH1", "L", "OW0"],
+            "phones-accuracy": phones_accuracy, "mispronunciations": []}
+
+def analysis_request(utt_id, phones_accuracy):
+    return {"utt_id": utt_id, "speaker_id": "CHK1", "text": "HELLO",
+            "scores": {"accuracy": 7.0, "fluency": 8.0, "prosodic": 7.5, "completeness": 1.0,
+                       "word_scores": [word(phones_accuracy)]}}
+
+def can_write(database_path):
+    # A second connection, like the CLI or update_database.py in another process
+    conn = sqlite3.connect(database_path, timeout=1)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.rollback()
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+def check_malformed_scores(url, service, errors):
+    db = service.fg.db
+    # Build the derived state the request would have to update
+    with quiet():
+        db.get_speaker_aggregate("CHK1")
+        db.get_cohort_stats()
+    for phones_accuracy in (["x", 2.0, 2.0, 2.0], [None, 2.0, 2.0, 2.0], [2.0, 2.0]):
+        status, body = post(url, "/analysis", analysis_request("CHKBAD", phones_accuracy))
+        if status != 400:
+            errors.append(f"malformed scores {phones_accuracy}: status {status} ({body})")
+    if "CHKBAD" in db.data["utterances"]:
+        errors.append("malformed scores: the utterance was stored")
+    errors.extend(f"malformed scores: {problem}" for problem in db.verify())
+    if db.storage.in_transaction():
+        errors.append("malformed scores: a write transaction was left open")
+    if not can_write(db.database_path):
+        errors.append("malformed scores: another connection cannot write")
+
+def check_valid_scores(url, service, errors):
+    status, body = post(url, "/analysis", analysis_request("CHKGOOD", [2.0, 1.0, 2.0, 2.0]))
+    if status != 200:
+        errors.append(f"valid scores: status {status} ({body})")
+    with quiet():
+        post(url, "/flush", {})
+    db = service.fg.db
+    errors.extend(f"valid scores: {problem}" for problem in db.verify())
+    with quiet():
+        reloaded = Database(database_path=db.database_path, use_snapshot=False)
+    if "CHKGOOD" not in reloaded.data["utterances"]:
+        errors.append("valid scores: the utterance was not committed")
+    reloaded.storage.close()
+
+def check_metric_labels(url, seed, errors):
+    rng = random.Random(seed)
+    paths = [f"/x{rng.getrandbits(64):016x}" for _ in range(3)]
+    METRICS.take()
+    for path in paths:
+        post(url, path, b"{not json")
+        post(url, path, {"utt_id": "CHKGOOD"})
+    endpoints = {summary["labels"]["endpoint"] for summary in METRICS.take()["summaries"]
+                 if summary["name"] == "pfg_http_request_seconds"}
+    if endpoints & set(paths):
+        errors.append(f"metric labels: random paths were used as endpoint labels ({', '.join(sorted(endpoints))})")
+    if "unknown" not in endpoints:
+        errors.append("metric labels: requests on random paths were not timed as unknown")
+
+def run(scale, seed):
+    from src.feedback_service import FeedbackService, make_server
+    
+    workdir = tempfile.mkdtemp(prefix="pfg_service_check_")
+    server = service = None
+    errors = []
+    try:
+        sources = os.path.join(workdir, "data", "speechocean762-main")
+        with quiet():
+            generate_corpus(sources, scale, seed)
+        os.chdir(workdir)
+        with quiet():
+            # Built from the corpus at the default source paths
+            Database().storage.close()
+            # The LLM endpoint is never called: only analysis feedback is requested
+            service = FeedbackService(model_name="http://127.0.0.1:9", flush_interval=3600)
+        server = make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        
+        check_malformed_scores(url, service, errors)
+        check_valid_scores(url, service, errors)
+        check_metric_labels(url, seed, errors)
+        print(f"{len(service.fg.db.data['utterances'])} utterances in {DEFAULT_DATABASE_PATH}")
+    finally:
+        if server is not None:
+            server.shutdown()
+        if service is not None:
+            with quiet():
+                service.close()
+        os.chdir(PROJECT_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+    for error in errors[:10]:
+        print(f"  {error}")
+    print(f"  {len(errors)} errors")
+    return len(errors)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=0.05, help="Synthetic corpus size relative to speechocean762")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    sys.exit(1 if run(args.scale, args.seed) else 0)
+
+if __name__ == "__main__":
+    main()
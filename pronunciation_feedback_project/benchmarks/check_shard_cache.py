@@ -0,0 +1,112 @@
+"""
+Check the byte accounting of the lazy speaker shard cache.
+
+Builds a database from a small synthetic corpus (benchmarks/synthetic_corpus.py)
+in a temporary directory, opens it lazily and checks that:
+    
+    replace    replacing the same utterance many times leaves `cache.bytes` unchanged and
+               evicts nothing
+    move       an utterance moved to another speaker is counted only in its new shard
+    delete     a deleted utterance no longer counts
+
+After every step `cache.bytes` must equal the sizes recorded for the utterances
+in the cached shards, with each utterance counted once.
+
+Usage (from the project directory):
+    python benchmarks/check_shard_cache.py --replacements 200
+"""
+import argparse
+import contextlib
+import copy
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.database import Database
+from src.records import to_plain
+from synthetic_corpus import generate_corpus
+
+def quiet():
+    return contextlib.redirect_stdout(open(os.devnull, "w"))
+
+def open_database(workdir, lazy=False):
+    sources = os.path.join(workdir, "speechocean762-main")
+    return Database(scores_detail_path=os.path.join(sources, "resource", "scores-detail.json"),
+                    text_phone_path=os.path.join(sources, "resource", "text-phone"),
+                    utt2spk_path=os.path.join(sources, "train", "utt2spk"),
+                    database_path=os.path.join(workdir, "database.db"), use_snapshot=False, lazy=lazy)
+
+def compare_bytes(name, cache, errors):
+    # Every cached utterance counted once, and nothing else
+    for speaker_id, shard in cache.shards.items():
+        sizes = shard.get("sizes", {})
+        if sizes.keys() != shard["utterances"].keys() or shard["bytes"] != sum(sizes.values()):
+            errors.append(f"{name}: the sizes of shard {speaker_id} do not match its utterances")
+    expected = sum(shard["bytes"] for shard in cache.shards.values())
+    if cache.bytes != expected:
+        errors.append(f"{name}: cache.bytes is {cache.bytes}, the cached shards take {expected}")
+
+def run(replacements, seed):
+    workdir = tempfile.mkdtemp(prefix="pfg_shards_")
+    errors = []
+    try:
+        with quiet():
+            generate_corpus(os.path.join(workdir, "speechocean762-main"), 0.05, seed)
+            open_database(workdir).storage.close()
+            db = open_database(workdir, lazy=True)
+        cache = db.shards
+        speakers = sorted(db.data["speakers"])[:2]
+        utt_id = db.data["speakers"][speakers[0]][0]
+        utt = copy.deepcopy(dict(db.data["utterances"][utt_id]))
+        compare_bytes("load", cache, errors)
+        
+        # Room for a few shards, so an inflated count would evict
+        cache.max_bytes = cache.bytes * 4
+        with quiet():
+            # The first replacement swaps the stored size for the size of the new entry
+            db.replace_utterance(dict(utt), batch=True)
+        before, evictions = cache.bytes, cache.evictions
+        with quiet():
+            for _ in range(replacements):
+                db.replace_utterance(dict(utt), batch=True)
+        if cache.bytes != before:
+            errors.append(f"replace: cache.bytes went from {before} to {cache.bytes} after {replacements} replacements")
+        if cache.evictions != evictions:
+            errors.append(f"replace: {cache.evictions - evictions} shards were evicted")
+        compare_bytes("replace", cache, errors)
+        
+        with quiet():
+            db.get_speaker_utterances(speakers[1])
+            db.replace_utterance(dict(utt, speaker_id=speakers[1]), batch=True)
+        if utt_id in cache.shards[speakers[0]]["utterances"]:
+            errors.append("move: the utterance is still in its old speaker's shard")
+        compare_bytes("move", cache, errors)
+        
+        with quiet():
+            db.delete_utterance(utt_id, batch=True)
+        compare_bytes("delete", cache, errors)
+        db.storage.close()
+        print(f"{len(cache.shards)} cached shards, {cache.bytes} bytes after {replacements} replacements")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    for error in errors[:10]:
+        print(f"  {error}")
+    print(f"  {len(errors)} errors")
+    return len(errors)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--replacements", type=int, default=200, help="Times the same utterance is replaced")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    sys.exit(1 if run(args.replacements, args.seed) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Load-test the resident feedback service and report latency percentiles.
+
+By default the service is started in-process on a copy of the database, with the
+stub inference server standing in for the LLM, so the run touches neither the
+real database nor the network:
+    
+    python benchmarks/load_test_service.py --requests 2000 --concurrency 16 --llm_latency 0.05
+
+Pass --url to load-test an already running `serve_feedback.py` instead (new
+utterances are then written to its database).
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, os.path.join(PROJECT_DIR, "benchmarks"))
+
+from src.database import DEFAULT_DATABASE_PATH
+
+NEW_SCORES = {
+    "accuracy": 7.5, "fluency": 8.0, "prosodic": 7.8, "completeness": 1.0,
+    "word_scores": [{"word": "HELLO", "accuracy": 7.0, "stress": 8.0, "phones": ["HH", "EH1", "L", "OW0"],
+                     "phones-accuracy": [2.0, 1.0, 2.0, 2.0],
+                     "mispronunciations": [{"canonical-phone": "EH1", "produced-phone": "<unk>"}]}]
+}
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def build_workload(utt_ids, speaker_ids, requests, write_fraction, personalized_fraction, seed):
+    # (kind, path, payload) tuples; kind is the name latencies are reported under
+    rng = random.Random(seed)
+    workload = []
+    for i in range(requests):
+        roll = rng.random()
+        if roll < personalized_fraction:
+            workload.append(("personalized", "/personalized", {"speaker_id": rng.choice(speaker_ids)}))
+        elif roll < personalized_fraction + write_fraction:
+            payload = {"utt_id": f"LOADTEST{seed:03d}{i:07d}", "speaker_id": rng.choice(speaker_ids),
+                       "text": "HELLO", "scores": NEW_SCORES}
+            workload.append(("analysis (new)", "/analysis", payload))
+        else:
+            workload.append(("analysis (stored)", "/analysis", {"utt_id": rng.choice(utt_ids)}))
+    return workload
+
+def run_workload(url, workload, concurrency):
+    parsed = urlparse(url)
+    local = threading.local()
+    latencies = {}
+    errors = []
+    lock = threading.Lock()
+    
+    def send(item):
+        kind, path, payload = item
+        # One keep-alive connection per client thread
+        if getattr(local, "conn", None) is None:
+            local.conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=60)
+        body = json.dumps(payload)
+        start = time.perf_counter()
+        try:
+            local.conn.request("POST", path, body, {"Content-Type": "application/json"})
+            response = local.conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException) as e:
+            local.conn.close()
+            local.conn = None
+            status = str(e)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.setdefault(kind, []).append(elapsed)
+            if status != 200:
+                errors.append((kind, status))
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, workload))
+    return latencies, errors, time.perf_counter() - start
+
+def report(latencies, errors, elapsed, concurrency):
+    total = sum(len(values) for values in latencies.values())
+    print(f"\n{total} requests in {elapsed:.2f}s with {concurrency} clients: {total / elapsed:.0f} requests/s")
+    print(f"  {'endpoint':<20}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    all_values = []
+    for kind in sorted(latencies):
+        values = latencies[kind]
+        all_values.extend(values)
+        print(f"  {kind:<20}{len(values):>8}{percentile(values, 50) * 1000:>10.2f}"
+              f"{percentile(values, 99) * 1000:>10.2f}{max(values) * 1000:>10.2f}")
+    print(f"  {'all':<20}{len(all_values):>8}{percentile(all_values, 50) * 1000:>10.2f}"
+          f"{percentile(all_values, 99) * 1000:>10.2f}{max(all_values) * 1000:>10.2f}")
+    if errors:
+        print(f"  {len(errors)} failed requests, e.g. {errors[:3]}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="URL of a running feedback service (default: start one in-process)")
+    parser.add_argument("--database_path", default=os.path.join(PROJECT_DIR, DEFAULT_DATABASE_PATH), help="Database to copy for the in-process service")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--write_fraction", type=float, default=0.1, help="Fraction of requests inserting new utterances")
+    parser.add_argument("--personalized_fraction", type=float, default=0.1, help="Fraction of personalized feedback requests")
+    parser.add_argument("--llm_latency", type=float, default=0.05, help="Stub LLM latency in seconds (in-process mode)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    workdir = server = service = stub = None
+    url = args.url
+    try:
+        if url is None:
+            from src.feedback_service import FeedbackService, make_server
+            from stub_inference_server import serve
+            
+            workdir = tempfile.mkdtemp(prefix="pfg_load_test_")
+            os.makedirs(os.path.join(workdir, "data"))
+            shutil.copy(args.database_path, os.path.join(workdir, DEFAULT_DATABASE_PATH))
+            os.chdir(workdir)
+            stub = serve(port=0, latency=args.llm_latency)
+            service = FeedbackService(model_name=f"http://127.0.0.1:{stub.server_address[1]}")
+            server = make_server(service, port=0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{server.server_address[1]}"
+            utt_ids = list(service.fg.db.data["utterances"])
+            speaker_ids = list(service.fg.db.data["speakers"])
+        else:
+            from src.database import Database
+            db = Database(database_path=args.database_path, lazy=True)
+            utt_ids = db.storage.utt_ids()
+            speaker_ids = list(db.data["speakers"])
+        
+        workload = build_workload(utt_ids, speaker_ids, args.requests, args.write_fraction,
+                                  args.personalized_fraction, args.seed)
+        latencies, errors, elapsed = run_workload(url, workload, args.concurrency)
+        report(latencies, errors, elapsed, args.concurrency)
+        if service is not None:
+            print(f"  write-behind: {service.status()}")
+    finally:
+        if server is not None:
+            server.shutdown()
+            service.close()
+        if stub is not None:
+            stub.shutdown()
+        if workdir is not None:
+            os.chdir(PROJECT_DIR)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
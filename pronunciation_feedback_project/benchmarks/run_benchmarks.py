@@ -0,0 +1,298 @@
+"""
+Benchmark the hot paths on synthetic corpora and save the results as JSON.
+
+For each scale (1 = speechocean762 size, 5000 utterances), a synthetic corpus is
+generated with benchmarks/synthetic_corpus.py and the following are timed:
+    
+    database.build                          Database() from the sources
+    database.load_sqlite                    Database() from SQLite, no snapshot
+    database.load_snapshot                  Database() from the binary snapshot
+    database.open_lazy                      Database(lazy=True) and one speaker's utterances
+    analysis.generate_analysis              AnalysisGenerator.generate_analysis, every utterance
+    personalized.prepare_user_history_cold  first call per speaker (builds the aggregate)
+    personalized.prepare_user_history       later calls
+    personalized._create_prompt             prompt text from a prepared history
+    personalized.generate_personalized      end to end with a stub inference client
+    database.insert_utterance               insert_utterance(batch=True)
+    database.batch_save                     committing those inserts at once
+    database.insert_utterance_autocommit    insert_utterance committing every insert
+    cli.analysis_only                       generate_feedback.py --analysis_only in a new process,
+                                            start-up included (see benchmarks/bench_cli_startup.py)
+
+Each case reports the median over --repeat runs (builds run once), the number of
+operations and the time per operation. Results are written to
+benchmarks/results/<commit>.json by default; --compare prints the change
+against an earlier results file and exits with status 1 if any case got slower
+than --threshold times.
+
+Usage (from the project directory):
+    python benchmarks/run_benchmarks.py --scales 1 10
+    python benchmarks/run_benchmarks.py --scales 1 10 --compare benchmarks/results/<earlier commit>.json
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.analysis_gen import AnalysisGenerator
+from src.database import Database
+from src.personalized_gen import PersonalizedGenerator
+from bench_cli_startup import copy_database, time_cli, utterance_arguments
+from synthetic_corpus import generate_corpus
+
+RESULTS_DIR = os.path.join(PROJECT_DIR, "benchmarks", "results")
+
+class StubInferenceClient:
+    """Stands in for InferenceClient: answers instantly, echoing the prompt like the real endpoint can."""
+    def __init__(self):
+        self.calls = 0
+    
+    def text_generation(self, prompt, **params):
+        self.calls += 1
+        return f"{prompt} Keep practicing the sounds you find hard, one word at a time."
+
+def quiet():
+    return contextlib.redirect_stdout(open(os.devnull, "w"))
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR, check=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=PROJECT_DIR, check=True,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, bool(dirty)
+
+def case_result(runs, ops):
+    seconds = statistics.median(runs)
+    return {"seconds": seconds, "runs": runs, "ops": ops, "us_per_op": seconds / ops * 1e6 if ops else None}
+
+def measure(fn, repeat):
+    # fn() -> number of operations; returns the case record
+    runs = []
+    for _ in range(repeat):
+        with quiet():
+            start = time.perf_counter()
+            ops = fn()
+            runs.append(time.perf_counter() - start)
+    return case_result(runs, ops)
+
+def database_args(sources, database_path):
+    return {
+        "scores_detail_path": os.path.join(sources, "resource", "scores-detail.json"),
+        "text_phone_path": os.path.join(sources, "resource", "text-phone"),
+        "utt2spk_path": os.path.join(sources, "train", "utt2spk"),
+        "database_path": database_path
+    }
+
+def run_scale(scale, workdir, args):
+    sources = os.path.join(workdir, f"corpus-{scale:g}x")
+    start = time.perf_counter()
+    corpus = generate_corpus(sources, scale, args.seed)
+    corpus["generate_seconds"] = time.perf_counter() - start
+    print(f"{scale:g}x: {corpus['utterances']} utterances, {corpus['speakers']} speakers, "
+          f"{corpus['bytes'] / 1e6:.1f} MB of sources (generated in {corpus['generate_seconds']:.1f}s)")
+    database_path = os.path.join(workdir, f"database-{scale:g}x.db")
+    cases = {}
+    
+    def report(name, fn, repeat=args.repeat):
+        show(name, measure(fn, repeat))
+    
+    def show(name, result):
+        cases[name] = result
+        per_op = f"{result['us_per_op']:10.1f} us/op" if result["us_per_op"] is not None else ""
+        print(f"  {name:<42} {result['seconds'] * 1000:10.1f} ms  {result['ops']:>8} ops {per_op}")
+    
+    def build():
+        Database(workers=args.workers, **database_args(sources, database_path))
+        return corpus["utterances"]
+    report("database.build", build, repeat=1)
+    
+    def load(use_snapshot):
+        loaded = Database(use_snapshot=use_snapshot, **database_args(sources, database_path))
+        loaded.storage.close()
+        return len(loaded.data["utterances"])
+    report("database.load_sqlite", lambda: load(False))
+    report("database.load_snapshot", lambda: load(True))
+    with quiet():
+        db = Database(use_snapshot=False, **database_args(sources, database_path))
+    speakers = sorted(db.data["speakers"])
+    
+    def open_lazy():
+        lazy_db = Database(lazy=True, **database_args(sources, database_path))
+        lazy_db.get_speaker_utterances(speakers[0])
+        lazy_db.storage.close()
+        return 1
+    report("database.open_lazy", open_lazy)
+    
+    items = [(utt_id, utt["text"], utt["scores"]) for utt_id, utt in db.data["utterances"].items()]
+    analysis_gen = AnalysisGenerator()
+    
+    def generate_analysis():
+        for utt_id, text, scores in items:
+            analysis_gen.generate_analysis(utt_id, text, scores)
+        return len(items)
+    report("analysis.generate_analysis", generate_analysis)
+    
+    with quiet():
+        personalized_gen = PersonalizedGenerator()
+    personalized_gen.backend.client = StubInferenceClient()
+    
+    def prepare_user_history_cold():
+        db.speaker_aggregates.clear()
+        for speaker_id in speakers:
+            personalized_gen.prepare_user_history(db, speaker_id, None)
+        return len(speakers)
+    report("personalized.prepare_user_history_cold", prepare_user_history_cold)
+    
+    def prepare_user_history():
+        for speaker_id in speakers:
+            personalized_gen.prepare_user_history(db, speaker_id, None)
+        return len(speakers)
+    report("personalized.prepare_user_history", prepare_user_history)
+    
+    histories = [personalized_gen.prepare_user_history(db, speaker_id, None) for speaker_id in speakers]
+    histories = [history for history in histories if "error" not in history]
+    
+    def create_prompt():
+        for history in histories:
+            personalized_gen._create_prompt(history)
+        return len(histories)
+    report("personalized._create_prompt", create_prompt)
+    
+    def generate_personalized():
+        for speaker_id in speakers:
+            personalized_gen.generate_personalized(db, speaker_id, None)
+        return len(speakers)
+    report("personalized.generate_personalized", generate_personalized)
+    
+    # Writes go last: they add utterances to the database
+    templates = list(db.data["utterances"].values())
+    run = [0]
+    
+    def new_utterances(count):
+        run[0] += 1
+        for i in range(count):
+            utt = templates[i % len(templates)]
+            yield f"BENCH{run[0]:03d}{i:07d}", utt["speaker_id"], utt["text"], utt["scores"], utt["analysis_feedback"]
+    
+    insert_runs, save_runs = [], []
+    for _ in range(args.repeat):
+        with quiet():
+            start = time.perf_counter()
+            for item in new_utterances(args.inserts):
+                db.insert_utterance(*item, batch=True)
+            inserted = time.perf_counter()
+            db.batch_save()
+            saved = time.perf_counter()
+        insert_runs.append(inserted - start)
+        save_runs.append(saved - inserted)
+    show("database.insert_utterance", case_result(insert_runs, args.inserts))
+    show("database.batch_save", case_result(save_runs, args.inserts))
+    
+    def insert_autocommit():
+        for item in new_utterances(args.autocommit_inserts):
+            db.insert_utterance(*item)
+        return args.autocommit_inserts
+    report("database.insert_utterance_autocommit", insert_autocommit)
+    db.storage.close()
+    
+    cli_dir = os.path.join(workdir, f"cli-{scale:g}x")
+    copy_database(database_path, cli_dir)
+    cli = time_cli(cli_dir, utterance_arguments(templates[0]), args.repeat, importtime=False)
+    show("cli.analysis_only", case_result(cli["total"], 1))
+    return {"corpus": corpus, "cases": cases}
+
+def compare(results, baseline, threshold):
+    """
+    Print the change of every case against a baseline results file.
+    
+    Returns:
+        int: Number of cases slower than `threshold` times the baseline.
+    """
+    print(f"\nCompared with {baseline['commit']}{' (dirty)' if baseline.get('dirty') else ''} "
+          f"from {baseline['timestamp']}:")
+    regressions = 0
+    for scale, result in results["scales"].items():
+        base_cases = baseline["scales"].get(scale, {}).get("cases", {})
+        for name, case in result["cases"].items():
+            base = base_cases.get(name)
+            if base is None or not base.get("us_per_op") or not case.get("us_per_op"):
+                continue
+            ratio = case["us_per_op"] / base["us_per_op"]
+            flag = ""
+            if ratio > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            elif ratio < 1 / threshold:
+                flag = "  faster"
+            print(f"  {scale:>5} {name:<42} {base['us_per_op']:10.1f} -> {case['us_per_op']:10.1f} us/op ({ratio:5.2f}x){flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10], help="Corpus sizes relative to speechocean762 (default: 1 10)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the median is reported (default: 3)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes for the build (default: CPU count)")
+    parser.add_argument("--inserts", type=int, default=1000, help="Utterances inserted per batched run (default: 1000)")
+    parser.add_argument("--autocommit_inserts", type=int, default=100, help="Utterances inserted per autocommit run (default: 100)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown reported as a regression (default: 1.25)")
+    args = parser.parse_args()
+    
+    commit, dirty = git_commit()
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {"repeat": args.repeat, "workers": args.workers, "inserts": args.inserts,
+                     "autocommit_inserts": args.autocommit_inserts, "seed": args.seed},
+        "scales": {}
+    }
+    
+    workdir = tempfile.mkdtemp(prefix="pfg_bench_")
+    cwd = os.getcwd()
+    try:
+        # Database() looks for a legacy data/database.json relative to the working directory
+        os.chdir(workdir)
+        for scale in args.scales:
+            results["scales"][f"{scale:g}x"] = run_scale(scale, workdir, args)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}.json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+    
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{regressions} case(s) slower than {args.threshold:g}x the baseline")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Stress-test concurrent writers and check that no update is lost.
+
+Starts N processes that each open their own FeedbackGenerator on the same
+database and insert utterances and personalized feedback one at a time (every
+insert is committed on its own), then checks that every insert from every
+process is present in the database and in the personalized feedback log and
+that both are still readable.
+
+Usage (from the project directory):
+    python benchmarks/stress_concurrent_writers.py --processes 8 --inserts 50 --backend both
+"""
+import argparse
+import contextlib
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from src.feedback_log import FeedbackLog
+from src.storage import open_storage
+
+DATABASE_PATHS = {"sqlite": "data/database.db", "json": "data/database.json"}
+SPEAKERS = ["9001", "9002", "9003"]
+SCORES = {"accuracy": 7.0, "fluency": 7.0, "prosodic": 7.0, "completeness": 1.0, "word_scores": []}
+
+def seed_database(path):
+    utt = {
+        "utt_id": "STRESS_SEED", "speaker_id": SPEAKERS[0], "text": "SEED", "audio_path": "",
+        "text_phone": "", "scores": SCORES, "analysis_feedback": None
+    }
+    storage = open_storage(path)
+    storage.replace_all({"speakers": {SPEAKERS[0]: [utt["utt_id"]]}, "utterances": {utt["utt_id"]: utt}})
+    storage.close()
+
+def worker(workdir, database_path, index, inserts, start):
+    os.chdir(workdir)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        from src.feedback_gen import FeedbackGenerator
+        fg = FeedbackGenerator(database_path=database_path)
+        start.wait()
+        for j in range(inserts):
+            utt_id = f"STRESS{index:03d}{j:05d}"
+            speaker_id = SPEAKERS[(index + j) % len(SPEAKERS)]
+            fg.generate_analysis(utt_id, speaker_id=speaker_id, text="HELLO", scores=SCORES)
+            fg._save_personalized_feedback(speaker_id, f"feedback {utt_id}", utt_id)
+        fg.db.storage.close()
+
+def verify(workdir, database_path, processes, inserts):
+    expected = {f"STRESS{i:03d}{j:05d}" for i in range(processes) for j in range(inserts)}
+    storage = open_storage(os.path.join(workdir, database_path))
+    data = storage.load()
+    storage.close()
+    stored = {utt_id for utt_id in data["utterances"] if utt_id.startswith("STRESS0")}
+    listed = {utt_id for utt_ids in data["speakers"].values() for utt_id in utt_ids if utt_id.startswith("STRESS0")}
+    log = FeedbackLog(os.path.join(workdir, "data", "personalized_feedback.jsonl"))
+    feedback = {record["utt_id"] for record in log}
+    return {
+        "lost utterances": len(expected - stored),
+        "utterances missing from speaker lists": len(expected - listed),
+        "lost personalized feedback": len(expected - feedback)
+    }
+
+def run(backend, processes, inserts):
+    database_path = DATABASE_PATHS[backend]
+    workdir = tempfile.mkdtemp(prefix=f"pfg_stress_{backend}_")
+    try:
+        os.makedirs(os.path.join(workdir, "data"))
+        seed_database(os.path.join(workdir, database_path))
+        
+        context = multiprocessing.get_context("spawn")
+        start = context.Event()
+        workers = [context.Process(target=worker, args=(workdir, database_path, i, inserts, start))
+                   for i in range(processes)]
+        for process in workers:
+            process.start()
+        # Let every process finish loading before the writes begin
+        time.sleep(2)
+        began = time.perf_counter()
+        start.set()
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - began
+        
+        failed = [process.exitcode for process in workers if process.exitcode != 0]
+        results = verify(workdir, database_path, processes, inserts)
+        ok = not failed and not any(results.values())
+        print(f"{backend}: {processes} processes x {inserts} inserts in {elapsed:.1f}s -> {'OK' if ok else 'FAILED'}")
+        for name, count in results.items():
+            print(f"  {name}: {count}")
+        if failed:
+            print(f"  worker exit codes: {failed}")
+        return ok
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--inserts", type=int, default=50, help="Inserts per process")
+    parser.add_argument("--backend", choices=["sqlite", "json", "both"], default="both")
+    args = parser.parse_args()
+    
+    backends = ["sqlite", "json"] if args.backend == "both" else [args.backend]
+    results = [run(backend, args.processes, args.inserts) for backend in backends]
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Local stand-in for a text-generation inference endpoint.
+
+Speaks the request/response format `InferenceClient.text_generation` uses when the
+model is a URL, so the project can be exercised without network access:
+    
+    python benchmarks/stub_inference_server.py --port 8080 --latency 0.2 --fail_rate 0.1
+    python regenerate_personalized.py --model http://127.0.0.1:8080
+
+Streaming requests (`stream=True`) are answered with server-sent events, one
+word per event, `--token_latency` seconds apart.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubInferenceHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    token_latency = 0.0
+    fail_rate = 0.0
+    requests = 0
+    lock = threading.Lock()
+    
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with self.lock:
+            type(self).requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            self._send(503, {"error": "Model is overloaded"})
+            return
+        prompt = payload.get("inputs", "")
+        text = f"Keep practicing! (stub feedback for a {len(prompt)}-character prompt)"
+        if payload.get("stream"):
+            self._stream(text)
+        else:
+            self._send(200, [{"generated_text": text}])
+    
+    def _stream(self, text):
+        # Text-generation-inference event stream: one token per event, then the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            token = {"id": i, "text": word if i == 0 else " " + word, "logprob": 0.0, "special": False}
+            event = {"index": i + 1, "token": token, "generated_text": text if i == len(words) - 1 else None, "details": None}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.close_connection = True
+    
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        pass
+
+def serve(port=8080, latency=0.0, fail_rate=0.0, token_latency=0.0):
+    """
+    Start the stub server in a background thread.
+    
+    Returns:
+        ThreadingHTTPServer: The running server; call `shutdown()` to stop it.
+    """
+    handler = type("Handler", (StubInferenceHandler,), {"latency": latency, "fail_rate": fail_rate,
+                                                        "token_latency": token_latency})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub text-generation inference server.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering each request")
+    parser.add_argument("--fail_rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 503")
+    parser.add_argument("--token_latency", type=float, default=0.0, help="Seconds between streamed tokens")
+    args = parser.parse_args()
+    
+    server = serve(args.port, args.latency, args.fail_rate, args.token_latency)
+    print(f"Stub inference server listening on http://127.0.0.1:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
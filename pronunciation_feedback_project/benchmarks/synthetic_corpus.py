@@ -0,0 +1,161 @@
+"""
+Generate a synthetic corpus in the speechocean762 schema.
+
+Writes `resource/scores-detail.json`, `resource/text-phone`,
+`resource/lexicon.txt` and `train/utt2spk` under the output directory, laid out
+like `data/speechocean762-main`. Scale 1 matches speechocean762 itself: 5000
+utterances from 250 speakers reading a shared pool of short sentences, each
+scored by five experts. Speakers get a skill level that drives their scores and
+how often the experts mark a phone as accented, unknown or inserted, so speaker
+aggregates and phoneme issue counts look like the real ones. The same scale and
+seed always give the same files.
+
+Usage (from the project directory):
+    python benchmarks/synthetic_corpus.py --output /tmp/speechocean762-10x --scale 10
+"""
+import argparse
+import json
+import os
+import random
+
+UTTERANCES_PER_SCALE = 5000
+SPEAKERS_PER_SCALE = 250
+SENTENCES = 2500
+VOCABULARY = 3000
+EXPERTS = 5
+
+CONSONANTS = ["B", "CH", "D", "DH", "F", "G", "HH", "JH", "K", "L", "M", "N", "NG", "P", "R", "S", "SH", "T", "TH",
+              "V", "W", "Y", "Z", "ZH"]
+VOWELS = ["AA", "AE", "AH", "AO", "AW", "AY", "EH", "ER", "EY", "IH", "IY", "OW", "OY", "UH", "UW"]
+LETTERS = "BCDFGHKLMNPRSTVWZ"
+VOWEL_LETTERS = "AEIOU"
+
+def make_lexicon(rng, size):
+    # word -> list of phones; one to three syllables of (consonant) vowel (consonant)
+    lexicon = {}
+    while len(lexicon) < size:
+        syllables = rng.choice([1, 1, 2, 2, 2, 3])
+        word = "".join(rng.choice(LETTERS) + rng.choice(VOWEL_LETTERS) for _ in range(syllables + 1))
+        if word in lexicon:
+            continue
+        phones = []
+        stressed = rng.randrange(syllables)
+        for i in range(syllables):
+            if rng.random() < 0.8:
+                phones.append(rng.choice(CONSONANTS))
+            phones.append(rng.choice(VOWELS) + ("1" if i == stressed else rng.choice("02")))
+            if rng.random() < 0.4:
+                phones.append(rng.choice(CONSONANTS))
+        lexicon[word] = phones
+    return lexicon
+
+def expert_scores(rng, level, low=0, high=10):
+    # Five integer expert scores around a level
+    return [min(high, max(low, round(rng.gauss(level, 1.0)))) for _ in range(EXPERTS)]
+
+def mark_phone(rng, phone, error_rate):
+    r = rng.random()
+    if r >= error_rate:
+        return phone
+    r /= error_rate
+    if r < 0.35:
+        return "{" + phone + "}"  # heavy accent
+    if r < 0.6:
+        return f"({phone})"  # unknown
+    return f"[{rng.choice(CONSONANTS + VOWELS)}]"  # inserted
+
+def make_utterance(rng, sentence, lexicon, skill):
+    # One scores-detail.json entry for a speaker of the given skill (0-10)
+    error_rate = max(0.01, (10 - skill) / 40)
+    words = []
+    for text in sentence:
+        ref_phones = lexicon[text]
+        word_level = min(10, max(0, rng.gauss(skill, 1.5)))
+        words.append({
+            "text": text,
+            "accuracy": expert_scores(rng, word_level),
+            "stress": [10 if rng.random() < 0.9 else 5 for _ in range(EXPERTS)],
+            "total": expert_scores(rng, word_level),
+            "phones": [" ".join(mark_phone(rng, phone, error_rate) for phone in ref_phones) for _ in range(EXPERTS)],
+            "ref-phones": " ".join(ref_phones)
+        })
+    return {
+        "text": " ".join(sentence),
+        "accuracy": expert_scores(rng, skill),
+        "completeness": [1.0 if rng.random() < 0.95 else rng.choice([0.8, 0.9]) for _ in range(EXPERTS)],
+        "fluency": expert_scores(rng, skill + 0.5),
+        "prosodic": expert_scores(rng, skill),
+        "total": expert_scores(rng, skill),
+        "words": words
+    }
+
+def generate_corpus(output, scale=1.0, seed=0):
+    """
+    Write a synthetic speechocean762 corpus.
+    
+    scores-detail.json is written one utterance at a time, so large scales do not
+    have to fit in memory.
+    
+    Args:
+        output (str): Directory to write `resource/` and `train/` into.
+        scale (float): Corpus size relative to speechocean762 (5000 utterances, 250 speakers).
+        seed (int): Random seed.
+    
+    Returns:
+        dict: "utterances", "speakers" and "bytes" (total size of the files written).
+    """
+    rng = random.Random(seed)
+    lexicon = make_lexicon(rng, VOCABULARY)
+    vocabulary = sorted(lexicon)
+    sentences = [rng.sample(vocabulary, rng.randint(2, 10)) for _ in range(SENTENCES)]
+    utterances = max(1, round(UTTERANCES_PER_SCALE * scale))
+    speakers = max(1, round(SPEAKERS_PER_SCALE * scale))
+    width = max(4, len(str(speakers)))
+    skills = [min(9.5, max(2.0, rng.gauss(7, 1.5))) for _ in range(speakers)]
+    
+    resource = os.path.join(output, "resource")
+    train = os.path.join(output, "train")
+    os.makedirs(resource, exist_ok=True)
+    os.makedirs(train, exist_ok=True)
+    paths = [os.path.join(resource, name) for name in ("scores-detail.json", "text-phone", "lexicon.txt")]
+    paths.append(os.path.join(train, "utt2spk"))
+    
+    counters = [0] * speakers
+    utt2spk = []
+    with open(paths[0], "w") as detail_file, open(paths[1], "w") as text_phone_file:
+        detail_file.write("{")
+        for i in range(utterances):
+            speaker = rng.randrange(speakers)
+            speaker_id = f"{speaker + 1:0{width}d}"
+            utt_id = f"{speaker_id}{counters[speaker]:05d}"
+            counters[speaker] += 1
+            sentence = rng.choice(sentences)
+            entry = make_utterance(rng, sentence, lexicon, skills[speaker])
+            detail_file.write(f"{',' if i else ''}\n{json.dumps(utt_id)}: {json.dumps(entry)}")
+            text_phone_file.write(f"{utt_id} {' '.join(phone for word in sentence for phone in lexicon[word])}\n")
+            utt2spk.append((utt_id, speaker_id))
+        detail_file.write("\n}\n")
+    with open(paths[2], "w") as f:
+        f.writelines(f"{word} {' '.join(lexicon[word])}\n" for word in vocabulary)
+    with open(paths[3], "w") as f:
+        f.writelines(f"{utt_id} {speaker_id}\n" for utt_id, speaker_id in sorted(utt2spk))
+    
+    return {
+        "utterances": utterances,
+        "speakers": sum(1 for count in counters if count),
+        "bytes": sum(os.path.getsize(path) for path in paths)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", required=True, help="Directory to write the corpus into")
+    parser.add_argument("--scale", type=float, default=1.0, help="Size relative to speechocean762 (default: 1)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    corpus = generate_corpus(args.output, args.scale, args.seed)
+    print(f"Wrote {corpus['utterances']} utterances from {corpus['speakers']} speakers "
+          f"({corpus['bytes'] / 1e6:.1f} MB) to {args.output}")
+
+if __name__ == "__main__":
+    main()
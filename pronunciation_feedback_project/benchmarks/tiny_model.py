@@ -0,0 +1,60 @@
+"""
+Deterministic tiny language model for testing the local generation path offline.
+
+`TinyModelBackend` is a LocalBackend whose "model" is a fixed random recurrent
+network in NumPy: the prompt's words are hashed into a 2048-word vocabulary
+and summed into a state vector, and each step greedily picks the next word
+from `clip(state @ W1 // 16, 0, 64) @ W2`. Weights and activations are small
+integers held in float64, so every product and sum is exact and the output
+depends only on the prompt and `max_new_tokens`, never on the batch it ran in
+or on how BLAS splits the work. Batched and unbatched runs can be compared
+word for word. The 16 MB output matrix is read once per step for the whole
+batch, which, like a real model on the CPU, makes one batched step much
+cheaper than one step per prompt.
+"""
+import os
+import sys
+import zlib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.llm_backends import LocalBackend
+
+VOCABULARY = 2048
+EMBEDDING = 256
+HIDDEN = 1024
+STATE_LIMIT = 64
+SYLLABLES = ["ba", "ko", "mi", "ta", "ru", "se", "po", "li", "na", "vu", "de", "ga", "fi", "zo", "he", "ju"]
+
+class TinyModelBackend(LocalBackend):
+    """
+    LocalBackend running the tiny deterministic model.
+    
+    Args:
+        seed (int): Seed of the weights; the same seed always gives the same model.
+        max_batch_size (int): Maximum prompts per batched generation.
+        max_wait (float): Seconds the batcher waits for more prompts.
+    """
+    def __init__(self, seed=0, max_batch_size=8, max_wait=0.005):
+        rng = np.random.default_rng(seed)
+        self.embeddings = rng.integers(-4, 5, (VOCABULARY, EMBEDDING)).astype(np.float64)
+        self.w1 = rng.integers(-2, 3, (EMBEDDING, HIDDEN)).astype(np.float64)
+        self.w2 = rng.integers(-4, 5, (HIDDEN, VOCABULARY)).astype(np.float64)
+        self.words = [SYLLABLES[i % 16] + SYLLABLES[(i // 16) % 16] + SYLLABLES[i // 256] for i in range(VOCABULARY)]
+        super().__init__(f"tiny-model-{seed}", max_batch_size=max_batch_size, max_wait=max_wait)
+    
+    def _encode(self, prompt):
+        ids = [zlib.crc32(word.encode("utf-8")) % VOCABULARY for word in prompt.split()] or [0]
+        return np.clip(self.embeddings[ids].sum(axis=0), -STATE_LIMIT, STATE_LIMIT)
+    
+    def generate_batch(self, prompts, params):
+        steps = params.get("max_new_tokens", 32)
+        state = np.stack([self._encode(prompt) for prompt in prompts])
+        tokens = np.empty((len(prompts), steps), dtype=np.int64)
+        for step in range(steps):
+            # Integer-valued throughout: |state @ w1| <= 64 * 2 * 256 and |hidden @ w2| <= 64 * 4 * 1024
+            hidden = np.clip((state @ self.w1) // 16, 0, STATE_LIMIT)
+            tokens[:, step] = (hidden @ self.w2).argmax(axis=1)
+            state = np.clip(state * 3 // 4 + self.embeddings[tokens[:, step]], -STATE_LIMIT, STATE_LIMIT)
+        return [" ".join(self.words[token] for token in row) for row in tokens]
@@ -0,0 +1,22 @@
+import argparse
+import os
+from src.database import Database, DEFAULT_DATABASE_PATH
+from src.instrumentation import add_command_arguments, instrumented_command
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the database from the speechocean762 sources.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--database_path", default=DEFAULT_DATABASE_PATH, help=f"Database file to build (default: {DEFAULT_DATABASE_PATH})")
+    add_command_arguments(parser)
+    args = parser.parse_args()
+    
+    if os.path.exists(args.database_path):
+        parser.error(f"{args.database_path} already exists. Run update_database.py to apply source changes, "
+                     f"or remove it to rebuild the database.")
+    
+    with instrumented_command(args):
+        print(f"Building {args.database_path} with {args.workers} worker(s)...")
+        Database(database_path=args.database_path, workers=args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import argparse
+import os
+import time
+from src.feedback_log import FeedbackLog, DEFAULT_FEEDBACK_LOG_PATH, LEGACY_FEEDBACK_PATH
+
+def main():
+    parser = argparse.ArgumentParser(description="Rotate and compact the personalized feedback log.")
+    parser.add_argument("--log_path", default=DEFAULT_FEEDBACK_LOG_PATH, help=f"Feedback log to compact (default: {DEFAULT_FEEDBACK_LOG_PATH})")
+    parser.add_argument("--keep", type=int, default=1, help="Records to keep per speaker (default: 1)")
+    parser.add_argument("--archive", action="store_true", help="Keep a timestamped copy of the full log before compacting")
+    parser.add_argument("--from_json", default=LEGACY_FEEDBACK_PATH, help=f"Legacy JSON feedback file to import if the log does not exist (default: {LEGACY_FEEDBACK_PATH})")
+    args = parser.parse_args()
+    if args.keep < 1:
+        parser.error("--keep must be at least 1")
+    
+    log = FeedbackLog(args.log_path)
+    if not os.path.exists(args.log_path):
+        if not os.path.exists(args.from_json):
+            parser.error(f"Neither {args.log_path} nor {args.from_json} exists")
+        print(f"Imported {log.import_json(args.from_json)} entries from {args.from_json}")
+    
+    archive_path = None
+    if args.archive:
+        root, ext = os.path.splitext(args.log_path)
+        archive_path = f"{root}.{time.strftime('%Y%m%d-%H%M%S')}{ext}"
+    
+    before_size = os.path.getsize(args.log_path)
+    before, after = log.compact(keep=args.keep, archive_path=archive_path)
+    after_size = os.path.getsize(args.log_path)
+    if archive_path is not None:
+        print(f"Archived the full log to {archive_path}")
+    print(f"Compacted {args.log_path}: {before} -> {after} records, {before_size} -> {after_size} bytes "
+          f"({len(log.counts)} speakers, keeping {args.keep} per speaker)")
+
+if __name__ == "__main__":
+    main()
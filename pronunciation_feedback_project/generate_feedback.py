@@ -1,69 +1,135 @@
 import argparse
+import contextlib
 import json
+import sys
 from src.feedback_gen import FeedbackGenerator
+from src.instrumentation import add_command_arguments, instrumented_command
+from src.llm_backends import add_backend_arguments, backend_from_args
+from src.validation import SCORE_FIELDS, validate_score, validate_word_scores
 
-def validate_score(value, name):
-    """Validate that a score is a float between 0 and 10."""
+RECORD_FIELDS = ["speaker_id", "utt_id", "text"] + SCORE_FIELDS + ["word_scores"]
+
+def score_argument(name):
+    """argparse type for a score argument; reports the validation error as the argument's error."""
+    def parse(value):
+        try:
+            return validate_score(value, name)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    return parse
+
+def word_scores_argument(value):
+    """argparse type for the word_scores JSON string."""
     try:
-        score = float(value)
-        if not 0 <= score <= 10:
-            raise ValueError(f"{name} must be between 0 and 10, got {score}")
-        return score
+        return validate_word_scores(value)
     except ValueError as e:
-        raise argparse.ArgumentTypeError(f"Invalid {name}: {str(e)}")
+        raise argparse.ArgumentTypeError(str(e))
 
-def validate_word_scores(value):
-    """Validate the word_scores JSON string."""
+def validate_record(record):
+    """
+    Validate one JSONL input record with the same rules as the command-line arguments.
+    
+    Returns:
+        tuple: (speaker_id, utt_id, text, scores dictionary).
+    """
+    if not isinstance(record, dict):
+        raise ValueError("Each input line must be a JSON object")
+    missing = [field for field in RECORD_FIELDS if field not in record]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+    scores = {name: validate_score(record[name], name) for name in SCORE_FIELDS}
+    scores["word_scores"] = validate_word_scores(record["word_scores"])
+    return str(record["speaker_id"]), str(record["utt_id"]), record["text"], scores
+
+def process_batch(fg, lines, out, commit_every=100, personalized=True):
+    """
+    Process JSONL records through one FeedbackGenerator.
+    
+    Database writes are committed every `commit_every` records instead of once per
+    utterance. One JSON result (or error) line is written to `out` per input record.
+    
+    Returns:
+        tuple: (number of processed records, number of rejected records).
+    """
+    processed = rejected = pending = 0
     try:
-        word_scores = json.loads(value)
-        if not isinstance(word_scores, list):
-            raise ValueError("word_scores must be a list of word score objects")
-        
-        required_fields = ["word", "accuracy", "stress", "phones", "phones-accuracy", "mispronunciations"]
-        for i, word_score in enumerate(word_scores):
-            # Check for required fields
-            for field in required_fields:
-                if field not in word_score:
-                    raise ValueError(f"Word score at index {i} is missing required field: {field}")
-            
-            # Validate numerical fields
-            if not 0 <= word_score["accuracy"] <= 10:
-                raise ValueError(f"Word score at index {i} has invalid accuracy: {word_score['accuracy']} (must be between 0 and 10)")
-            if not 0 <= word_score["stress"] <= 10:
-                raise ValueError(f"Word score at index {i} has invalid stress: {word_score['stress']} (must be between 0 and 10)")
+        for line_number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                speaker_id, utt_id, text, scores = validate_record(json.loads(line))
+            except (json.JSONDecodeError, ValueError, TypeError, KeyError, AttributeError) as e:
+                out.write(json.dumps({"line": line_number, "error": str(e)}) + "\n")
+                out.flush()
+                rejected += 1
+                continue
             
-            # Validate phones and phones-accuracy
-            if len(word_score["phones"]) != len(word_score["phones-accuracy"]):
-                raise ValueError(f"Word score at index {i} has mismatched phones and phones-accuracy lengths")
-            for score in word_score["phones-accuracy"]:
-                if not 0 <= score <= 2:
-                    raise ValueError(f"Word score at index {i} has invalid phones-accuracy value: {score} (must be between 0 and 2)")
+            result = {
+                "utt_id": utt_id,
+                "speaker_id": speaker_id,
+                "analysis_feedback": fg.generate_analysis(utt_id=utt_id, speaker_id=speaker_id, text=text, scores=scores, batch=True)
+            }
+            pending += 1
+            if personalized:
+                result["personalized_feedback"] = fg.generate_personalized(speaker_id, utt_id)
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            processed += 1
             
-            # Validate mispronunciations
-            for mis in word_score["mispronunciations"]:
-                if "canonical-phone" not in mis or "produced-phone" not in mis:
-                    raise ValueError(f"Word score at index {i} has invalid mispronunciation: missing canonical-phone or produced-phone")
-        
-        return word_scores
-    except (json.JSONDecodeError, ValueError) as e:
-        raise argparse.ArgumentTypeError(f"Invalid word_scores JSON: {str(e)}")
+            if pending >= commit_every:
+                fg.db.batch_save()
+                pending = 0
+    finally:
+        # Commit the records already reported, even if a later one fails
+        if pending:
+            fg.db.batch_save()
+    return processed, rejected
 
 def main():
     # Set up command-line argument parsing
     parser = argparse.ArgumentParser(description="Generate pronunciation feedback for a new utterance.")
-    parser.add_argument("--speaker_id", required=True, help="Speaker ID (e.g., 0001)")
-    parser.add_argument("--utt_id", required=True, help="Utterance ID (e.g., 000010200)")
-    parser.add_argument("--text", required=True, help="The spoken text (e.g., 'HELLO WORLD')")
-    parser.add_argument("--accuracy", type=lambda x: validate_score(x, "accuracy"), required=True, help="Accuracy score (e.g., 7.5)")
-    parser.add_argument("--fluency", type=lambda x: validate_score(x, "fluency"), required=True, help="Fluency score (e.g., 8.0)")
-    parser.add_argument("--prosodic", type=lambda x: validate_score(x, "prosodic"), required=True, help="Prosodic score (e.g., 7.8)")
-    parser.add_argument("--completeness", type=lambda x: validate_score(x, "completeness"), required=True, help="Completeness score (e.g., 1.0)")
-    parser.add_argument("--word_scores", type=validate_word_scores, required=True, help="JSON string of word scores (e.g., '[{\"word\": \"HELLO\", \"accuracy\": 7.0, \"stress\": 8.0, \"phones\": [\"HH\", \"EH1\", \"L\", \"OW0\"], \"phones-accuracy\": [2.0, 1.0, 2.0, 2.0], \"mispronunciations\": [{\"canonical-phone\": \"EH1\", \"produced-phone\": \"<unk>\"}]}]')")
+    parser.add_argument("--input", help="Process a JSONL file of utterances instead of a single utterance ('-' reads stdin). "
+                                        "Each line holds the fields below, with word_scores as a JSON list.")
+    parser.add_argument("--commit_every", type=int, default=100, help="Batch mode: commit database writes every N utterances (default: 100)")
+    parser.add_argument("--no_personalized", action="store_true", help="Batch mode: only generate analysis feedback")
+    parser.add_argument("--analysis_only", "--analysis-only", action="store_true",
+                        help="Only generate the rule-based analysis feedback; the LLM client is never set up (fastest start-up)")
+    parser.add_argument("--stream", action="store_true", help="Print personalized feedback as it is generated instead of all at once")
+    parser.add_argument("--speaker_id", help="Speaker ID (e.g., 0001)")
+    parser.add_argument("--utt_id", help="Utterance ID (e.g., 000010200)")
+    parser.add_argument("--text", help="The spoken text (e.g., 'HELLO WORLD')")
+    parser.add_argument("--accuracy", type=score_argument("accuracy"), help="Accuracy score (e.g., 7.5)")
+    parser.add_argument("--fluency", type=score_argument("fluency"), help="Fluency score (e.g., 8.0)")
+    parser.add_argument("--prosodic", type=score_argument("prosodic"), help="Prosodic score (e.g., 7.8)")
+    parser.add_argument("--completeness", type=score_argument("completeness"), help="Completeness score (e.g., 1.0)")
+    parser.add_argument("--word_scores", type=word_scores_argument, help="JSON string of word scores (e.g., '[{\"word\": \"HELLO\", \"accuracy\": 7.0, \"stress\": 8.0, \"phones\": [\"HH\", \"EH1\", \"L\", \"OW0\"], \"phones-accuracy\": [2.0, 1.0, 2.0, 2.0], \"mispronunciations\": [{\"canonical-phone\": \"EH1\", \"produced-phone\": \"<unk>\"}]}]')")
+    add_backend_arguments(parser)
+    add_command_arguments(parser)
     
     args = parser.parse_args()
+    with instrumented_command(args):
+        run(parser, args)
+
+def run(parser, args):
+    if args.input:
+        # Keep stdout for JSONL results; progress messages go to stderr
+        out = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            print("Starting batch feedback generation...")
+            personalized = not (args.no_personalized or args.analysis_only)
+            fg = FeedbackGenerator(token="put_ur_huggingface_token", backend=backend_from_args(args) if personalized else None)
+            with (sys.stdin if args.input == "-" else open(args.input, "r")) as lines:
+                processed, rejected = process_batch(fg, lines, out, args.commit_every, personalized)
+            print(f"Processed {processed} utterances, rejected {rejected} records")
+        return
+    
+    missing = [f"--{field}" for field in RECORD_FIELDS if getattr(args, field) is None]
+    if missing:
+        parser.error(f"the following arguments are required: {', '.join(missing)}")
     
     print("Starting feedback generation...")
-    fg = FeedbackGenerator(token="put_ur_huggingface_token")
+    fg = FeedbackGenerator(token="put_ur_huggingface_token", backend=None if args.analysis_only else backend_from_args(args))
     
     # Construct the scores dictionary
     scores = {
@@ -83,11 +149,18 @@ def main():
         scores=scores
     )
     print(analysis_feedback)
+    if args.analysis_only:
+        return
     
     # Generate personalized feedback for the speaker
     print(f"\nPersonalized Feedback for Speaker {args.speaker_id}:")
-    personalized_feedback = fg.generate_personalized(args.speaker_id, args.utt_id)
-    print(personalized_feedback)
+    if args.stream:
+        for piece in fg.stream_personalized(args.speaker_id, args.utt_id):
+            print(piece, end="", flush=True)
+        print()
+    else:
+        personalized_feedback = fg.generate_personalized(args.speaker_id, args.utt_id)
+        print(personalized_feedback)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
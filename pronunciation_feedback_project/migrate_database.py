@@ -0,0 +1,49 @@
+import argparse
+import os
+from src.database import Database, DEFAULT_DATABASE_PATH, LEGACY_DATABASE_PATH, upgrade_legacy_layout
+from src.storage import JSONStorage, open_storage
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade the database to the current on-disk format.")
+    parser.add_argument("--database_path", default=DEFAULT_DATABASE_PATH, help=f"Database file to upgrade (default: {DEFAULT_DATABASE_PATH})")
+    parser.add_argument("--from_json", default=LEGACY_DATABASE_PATH, help=f"Legacy JSON database to import if the database does not exist (default: {LEGACY_DATABASE_PATH})")
+    args = parser.parse_args()
+    
+    storage = open_storage(args.database_path)
+    
+    # Legacy JSON files are rewritten in the dictionary layout
+    if isinstance(storage, JSONStorage):
+        if not storage.exists():
+            parser.error(f"{args.database_path} not found")
+        data = storage.load()
+        if upgrade_legacy_layout(data):
+            storage.replace_all(data)
+            print(f"Converted {args.database_path} to the dictionary layout")
+        else:
+            print(f"{args.database_path} is already up to date")
+        return
+    
+    if storage.exists():
+        applied = storage.migrate()
+        if applied:
+            print(f"Migrated {args.database_path} from version {applied[0]} to {storage.SCHEMA_VERSION}")
+        else:
+            print(f"{args.database_path} is already at version {storage.SCHEMA_VERSION}")
+        storage.close()
+        # Write a fresh snapshot so the next start is fast
+        Database(database_path=args.database_path)
+        return
+    
+    storage.close()
+    if not os.path.exists(args.from_json):
+        parser.error(f"Neither {args.database_path} nor {args.from_json} exists. Run build_database.py instead.")
+    data = JSONStorage(args.from_json).load()
+    upgrade_legacy_layout(data)
+    storage = open_storage(args.database_path)
+    storage.replace_all(data)
+    storage.close()
+    print(f"Imported {len(data['utterances'])} utterances from {args.from_json} into {args.database_path}")
+    Database(database_path=args.database_path)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,24 @@
-from src.data_preparer import DataPreparer
+import argparse
+import os
+from src.data_preparer import DataPreparer, DEFAULT_CHECKPOINT_PATH
+from src.database import DEFAULT_DATABASE_PATH
+from src.instrumentation import add_command_arguments, instrumented_command
 
 def main():
-    print("Starting data preparation...")
-    preparer = DataPreparer()
-    print("Data preparation completed. Database saved to data/database.json")
+    parser = argparse.ArgumentParser(description="Generate analysis feedback for all utterances in the database.")
+    parser.add_argument("--database_path", default=DEFAULT_DATABASE_PATH, help=f"Database to prepare (default: {DEFAULT_DATABASE_PATH})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--chunk_size", type=int, default=256, help="Utterances rendered and committed at a time (default: 256)")
+    parser.add_argument("--checkpoint_path", default=DEFAULT_CHECKPOINT_PATH, help=f"Progress file used to resume interrupted runs (default: {DEFAULT_CHECKPOINT_PATH})")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    add_command_arguments(parser)
+    args = parser.parse_args()
+    
+    with instrumented_command(args):
+        print("Starting data preparation...")
+        DataPreparer(database_path=args.database_path, workers=args.workers, chunk_size=args.chunk_size,
+                     checkpoint_path=args.checkpoint_path, resume=not args.restart)
+        print(f"Data preparation completed. Database saved to {args.database_path}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,35 @@
+import argparse
+import json
+import time
+from src.feedback_gen import FeedbackGenerator
+from src.instrumentation import add_command_arguments, instrumented_command
+from src.llm_backends import add_backend_arguments, backend_from_args
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate personalized feedback for many speakers concurrently.")
+    parser.add_argument("--speakers", nargs="*", help="Speaker IDs (default: all speakers in the database)")
+    parser.add_argument("--model", default="google/gemma-2-2b-it", help="Model name or inference endpoint URL")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum number of API requests in flight")
+    parser.add_argument("--rate", type=float, default=4.0, help="Maximum API requests per second (API backend only)")
+    add_backend_arguments(parser)
+    add_command_arguments(parser)
+    args = parser.parse_args()
+    
+    with instrumented_command(args):
+        fg = FeedbackGenerator(token="put_ur_huggingface_token", model_name=args.model, backend=backend_from_args(args, args.model))
+        speaker_ids = args.speakers or list(fg.db.data["speakers"])
+        print(f"Regenerating personalized feedback for {len(speaker_ids)} speakers...")
+        
+        start = time.perf_counter()
+        
+        def on_result(speaker_id, feedback):
+            # One JSON line per speaker, printed as soon as it is ready
+            print(json.dumps({"speaker_id": speaker_id, "personalized_feedback": feedback}), flush=True)
+        
+        fg.generate_personalized_many(speaker_ids, on_result=on_result, concurrency=args.concurrency, rate=args.rate)
+        elapsed = time.perf_counter() - start
+        fg.close()
+        print(f"Done: {len(speaker_ids)} speakers in {elapsed:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import argparse
+import signal
+from src.feedback_service import FeedbackService, make_server
+from src.instrumentation import add_command_arguments, instrumented_command
+from src.llm_backends import add_backend_arguments, backend_from_args
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve pronunciation feedback over HTTP with the database kept in memory.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument("--model", default="google/gemma-2-2b-it", help="Model name or inference endpoint URL")
+    parser.add_argument("--flush_interval", type=float, default=1.0, help="Maximum seconds a write stays pending (default: 1.0)")
+    parser.add_argument("--flush_every", type=int, default=500, help="Pending writes that trigger an early flush (default: 500)")
+    parser.add_argument("--no_compact", action="store_true", help="Keep utterances as dictionaries instead of compact records (uses more memory)")
+    add_backend_arguments(parser)
+    add_command_arguments(parser)
+    args = parser.parse_args()
+    
+    # Metrics are also served live at GET /metrics; --metrics_out keeps the final values after shutdown
+    with instrumented_command(args):
+        service = FeedbackService(token="put_ur_huggingface_token", model_name=args.model,
+                                  flush_interval=args.flush_interval, flush_every=args.flush_every,
+                                  compact=not args.no_compact, backend=backend_from_args(args, args.model))
+        server = make_server(service, args.host, args.port)
+        print(f"Feedback service listening on http://{args.host}:{args.port}")
+        # Flush pending writes on SIGTERM as well as Ctrl+C
+        signal.signal(signal.SIGINT, _stop)
+        signal.signal(signal.SIGTERM, _stop)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Shutting down...")
+        finally:
+            server.server_close()
+            service.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,110 @@
+import time
+from src.instrumentation import METRICS, log
 from src.rag_setup import RAGSetup
 
+SCORE_LABELS = (
+    ("accuracy", "Accuracy"),
+    ("completeness", "Completeness"),
+    ("fluency", "Fluency"),
+    ("prosodic", "Prosodic")
+)
+# Words below either threshold are listed; phones below PHONE_THRESHOLD get a focus hint
+WORD_ACCURACY_THRESHOLD = 8
+WORD_STRESS_THRESHOLD = 10
+PHONE_THRESHOLD = 1.5
+HEAVY_ACCENT_THRESHOLD = 0.5
+# Upper bound on the entries of each phrase table
+PHRASE_TABLE_SIZE = 4096
+RENDER_SECONDS = METRICS.summary("pfg_analysis_render_seconds", mode="single")
+
+def _cacheable(key):
+    # NaN never matches itself, and -0.0 equals 0.0 but formats differently, so keys holding either are not kept
+    if isinstance(key, tuple):
+        return all(_cacheable(item) for item in key)
+    return key == key and key != 0
+
+class PhraseTable(dict):
+    """
+    Phrases keyed by the values they are built from, built on first use.
+    
+    Args:
+        make (callable): Builds the phrase for a key.
+        limit (int): Phrases beyond this many are built but not kept.
+    """
+    def __init__(self, make, limit=PHRASE_TABLE_SIZE):
+        super().__init__()
+        self.make = make
+        self.limit = limit
+    
+    def __missing__(self, key):
+        phrase = self.make(key)
+        if len(self) < self.limit and _cacheable(key):
+            self[key] = phrase
+        return phrase
+
 class AnalysisGenerator:
+    """
+    Render analysis feedback text from an utterance's scores.
+    
+    Every piece of wording is built once and kept in phrase tables: the block of
+    utterance-level score lines (each score with its meaning from RAGSetup), the
+    word headers, the "You said" sentences and the per-phone hints. An utterance
+    is rendered by collecting table entries into a list and joining it once.
+    
+    Word scores may name the word "text" (speechocean762) or "word" (command-line
+    input), and mispronunciations may name the produced phone "pronounced-phone"
+    or "produced-phone"; both render the same way.
+    """
     def __init__(self):
         self.rag = RAGSetup()
+        self.score_lines = {
+            param: PhraseTable(lambda score, param=param, label=label:
+                               f"- {label} {score:.1f}: {self.rag.lookup(param, score)}.\n")
+            for param, label in SCORE_LABELS
+        }
+        # The four score lines of an utterance, keyed by its (accuracy, completeness, fluency, prosodic)
+        self.score_blocks = PhraseTable(lambda key: "".join(
+            self.score_lines[param][score] for (param, _), score in zip(SCORE_LABELS, key)))
+        self.word_headers = PhraseTable(lambda key: f"- ‘{key[0]}’ (accuracy: {key[1]:.1f}, stress: {key[2]:.1f}): ")
+        self.said = PhraseTable(lambda phones: f"You said ‘{phones[0]}’ instead of ‘{phones[1]}’. ")
+        self.heavy_accent = PhraseTable(lambda phone: f"Focus on ‘{phone}’—heavy accent pronunciation.\n")
+        self.incorrect = PhraseTable(lambda phone: f"Focus on ‘{phone}’—incorrect pronunciation.\n")
+    
+    def _render(self, parts, utt_id, text, scores):
+        # Appends the pieces of one utterance's feedback to parts
+        append = parts.append
+        word_headers, said, heavy_accent, incorrect = self.word_headers, self.said, self.heavy_accent, self.incorrect
+        append(f"Your sentence ‘{text}’ scores:\n")
+        append(self.score_blocks[(scores["accuracy"], scores["completeness"], scores["fluency"], scores["prosodic"])])
+        
+        for word in scores["word_scores"]:
+            accuracy = word["accuracy"]
+            stress = word.get("stress", 0.0)
+            if not (accuracy < WORD_ACCURACY_THRESHOLD or stress < WORD_STRESS_THRESHOLD):
+                continue
+            word_text = word["text"] if "text" in word else word["word"]
+            append(word_headers[(word_text, accuracy, stress)])
+            mispronunciations = word.get("mispronunciations")
+            if mispronunciations:
+                for mis in mispronunciations:
+                    produced = mis["pronounced-phone"] if "pronounced-phone" in mis else mis["produced-phone"]
+                    append(said[(produced, mis["canonical-phone"])])
+            else:
+                append("Some phonemes need work. ")
+            
+            phones = word.get("phones", [])
+            phones_accuracy = word.get("phones-accuracy", [])
+            # Ensure phones and phones-accuracy have the same length
+            if len(phones) != len(phones_accuracy):
+                # Counted so that quiet runs still report how many words were skipped
+                METRICS.count("pfg_analysis_mismatched_words_total")
+                log(f"Warning: Mismatch in utterance {utt_id}, word '{word_text}': "
+                    f"phones={phones}, phones-accuracy={phones_accuracy}")
+                continue  # Skip this word to avoid IndexError
+            
+            for phone, score in zip(phones, phones_accuracy):
+                if score < PHONE_THRESHOLD:
+                    append(heavy_accent[phone] if score >= HEAVY_ACCENT_THRESHOLD else incorrect[phone])
     
     def generate_analysis(self, utt_id, text, scores):
         """
@@ -16,30 +118,29 @@ class AnalysisGenerator:
         Returns:
             str: The generated analysis feedback.
         """
-        feedback = f"Your sentence ‘{text}’ scores:\n"
-        feedback += f"- Accuracy {scores['accuracy']:.1f}: {self.rag.retrieve(f'accuracy: {scores['accuracy']}')}.\n"
-        feedback += f"- Completeness {scores['completeness']:.1f}: {self.rag.retrieve(f'completeness: {scores['completeness']}')}.\n"
-        feedback += f"- Fluency {scores['fluency']:.1f}: {self.rag.retrieve(f'fluency: {scores['fluency']}')}.\n"
-        feedback += f"- Prosodic {scores['prosodic']:.1f}: {self.rag.retrieve(f'prosodic: {scores['prosodic']}')}.\n"
+        start = time.perf_counter()
+        parts = []
+        self._render(parts, utt_id, text, scores)
+        feedback = "".join(parts)
+        RENDER_SECONDS.observe(time.perf_counter() - start)
+        return feedback
+    
+    def render_many(self, utterances):
+        """
+        Generate analysis feedback for many utterances.
         
-        for word in scores["word_scores"]:
-            if word["accuracy"] < 8 or word["stress"] < 10:
-                feedback += f"- ‘{word['text']}’ (accuracy: {word['accuracy']:.1f}, stress: {word['stress']:.1f}): "
-                if "mispronunciations" in word and word["mispronunciations"]:
-                    for mis in word["mispronunciations"]:
-                        feedback += f"You said ‘{mis['pronounced-phone']}’ instead of ‘{mis['canonical-phone']}’. "
-                else:
-                    feedback += "Some phonemes need work. "
-                
-                # Ensure phones and phones-accuracy have the same length
-                if len(word["phones"]) != len(word["phones-accuracy"]):
-                    print(f"Warning: Mismatch in utterance {utt_id}, word '{word['text']}': "
-                          f"phones={word['phones']}, phones-accuracy={word['phones-accuracy']}")
-                    continue  # Skip this word to avoid IndexError
-                
-                for i, score in enumerate(word["phones-accuracy"]):
-                    if score < 1.5:
-                        phone = word["phones"][i]
-                        feedback += f"Focus on ‘{phone}’—{'heavy accent' if 0.5 <= score < 1.5 else 'incorrect'} pronunciation.\n"
+        Args:
+            utterances (iterable): (utt_id, text, scores) tuples.
         
-        return feedback
\ No newline at end of file
+        Returns:
+            list: The feedback of each utterance, in input order.
+        """
+        rendered = []
+        # One observation per batch; per-utterance timing would cost more than the table lookups it measures
+        with METRICS.timer("pfg_analysis_render_seconds", mode="batch"):
+            for utt_id, text, scores in utterances:
+                parts = []
+                self._render(parts, utt_id, text, scores)
+                rendered.append("".join(parts))
+        METRICS.count("pfg_analysis_rendered_total", len(rendered), mode="batch")
+        return rendered
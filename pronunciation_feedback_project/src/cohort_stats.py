@@ -0,0 +1,393 @@
+import itertools
+import pickle
+import sys
+from src.file_io import atomic_write
+from src.phone_index import PHONE_ERROR_THRESHOLD
+
+SCORE_KEYS = ("accuracy", "fluency", "prosodic")
+# Scores are histogrammed in steps of 0.1 from 0 to 10
+BINS = 101
+COHORT_STATS_VERSION = 2
+
+def _hundredths(value):
+    return int(round(value * 100))
+
+def _bin(hundredths, count=1):
+    # Bin of the mean of `count` values summing to `hundredths`, rounding half up in integer
+    # arithmetic, so a rebuild and a long series of updates always agree
+    return min(BINS - 1, max(0, (2 * hundredths + 10 * count) // (20 * count)))
+
+class CohortStats:
+    """
+    Materialized population baselines for comparing a speaker with everyone else.
+    
+    Holds histograms of the utterance scores and of each speaker's mean scores
+    (accuracy, fluency, prosodic) in 0.1 steps, each phone's error rate (an
+    occurrence is an error if it is scored below PHONE_ERROR_THRESHOLD or listed
+    in the word's mispronunciations) and each word's difficulty (attempts, mean
+    accuracy, share of attempts with a phone error). Everything is a count or an
+    integer sum, so the statistics are built once in a vectorized pass
+    (`from_score_store`) and then kept up to date by `add` and `remove` in
+    O(words) per utterance; percentile queries cost O(bins), independent of the
+    size of the corpus.
+    
+    Statistics stored next to a lazy database also record what each utterance
+    added (`contributions`), so an utterance whose row was overwritten can be
+    taken out with `discard` without its old scores.
+    """
+    def __init__(self):
+        self.utterance_histograms = {key: [0] * BINS for key in SCORE_KEYS}
+        self.speaker_histograms = {key: [0] * BINS for key in SCORE_KEYS}
+        # speaker_id -> [utterances, accuracy, fluency and prosodic sums in hundredths]
+        self.speakers = {}
+        # speaker_id -> histogram bin of each mean score, as counted in speaker_histograms
+        self.speaker_bins = {}
+        # phone -> [occurrences, errors]
+        self.phones = {}
+        # word -> [attempts, accuracy sum in hundredths, attempts with a phone error]
+        self.words = {}
+        self.utt_ids = set()
+        # utt_id -> what the utterance added (see _contribution), so it can be taken out again once
+        # its row is overwritten; None unless tracked (statistics stored next to a lazy database)
+        self.contributions = None
+        # Cumulative counts of the histograms, computed on the first query after a change
+        self._cumulative = {}
+    
+    @classmethod
+    def from_score_store(cls, store):
+        """
+        Build the statistics from a ScoreStore with NumPy group-bys.
+        
+        Args:
+            store (ScoreStore): Columnar view of the utterances, see `Database.get_score_store`.
+        
+        Returns:
+            CohortStats: The statistics.
+        """
+        # Imported here: loading stored statistics and querying them does not need NumPy
+        import numpy as np
+        stats = cls()
+        stats.utt_ids = set(store.utt_ids)
+        
+        utterance = store.utterance
+        speaker_ids = store.speakers.names
+        counts = np.bincount(utterance["speaker"], minlength=len(speaker_ids)).astype(np.int64)
+        sums = []
+        for key in SCORE_KEYS:
+            values = utterance[key]
+            present = ~np.isnan(values)
+            hundredths = np.rint(np.where(present, values, 0) * 100).astype(np.int64)
+            bins = np.clip((2 * hundredths[present] + 10) // 20, 0, BINS - 1)
+            stats.utterance_histograms[key] = np.bincount(bins, minlength=BINS).tolist()
+            sums.append(np.bincount(utterance["speaker"], weights=hundredths, minlength=len(speaker_ids)).astype(np.int64))
+        speaker_bins = []
+        for key, total in zip(SCORE_KEYS, sums):
+            bins = np.clip((2 * total + 10 * counts) // (20 * np.maximum(counts, 1)), 0, BINS - 1)
+            stats.speaker_histograms[key] = np.bincount(bins[counts > 0], minlength=BINS).tolist()
+            speaker_bins.append(bins.tolist())
+        for i in np.flatnonzero(counts).tolist():
+            stats.speakers[speaker_ids[i]] = [int(counts[i])] + [int(total[i]) for total in sums]
+            stats.speaker_bins[speaker_ids[i]] = [bins[i] for bins in speaker_bins]
+        
+        phone = store.phone
+        errors = (phone["accuracy"] < PHONE_ERROR_THRESHOLD) | phone["mispronounced"]
+        phone_names = store.phones.names
+        occurrences = np.bincount(phone["phone"], minlength=len(phone_names))
+        phone_errors = np.bincount(phone["phone"][errors], minlength=len(phone_names))
+        for i in np.flatnonzero(occurrences).tolist():
+            stats.phones[phone_names[i]] = [int(occurrences[i]), int(phone_errors[i])]
+        
+        word = store.word
+        word_names = store.words.names
+        word_error = np.zeros(len(word["word"]), dtype=bool)
+        word_error[phone["word_row"][errors]] = True
+        accuracy = np.rint(np.nan_to_num(word["accuracy"]) * 100)
+        attempts = np.bincount(word["word"], minlength=len(word_names))
+        accuracy_sums = np.bincount(word["word"], weights=accuracy, minlength=len(word_names)).astype(np.int64)
+        error_attempts = np.bincount(word["word"], weights=word_error, minlength=len(word_names)).astype(np.int64)
+        for i in np.flatnonzero(attempts).tolist():
+            stats.words[word_names[i]] = [int(attempts[i]), int(accuracy_sums[i]), int(error_attempts[i])]
+        return stats
+    
+    @classmethod
+    def from_utterances(cls, utterances, contributions=False):
+        """
+        Build the statistics one utterance at a time (the reference for `from_score_store`).
+        
+        Args:
+            utterances (iterable): Utterance dictionaries.
+            contributions (bool): Also track each utterance's contribution (see `discard`).
+        """
+        stats = cls()
+        if contributions:
+            stats.contributions = {}
+        for utt in utterances:
+            stats.add(utt)
+        return stats
+    
+    def _update(self, utt_id, contribution, sign):
+        self._cumulative = {}
+        speaker_id, values, words = contribution
+        for key, value in zip(SCORE_KEYS, values):
+            if value is not None:
+                self.utterance_histograms[key][_bin(value)] += sign
+        
+        # Move the speaker's means to their new bins
+        speaker = self.speakers.get(speaker_id)
+        if speaker is None:
+            speaker = self.speakers[speaker_id] = [0] * (1 + len(SCORE_KEYS))
+        else:
+            for key, old in zip(SCORE_KEYS, self.speaker_bins.pop(speaker_id)):
+                self.speaker_histograms[key][old] -= 1
+        speaker[0] += sign
+        for i, value in enumerate(values, 1):
+            if value is not None:
+                speaker[i] += sign * value
+        if speaker[0] > 0:
+            bins = self.speaker_bins[speaker_id] = [_bin(total, speaker[0]) for total in speaker[1:]]
+            for key, new in zip(SCORE_KEYS, bins):
+                self.speaker_histograms[key][new] += 1
+        else:
+            del self.speakers[speaker_id]
+        
+        for word, accuracy, phones, errors in words:
+            for i, phone in enumerate(phones):
+                _add(self.phones, phone, (sign, sign * (errors >> i & 1)))
+            _add(self.words, word, (sign, sign * accuracy, sign * (errors != 0)))
+        
+        if sign > 0:
+            self.utt_ids.add(utt_id)
+        else:
+            self.utt_ids.discard(utt_id)
+        if self.contributions is not None:
+            if sign > 0:
+                self.contributions[utt_id] = contribution
+            else:
+                self.contributions.pop(utt_id, None)
+    
+    def add(self, utt):
+        """Add one utterance's scores."""
+        self._update(utt["utt_id"], _contribution(utt), 1)
+    
+    def remove(self, utt):
+        """Remove one utterance's scores (as they were added)."""
+        self._update(utt["utt_id"], _contribution(utt), -1)
+    
+    def discard(self, utt_id):
+        """
+        Remove an utterance by ID, with the contribution recorded when it was added.
+        
+        Used when the utterance's row has been overwritten and its old scores are gone.
+        
+        Raises:
+            KeyError: If contributions are not tracked or the utterance was not added.
+        """
+        if self.contributions is None:
+            raise KeyError(utt_id)
+        self._update(utt_id, self.contributions[utt_id], -1)
+    
+    def speaker_count(self):
+        return len(self.speakers)
+    
+    def percentile_rank(self, key, value, level="speaker"):
+        """
+        Get the share of the population scoring below a value.
+        
+        Args:
+            key (str): "accuracy", "fluency" or "prosodic".
+            value (float): Score between 0 and 10.
+            level (str): Compare with speaker means ("speaker") or single utterances ("utterance").
+        
+        Returns:
+            float: Percentage (0-100) below the value, counting half of the ties, or None if the population is empty.
+        """
+        return self._rank(key, level, _bin(_hundredths(value)))
+    
+    def speaker_rank(self, speaker_id, key):
+        """
+        Get the percentile rank of a speaker's mean score among all speakers.
+        
+        Returns:
+            float: Percentage (0-100) of speakers with a lower mean, counting half of the ties,
+            or None if the speaker has no utterances.
+        """
+        bins = self.speaker_bins.get(speaker_id)
+        if bins is None:
+            return None
+        return self._rank(key, "speaker", bins[SCORE_KEYS.index(key)])
+    
+    def percentiles(self, key, level="speaker", q=(10, 25, 50, 75, 90)):
+        """
+        Get percentiles of a score, to the nearest 0.1.
+        
+        Args:
+            key (str): "accuracy", "fluency" or "prosodic".
+            level (str): Speaker means ("speaker") or single utterances ("utterance").
+            q (sequence): Percentiles to compute, between 0 and 100.
+        
+        Returns:
+            dict: Percentile to score, or an empty dict if the population is empty.
+        """
+        histogram = self._histogram(key, level)
+        total = sum(histogram)
+        if not total:
+            return {}
+        result = {}
+        for percentile in q:
+            target = percentile / 100 * total
+            seen = 0
+            for i, count in enumerate(histogram):
+                seen += count
+                if count and seen >= target:
+                    break
+            result[percentile] = i / 10
+        return result
+    
+    def phone_error_rate(self, phone):
+        """Get the share of a phone's occurrences that were errors, or None if it never occurred."""
+        counts = self.phones.get(phone)
+        return counts[1] / counts[0] if counts else None
+    
+    def phone_error_rates(self, min_occurrences=1):
+        """Get the error rate of every phone with at least `min_occurrences` occurrences, highest first."""
+        rates = [(phone, errors / occurrences) for phone, (occurrences, errors) in self.phones.items()
+                 if occurrences >= min_occurrences]
+        return sorted(rates, key=lambda item: (-item[1], item[0]))
+    
+    def word_difficulty(self, word):
+        """
+        Get how hard a word is for the population.
+        
+        Returns:
+            dict: "attempts", "mean_accuracy" and "error_rate" (share of attempts with
+            a phone error), or None if the word was never attempted.
+        """
+        counts = self.words.get(word)
+        if not counts:
+            return None
+        attempts, accuracy, errors = counts
+        return {"attempts": attempts, "mean_accuracy": accuracy / attempts / 100, "error_rate": errors / attempts}
+    
+    def hardest_words(self, k=10, min_attempts=5):
+        """Get the k words with the lowest mean accuracy among those attempted at least `min_attempts` times."""
+        words = [(word, self.word_difficulty(word)) for word, counts in self.words.items() if counts[0] >= min_attempts]
+        words.sort(key=lambda item: (item[1]["mean_accuracy"], item[0]))
+        return words[:k]
+    
+    def _rank(self, key, level, index):
+        # Share below the bin, counting half of the bin itself
+        cumulative = self._cumulative.get((key, level))
+        if cumulative is None:
+            cumulative = self._cumulative[(key, level)] = list(itertools.accumulate(self._histogram(key, level), initial=0))
+        total = cumulative[-1]
+        if not total:
+            return None
+        return (cumulative[index] + cumulative[index + 1]) / 2 / total * 100
+    
+    def _histogram(self, key, level):
+        histograms = {"speaker": self.speaker_histograms, "utterance": self.utterance_histograms}.get(level)
+        if histograms is None:
+            raise ValueError(f"Unknown level '{level}'. Expected 'speaker' or 'utterance'.")
+        return histograms[key]
+    
+    def to_dict(self):
+        return {name: getattr(self, name) for name in ("utterance_histograms", "speaker_histograms", "speakers",
+                                                       "speaker_bins", "phones", "words", "utt_ids")}
+    
+    @classmethod
+    def from_dict(cls, state):
+        stats = cls()
+        for name, value in state.items():
+            setattr(stats, name, value)
+        return stats
+    
+    def __eq__(self, other):
+        return isinstance(other, CohortStats) and self.to_dict() == other.to_dict()
+
+def _contribution(utt):
+    # (speaker_id, score hundredths, (word, accuracy hundredths, phones, phone error bits) per word):
+    # everything an utterance adds to the statistics
+    scores = utt["scores"]
+    values = tuple(_hundredths(scores[key]) if scores.get(key) is not None else None for key in SCORE_KEYS)
+    words = []
+    for w in scores.get("word_scores", []):
+        # Phone errors are located like ScoreStore does, so the vectorized build gives the same counts
+        phones = w.get("phones", [])
+        phone_scores = list(zip(phones, w.get("phones-accuracy", [])))
+        errors = [score < PHONE_ERROR_THRESHOLD for _, score in phone_scores]
+        for mis in w.get("mispronunciations") or []:
+            index = mis.get("index")
+            if index is None and mis["canonical-phone"] in phones:
+                index = phones.index(mis["canonical-phone"])
+            if index is not None and index < len(errors):
+                errors[index] = True
+        accuracy = w.get("accuracy")
+        word = w.get("text", w.get("word"))
+        # Interned, so the stored contributions pickle each phone and word once; errors as a bit mask
+        words.append((sys.intern(word) if isinstance(word, str) else word, _hundredths(accuracy if accuracy is not None else 0),
+                      tuple(sys.intern(phone) for phone, _ in phone_scores),
+                      sum(1 << i for i, error in enumerate(errors) if error)))
+    return utt["speaker_id"], values, tuple(words)
+
+def _add(table, key, deltas):
+    row = table.get(key)
+    if row is None:
+        row = table[key] = [0] * len(deltas)
+    for i, delta in enumerate(deltas):
+        row[i] += delta
+    if not row[0]:
+        del table[key]
+
+def write_cohort_stats(path, stats, key):
+    """
+    Write the statistics next to the database, tagged with the storage key they correspond to.
+    
+    Args:
+        path (str): Statistics file path.
+        stats (CohortStats): The statistics.
+        key (tuple): Storage (epoch, generation) of the utterances they were computed from.
+    """
+    with atomic_write(path, "wb") as f:
+        pickle.dump({"version": COHORT_STATS_VERSION, "key": key}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(stats.to_dict(), f, protocol=pickle.HIGHEST_PROTOCOL)
+        # Last, so loading the statistics alone does not read them
+        pickle.dump(stats.contributions, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def read_cohort_stats(path):
+    """
+    Read statistics written by `write_cohort_stats`.
+    
+    Returns:
+        tuple: (key, CohortStats), or None if there is no usable file.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = pickle.load(f)
+            if not isinstance(header, dict) or header.get("version") != COHORT_STATS_VERSION:
+                return None
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    return tuple(header["key"]), CohortStats.from_dict(state)
+
+def read_cohort_contributions(path, key):
+    """
+    Read the per-utterance contributions stored with statistics by `write_cohort_stats`.
+    
+    Args:
+        path (str): Statistics file path.
+        key (tuple): Key returned by `read_cohort_stats`; the file must still hold those statistics.
+    
+    Returns:
+        dict: utt_id to contribution, or None if the file changed or holds none.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = pickle.load(f)
+            if not isinstance(header, dict) or header.get("version") != COHORT_STATS_VERSION \
+                    or tuple(header["key"]) != tuple(key):
+                return None
+            pickle.load(f)
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
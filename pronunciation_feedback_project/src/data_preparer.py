@@ -1,35 +1,191 @@
-from src.database import Database
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from src.database import Database, DEFAULT_DATABASE_PATH
+from src.database_builder import ordered_map
 from src.analysis_gen import AnalysisGenerator
+from src.file_io import atomic_write
+from src.instrumentation import METRICS, is_quiet, log, set_quiet
+
+DEFAULT_CHECKPOINT_PATH = "data/prepare_checkpoint.json"
+
+_analysis_gen = None
+# Set in pool workers, whose metrics are sent back to the parent with each chunk
+_in_worker = False
+
+def _init_worker(quiet):
+    global _in_worker
+    _in_worker = True
+    set_quiet(quiet)
+    # Forked workers start with a copy of the parent's metrics, which the parent already has
+    METRICS.reset()
+
+def _render_chunk(chunk):
+    # Runs in a worker process; one AnalysisGenerator per process.
+    # Returns ((utt_id, feedback) pairs, (utt_id, error) pairs for malformed utterances,
+    # the worker's metrics since the last chunk or None when rendering in-process)
+    rendered, failed = _render(chunk)
+    return rendered, failed, METRICS.take() if _in_worker else None
+
+def _render(chunk):
+    global _analysis_gen
+    if _analysis_gen is None:
+        _analysis_gen = AnalysisGenerator()
+    try:
+        return list(zip((utt_id for utt_id, _, _ in chunk), _analysis_gen.render_many(chunk))), []
+    except (KeyError, TypeError, ValueError):
+        pass  # find the malformed utterances one by one
+    rendered = []
+    failed = []
+    for utt_id, text, scores in chunk:
+        try:
+            rendered.append((utt_id, _analysis_gen.generate_analysis(utt_id, text, scores)))
+        except (KeyError, TypeError, ValueError) as e:
+            failed.append((utt_id, f"{type(e).__name__}: {e}"))
+    return rendered, failed
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
 
 class DataPreparer:
-    def __init__(self):
-        self.db = Database()
-        self.analysis_gen = AnalysisGenerator()
+    """
+    Generate analysis feedback for every utterance that does not have it yet.
+    
+    Utterances are processed in utterance ID order, in chunks of `chunk_size`,
+    and rendered in a process pool. After each chunk only the new feedback fields
+    are written through the storage layer and a checkpoint records the last
+    utterance done, so an interrupted run resumes after it. The checkpoint is
+    removed once the run completes.
+    
+    Args:
+        database_path (str): Database to prepare.
+        workers (int): Number of worker processes; 1 renders in-process.
+        chunk_size (int): Number of utterances rendered and committed at a time.
+        checkpoint_path (str): Where progress is recorded.
+        resume (bool): Continue from an existing checkpoint.
+    """
+    def __init__(self, database_path=DEFAULT_DATABASE_PATH, workers=1, chunk_size=256,
+                 checkpoint_path=DEFAULT_CHECKPOINT_PATH, resume=True):
+        self.db = Database(database_path=database_path)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.checkpoint_path = checkpoint_path
+        self.resume = resume
+        self.run()
+    
+    def _epoch(self):
+        # Identifies the database contents; a rebuilt database invalidates the checkpoint
+        key = getattr(self.db.storage, "loaded_key", None)
+        return key[0] if key else None
+    
+    def _load_checkpoint(self):
+        if not self.resume:
+            return None
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                checkpoint = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if checkpoint.get("database_path") != self.db.database_path or checkpoint.get("epoch") != self._epoch():
+            print(f"Ignoring {self.checkpoint_path}: it was written for a different database")
+            return None
+        return checkpoint
+    
+    def _save_checkpoint(self, last_utt_id, done):
+        checkpoint = {
+            "database_path": self.db.database_path,
+            "epoch": self._epoch(),
+            "last_utt_id": last_utt_id,
+            "done": done
+        }
+        with atomic_write(self.checkpoint_path) as f:
+            json.dump(checkpoint, f)
+    
+    def _pending(self, after):
+        # (utt_id, text, scores) of utterances still missing feedback, in a stable order
+        pending = []
+        skipped = 0
+        utterances = self.db.data["utterances"]
+        for utt_id in sorted(utterances):
+            if after is not None and utt_id <= after:
+                continue
+            utt = utterances[utt_id]
+            if utt["analysis_feedback"] is not None:
+                continue
+            if not utt["scores"]:
+                skipped += 1
+                continue
+            pending.append((utt_id, utt["text"], utt["scores"]))
+        return pending, skipped
+    
+    def _chunks(self, pending):
+        for i in range(0, len(pending), self.chunk_size):
+            yield pending[i:i + self.chunk_size]
+    
+    def run(self):
+        """
+        Render and save the missing analysis feedback.
+        
+        Returns:
+            int: Number of utterances that received feedback in this run.
+        """
+        checkpoint = self._load_checkpoint()
+        after = checkpoint["last_utt_id"] if checkpoint else None
+        done_before = checkpoint["done"] if checkpoint else 0
+        if checkpoint:
+            print(f"Resuming after utterance {after} ({done_before} utterances done in earlier runs)")
+        
+        pending, skipped = self._pending(after)
+        total = len(pending)
+        print(f"Generating analysis feedback for {total} of {len(self.db.data['utterances'])} utterances "
+              f"with {self.workers} worker(s), {self.chunk_size} per chunk")
+        if skipped:
+            print(f"Skipping {skipped} utterances without scores")
+        if not total:
+            self._finish()
+            return 0
         
-        # Generate and save analysis feedback for all utterances
-        utterances_to_process = self.db.data["utterances"]
-        print(f"Processing all {len(utterances_to_process)} utterances for all speakers")
+        done = failures = 0
+        start = time.perf_counter()
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(is_quiet(),)) if self.workers > 1 else None
+        try:
+            chunks = self._chunks(pending)
+            if pool is not None:
+                results = ordered_map(pool, _render_chunk, chunks, max_pending=self.workers * 2)
+            else:
+                results = map(_render_chunk, chunks)
+            for chunk, (rendered, failed, metrics) in zip(self._chunks(pending), results):
+                if metrics is not None:
+                    METRICS.merge(metrics)
+                # Only the feedback column of these utterances is written
+                self.db.save_analysis_feedback_many(rendered)
+                self.db.batch_save()
+                done += len(chunk)
+                for utt_id, error in failed:
+                    print(f"Could not generate analysis feedback for utterance {utt_id}: {error}")
+                failures += len(failed)
+                METRICS.count("pfg_prepare_utterances_total", len(rendered), outcome="ok")
+                METRICS.count("pfg_prepare_utterances_total", len(failed), outcome="failed")
+                self._save_checkpoint(chunk[-1][0], done_before + done)
+                
+                elapsed = time.perf_counter() - start
+                rate = done / elapsed if elapsed > 0 else float("inf")
+                eta = (total - done) / rate if rate > 0 else 0
+                log(f"Processed {done}/{total} utterances ({rate:.0f} utterances/s, "
+                      f"elapsed {_format_duration(elapsed)}, ETA {_format_duration(eta)})")
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
         
-        # Process utterances in batches to reduce memory and I/O overhead
-        batch_size = 100  # Process 100 utterances at a time
-        for i in range(0, len(utterances_to_process), batch_size):
-            batch = utterances_to_process[i:i + batch_size]
-            print(f"Processing batch {i // batch_size + 1} of {len(utterances_to_process) // batch_size + 1} "
-                  f"({len(batch)} utterances)")
-            for utt in batch:
-                utt_id = utt["utt_id"]
-                text = utt["text"]
-                scores = self.db.get_scores(utt_id)
-                if scores:
-                    if utt["analysis_feedback"] is None:  # Only generate if not already present
-                        analysis_feedback = self.analysis_gen.generate_analysis(utt_id, text, scores)
-                        print(f"Generated analysis feedback for utterance {utt_id}")
-                        self.db.save_analysis_feedback(utt_id, analysis_feedback, batch=True)
-                    else:
-                        print(f"Analysis feedback already exists for utterance {utt_id}")
-                else:
-                    print(f"No scores found for utterance {utt_id}, skipping analysis feedback generation")
-            
-            # Save the batch to disk
-            print(f"Saving batch {i // batch_size + 1}")
-            self.db.batch_save()
\ No newline at end of file
+        if failures:
+            print(f"{failures} utterances could not be processed (see messages above)")
+        self._finish()
+        return done - failures
+    
+    def _finish(self):
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
@@ -1,187 +1,247 @@
-import json
+import bisect
 import os
-from statistics import mean
+import time
+from collections import Counter
+from src.cohort_stats import CohortStats, read_cohort_contributions, read_cohort_stats, write_cohort_stats
+from src.instrumentation import METRICS, log
+from src.phone_index import PhoneIndex
+from src.records import compact_utterance, compact_utterances
+from src.snapshot import read_snapshot, write_snapshot
+from src.source_manifest import SourceManifest
+from src.speaker_shards import LazySpeakers, LazyUtterances, SpeakerShardCache
+from src.storage import JSONStorage, open_storage
+from src.validation import check_stored_scores
+
+DEFAULT_DATABASE_PATH = "data/database.db"
+LEGACY_DATABASE_PATH = "data/database.json"
+DEFAULT_SCORES_DETAIL_PATH = "data/speechocean762-main/resource/scores-detail.json"
+DEFAULT_TEXT_PHONE_PATH = "data/speechocean762-main/resource/text-phone"
+DEFAULT_UTT2SPK_PATH = "data/speechocean762-main/train/utt2spk"
+# Rewrite the snapshot once this many utterances have changed since it was taken
+SNAPSHOT_REFRESH_ROWS = 256
+
+def upgrade_legacy_layout(data):
+    """
+    Convert the legacy list layout of speakers and utterances to dictionaries.
+    
+    Args:
+        data (dict): Database data, converted in place.
+    
+    Returns:
+        bool: True if the data was converted and needs to be rewritten.
+    """
+    converted = False
+    utterances = data["utterances"]
+    utt_list = list(utterances.values()) if isinstance(utterances, dict) else utterances
+    
+    # Convert speakers from list to dictionary if necessary
+    if isinstance(data["speakers"], list):
+        speaker_dict = {speaker_id: [] for speaker_id in data["speakers"]}
+        for utt in utt_list:
+            if utt["speaker_id"] in speaker_dict:
+                speaker_dict[utt["speaker_id"]].append(utt["utt_id"])
+        for utt_ids in speaker_dict.values():
+            utt_ids.sort()
+        data["speakers"] = speaker_dict
+        converted = True
+    
+    # Convert utterances from list to dictionary if necessary
+    if isinstance(utterances, list):
+        data["utterances"] = {utt["utt_id"]: utt for utt in utt_list}
+        converted = True
+    return converted
+
+class SpeakerAggregate:
+    """
+    Running score sums and phoneme issue counts for one speaker.
+    
+    Updated in O(words) per utterance, so personalized feedback does not have to
+    walk the speaker's whole history to get averages and top phoneme issues.
+    """
+    SCORE_KEYS = ("accuracy", "fluency", "prosodic")
+    
+    def __init__(self):
+        self.count = 0
+        self.sums = dict.fromkeys(self.SCORE_KEYS, 0.0)
+        self.phoneme_issues = {}
+    
+    def add(self, scores, sign=1):
+        """
+        Add (or with sign=-1, remove) one utterance's scores.
+        
+        Args:
+            scores (dict): Scores for the utterance, including word-level scores.
+            sign (int): 1 to add the utterance, -1 to remove it.
+        """
+        self.count += sign
+        for key in self.SCORE_KEYS:
+            self.sums[key] += sign * scores[key]
+        for w in scores.get("word_scores", []):
+            for i, score in enumerate(w["phones-accuracy"]):
+                if score < 1.5:
+                    self._count_issue(w["phones"][i], sign)
+            if "mispronunciations" in w and w["mispronunciations"]:
+                for mis in w["mispronunciations"]:
+                    self._count_issue(mis["canonical-phone"], sign)
+    
+    def remove(self, scores):
+        self.add(scores, sign=-1)
+    
+    def _count_issue(self, phone, sign):
+        count = self.phoneme_issues.get(phone, 0) + sign
+        if count:
+            self.phoneme_issues[phone] = count
+        else:
+            self.phoneme_issues.pop(phone, None)
+    
+    def mean(self, key):
+        return self.sums[key] / self.count if self.count else 0.0
 
 class Database:
-    def __init__(self, scores_detail_path="data/speechocean762-main/resource/scores-detail.json",
+    def __init__(self, scores_detail_path=DEFAULT_SCORES_DETAIL_PATH,
                  scores_path="data/speechocean762-main/resource/scores.json",
-                 text_phone_path="data/speechocean762-main/resource/text-phone",
+                 text_phone_path=DEFAULT_TEXT_PHONE_PATH,
                  lexicon_path="data/speechocean762-main/resource/lexicon.txt",
-                 utt2spk_path="data/speechocean762-main/train/utt2spk"):
-        self.database_path = "data/database.json"
+                 utt2spk_path=DEFAULT_UTT2SPK_PATH,
+                 database_path=DEFAULT_DATABASE_PATH, workers=1, use_snapshot=True,
+                 lazy=False, cache_bytes=64 * 1024 * 1024, compact=False):
+        self.database_path = database_path
+        self.storage = open_storage(database_path)
+        # Keep utterances as compact records (src/records.py) instead of nested dictionaries.
+        # Snapshots hold dictionaries, so compact databases decode the rows straight into records instead.
+        self.compact = compact
+        self.snapshot_path = f"{database_path}.snapshot" if use_snapshot and self.storage.supports_snapshots and not compact else None
+        # Source hashes of the built utterances, read by update_database.py
+        self.manifest_path = f"{database_path}.manifest"
+        self.shards = None
+        # Per-speaker aggregates, computed on first use and then kept up to date by insert_utterance
+        self.speaker_aggregates = {}
+        # Columnar score view, built on first use and dropped whenever the data changes
+        self._score_store = None
+        # Inverted phone error index, built at load time (on first use when lazy) and kept up to date by insert_utterance
+        self.phone_index = None
+        # Population baselines, computed on first use and then kept up to date by insert_utterance.
+        # Lazy databases keep them in a file next to the database, so a CLI run does not scan every speaker.
+        self.cohort_stats = None
+        self.cohort_path = f"{database_path}.cohort" if self.storage.supports_snapshots else None
+        # Uncommitted changes as (sign, utterance), replayed onto the stored baselines if they are loaded
+        # before the next commit (lazy databases only)
+        self._cohort_journal = []
         
         # Check if the database file already exists
-        if os.path.exists(self.database_path):
-            print(f"Loading precomputed database from {self.database_path}")
-            with open(self.database_path, "r") as f:
-                self.data = json.load(f)
+        if self.storage.exists():
+            if self.storage.needs_migration():
+                raise RuntimeError(f"{self.database_path} uses an older storage format. "
+                                   f"Run 'python migrate_database.py --database_path {self.database_path}' to upgrade it.")
             
-            # Convert speakers from list to dictionary if necessary
-            if isinstance(self.data["speakers"], list):
-                speaker_dict = {}
-                for speaker_id in self.data["speakers"]:
-                    # Find all utterances for this speaker
-                    utt_ids = [utt["utt_id"] for utt in self.data["utterances"] if utt["speaker_id"] == speaker_id]
-                    speaker_dict[speaker_id] = sorted(utt_ids)
-                self.data["speakers"] = speaker_dict
+            # Load speakers on demand instead of reading the whole corpus
+            if lazy and self.storage.supports_lazy:
+                self.shards = SpeakerShardCache(self.storage, max_bytes=cache_bytes)
+                self.data = {
+                    "speakers": LazySpeakers(self.shards),
+                    "utterances": LazyUtterances(self.shards)
+                }
+                log(f"Opened {self.database_path} with lazy speaker loading ({cache_bytes // (1024 * 1024)} MiB cache)")
+                return
             
-            # Convert utterances from list to dictionary if necessary
-            if isinstance(self.data["utterances"], list):
-                utt_dict = {}
-                for utt in self.data["utterances"]:
-                    utt_id = utt["utt_id"]
-                    utt_dict[utt_id] = utt
-                self.data["utterances"] = utt_dict
+            start = time.perf_counter()
+            from_snapshot = self._load_snapshot()
+            if not from_snapshot:
+                log(f"Loading precomputed database from {self.database_path}")
+                self.data = self.storage.load(record=compact_utterance if compact else None)
+                
                 # Save the updated database to ensure the new format is used going forward
-                self.batch_save()
+                if upgrade_legacy_layout(self.data):
+                    self.storage.replace_all(self.data)
+                self._write_snapshot()
             
-            print(f"Loaded {len(self.data['utterances'])} utterances for {len(self.data['speakers'])} speakers")
+            self._loaded()
+            METRICS.observe("pfg_database_load_seconds", time.perf_counter() - start,
+                            source="snapshot" if from_snapshot else "storage")
+            log(f"Loaded {len(self.data['utterances'])} utterances for {len(self.data['speakers'])} speakers")
             speaker_0001_utts = self.data["speakers"].get("0001", [])
-            print(f"Utterances for '0001': {len(speaker_0001_utts)} - {', '.join(speaker_0001_utts)}")
+            log(f"Utterances for '0001': {len(speaker_0001_utts)} - {', '.join(speaker_0001_utts)}")
+            return
+        
+        # Import a database.json written by earlier versions instead of rebuilding it
+        if self.database_path != LEGACY_DATABASE_PATH and os.path.exists(LEGACY_DATABASE_PATH):
+            print(f"Importing {LEGACY_DATABASE_PATH} into {self.database_path}")
+            with METRICS.timer("pfg_database_load_seconds", source="legacy_import"):
+                self.data = JSONStorage(LEGACY_DATABASE_PATH).load()
+                upgrade_legacy_layout(self.data)
+                self.storage.replace_all(self.data)
+                self._write_snapshot()
+                self._loaded()
+            log(f"Loaded {len(self.data['utterances'])} utterances for {len(self.data['speakers'])} speakers")
             return
         
         # If the database doesn't exist, build it
         print("Building database from scratch...")
-        
-        # Load utt2spk
-        self.utt2spk = {}
-        with open(utt2spk_path, "r") as f:
-            for line in f:
-                parts = line.strip().split()
-                if len(parts) != 2:
-                    print(f"Invalid utt2spk line: {line.strip()}")
-                    continue
-                utt_id, spk_id = parts
-                self.utt2spk[utt_id] = spk_id
-        print(f"Loaded {len(self.utt2spk)} utt2spk mappings. Sample: {list(self.utt2spk.items())[:5]}")
-        
-        # Load scores-detail.json
-        with open(scores_detail_path, "r") as f:
-            self.scores_detail = json.load(f)
-        
-        # Load scores.json
-        with open(scores_path, "r") as f:
-            self.scores = json.load(f)
-        
-        # Load text-phone
-        self.text_phone = {}
-        with open(text_phone_path, "r") as f:
-            for line in f:
-                parts = line.strip().split(maxsplit=1)
-                if len(parts) == 2:
-                    utt_id, phones = parts
-                    self.text_phone[utt_id] = phones
-        
-        # Load lexicon.txt
-        self.lexicon = {}
-        with open(lexicon_path, "r") as f:
-            for line in f:
-                parts = line.strip().split(maxsplit=1)
-                if len(parts) == 2:
-                    word, phones = parts
-                    self.lexicon[word] = phones
-        
-        # Build database
-        self.data = {
-            "speakers": {},
-            "utterances": {}
-        }
-        
-        for utt_id in self.scores_detail.keys():
-            speaker_id = self.utt2spk.get(utt_id, utt_id[:5])
-            text = self.scores_detail[utt_id]["text"]
-            
-            # Build scores for the utterance
-            score_entry = {
-                "accuracy": mean(self.scores_detail[utt_id]["accuracy"]) if isinstance(self.scores_detail[utt_id]["accuracy"], list) else self.scores_detail[utt_id]["accuracy"],
-                "completeness": mean(self.scores_detail[utt_id]["completeness"]) if isinstance(self.scores_detail[utt_id]["completeness"], list) else self.scores_detail[utt_id]["completeness"],
-                "fluency": mean(self.scores_detail[utt_id]["fluency"]) if isinstance(self.scores_detail[utt_id]["fluency"], list) else self.scores_detail[utt_id]["fluency"],
-                "prosodic": mean(self.scores_detail[utt_id]["prosodic"]) if isinstance(self.scores_detail[utt_id]["prosodic"], list) else self.scores_detail[utt_id]["prosodic"],
-                "total": mean(self.scores_detail[utt_id]["total"]) if isinstance(self.scores_detail[utt_id]["total"], list) else self.scores_detail[utt_id]["total"]
-            }
-            
-            word_scores = []
-            for word in self.scores_detail[utt_id].get("words", []):
-                word_entry = {
-                    "text": word["text"],
-                    "accuracy": mean(word["accuracy"]) if isinstance(word["accuracy"], list) else word["accuracy"],
-                    "stress": mean(word["stress"]) if isinstance(word["stress"], list) else word["stress"],
-                    "total": mean(word["total"]) if isinstance(word["total"], list) else word["total"],
-                    "phones": word["ref-phones"].split(),
-                    "phones-accuracy": self._parse_phoneme_scores(word["phones"], word["ref-phones"])
-                }
-                if any(isinstance(p, str) and any(c in p for c in "(){}[]") for p in word["phones"]):
-                    word_entry["mispronunciations"] = self._detect_mispronunciations(word["ref-phones"], word["phones"])
-                word_scores.append(word_entry)
-            score_entry["word_scores"] = word_scores
+        # Imported here: opening an existing database never needs the builder (or its process pool)
+        from src.database_builder import build_database
+        with METRICS.timer("pfg_database_load_seconds", source="build"):
+            hashes = {}
+            self.data = build_database(scores_detail_path, text_phone_path, utt2spk_path, workers=workers, hashes=hashes)
             
-            # Add utterance to the utterances dictionary
-            self.data["utterances"][utt_id] = {
-                "utt_id": utt_id,
-                "speaker_id": speaker_id,
-                "text": text,
-                "audio_path": f"WAVE/SPEAKER{speaker_id}/{utt_id}.wav",
-                "text_phone": self.text_phone.get(utt_id, ""),
-                "scores": score_entry,
-                "analysis_feedback": None  # Placeholder for analysis feedback
-            }
+            log(f"Loaded {len(self.data['utterances'])} utterances for {len(self.data['speakers'])} speakers")
+            speaker_0001_utts = self.data["speakers"].get("0001", [])
+            log(f"Utterances for '0001': {len(speaker_0001_utts)} - {', '.join(speaker_0001_utts)}")
             
-            # Update the speakers dictionary
-            if speaker_id not in self.data["speakers"]:
-                self.data["speakers"][speaker_id] = []
-            self.data["speakers"][speaker_id].append(utt_id)
-            self.data["speakers"][speaker_id].sort()
+            # Save the initial database to a file
+            with METRICS.timer("pfg_build_stage_seconds", stage="write"):
+                self.storage.replace_all(self.data)
+                SourceManifest(self.manifest_path, self.storage.epoch(),
+                               SourceManifest.file_signatures([scores_detail_path, text_phone_path, utt2spk_path]), hashes).save()
+                self._write_snapshot()
+            self._loaded()
+    
+    def _load_snapshot(self):
+        """
+        Load the binary snapshot and apply the utterances written since it was taken.
         
-        print(f"Loaded {len(self.data['utterances'])} utterances for {len(self.data['speakers'])} speakers")
-        speaker_0001_utts = self.data["speakers"].get("0001", [])
-        print(f"Utterances for '0001': {len(speaker_0001_utts)} - {', '.join(speaker_0001_utts)}")
-        
-        # Save the initial database to a file
-        self.batch_save()
-    
-    def _parse_phoneme_scores(self, phones_list, ref_phones):
-        ref_phones = ref_phones.split()
-        scores = [[] for _ in ref_phones]
-        for expert_phones in phones_list:
-            phones = expert_phones.split()
-            # Ensure we don’t exceed the length of ref_phones
-            for i in range(min(len(phones), len(ref_phones))):
-                phone = phones[i]
-                if "(" in phone and ")" in phone:
-                    scores[i].append(0)
-                elif "{" in phone and "}" in phone:
-                    scores[i].append(1)
-                else:
-                    scores[i].append(2)
-        # Ensure scores list matches the length of ref_phones
-        return [mean(s) if s else 2.0 for s in scores]  # Default to 2.0 if no scores for a phoneme
-    
-    def _detect_mispronunciations(self, ref_phones, phones_list):
-        mispronunciations = []
-        ref = ref_phones.split()
-        for i in range(len(ref)):
-            pronounced_counts = {"<unk>": 0, "correct": 0, "inserted": {}}
-            for expert_phones in phones_list:
-                phones = expert_phones.split()
-                if i >= len(phones):
-                    continue
-                pronounced = phones[i]
-                if "(" in pronounced and ")" in pronounced:
-                    pronounced_counts["<unk>"] += 1
-                elif "[" in pronounced and "]" in pronounced:
-                    inserted = pronounced.strip("[]")
-                    pronounced_counts["inserted"][inserted] = pronounced_counts["inserted"].get(inserted, 0) + 1
-                elif "{" not in pronounced and "}" not in pronounced:
-                    pronounced_counts["correct"] += 1
-            if pronounced_counts["<unk>"] > 0:
-                mispronunciations.append({"canonical-phone": ref[i], "index": i, "pronounced-phone": "<unk>"})
-            if pronounced_counts["inserted"]:
-                most_common = max(pronounced_counts["inserted"].items(), key=lambda x: x[1])[0]
-                if pronounced_counts["inserted"][most_common] > 0:
-                    mispronunciations.append({"canonical-phone": ref[i], "index": i, "pronounced-phone": most_common})
-        return mispronunciations
-    
-    def insert_utterance(self, utt_id, speaker_id, text, scores, analysis_feedback):
+        Returns:
+            bool: True if the data was loaded from the snapshot.
+        """
+        if self.snapshot_path is None:
+            return False
+        snapshot = read_snapshot(self.snapshot_path)
+        if snapshot is None:
+            return False
+        key, data = snapshot
+        changes = self.storage.load_changes(key)
+        if changes is None:
+            log(f"Snapshot {self.snapshot_path} is stale, loading {self.database_path}")
+            return False
+        
+        log(f"Loading database snapshot from {self.snapshot_path} ({len(changes)} newer utterances)")
+        for utt in changes:
+            previous = data["utterances"].get(utt["utt_id"])
+            if previous is not None and previous["speaker_id"] != utt["speaker_id"]:
+                data["speakers"][previous["speaker_id"]].remove(utt["utt_id"])
+            data["utterances"][utt["utt_id"]] = utt
+            utt_ids = data["speakers"].setdefault(utt["speaker_id"], [])
+            index = bisect.bisect_left(utt_ids, utt["utt_id"])
+            if index == len(utt_ids) or utt_ids[index] != utt["utt_id"]:
+                utt_ids.insert(index, utt["utt_id"])
+        self.data = data
+        if len(changes) >= SNAPSHOT_REFRESH_ROWS:
+            self._write_snapshot()
+        return True
+    
+    def _write_snapshot(self):
+        if self.snapshot_path is not None:
+            write_snapshot(self.snapshot_path, self.data, self.storage.loaded_key)
+    
+    def _loaded(self):
+        # Common end of the eager load paths
+        if self.compact:
+            compact_utterances(self.data["utterances"])
+        self._build_phone_index()
+    
+    def _build_phone_index(self):
+        self.phone_index = PhoneIndex.from_utterances(self.data["utterances"].values())
+    
+    def insert_utterance(self, utt_id, speaker_id, text, scores, analysis_feedback, batch=False):
         """
         Insert a new utterance into the database.
         
@@ -191,9 +251,9 @@ class Database:
             text (str): The spoken text.
             scores (dict): Scores for the utterance.
             analysis_feedback (str): Analysis feedback for the utterance.
+            batch (bool): If True, leave the write pending until the next batch_save().
         """
-        # Add the utterance to the utterances dictionary
-        self.data["utterances"][utt_id] = {
+        self.replace_utterance({
             "utt_id": utt_id,
             "speaker_id": speaker_id,
             "text": text,
@@ -201,7 +261,36 @@ class Database:
             "text_phone": "",  # Not available for new utterances
             "scores": scores,
             "analysis_feedback": analysis_feedback
-        }
+        }, batch=batch)
+    
+    def replace_utterance(self, utt, batch=False):
+        """
+        Store a complete utterance entry, replacing any utterance with the same ID.
+        
+        Args:
+            utt (dict): Utterance entry with every field of `data["utterances"]` values.
+            batch (bool): If True, leave the write pending until the next batch_save().
+        
+        Raises:
+            ValueError: If the scores are malformed; nothing is changed then.
+        """
+        utt_id = utt["utt_id"]
+        speaker_id = utt["speaker_id"]
+        # Checked up front: the derived state and the storage row are updated one after the other
+        check_stored_scores(utt["scores"])
+        self._forget(utt_id, speaker_id)
+        
+        # Add the utterance to the utterances dictionary
+        if self.compact:
+            utt = compact_utterance(utt)
+        self.data["utterances"][utt_id] = utt
+        self.storage.put_utterance(utt)
+        if self.phone_index is not None:
+            self.phone_index.add(utt)
+        if self.cohort_stats is not None:
+            self.cohort_stats.add(utt)
+        elif self.shards is not None:
+            self._cohort_journal.append((1, utt))
         
         # Update the speakers dictionary
         if speaker_id not in self.data["speakers"]:
@@ -209,9 +298,49 @@ class Database:
         if utt_id not in self.data["speakers"][speaker_id]:
             self.data["speakers"][speaker_id].append(utt_id)
             self.data["speakers"][speaker_id].sort()
+        if speaker_id in self.speaker_aggregates:
+            self.speaker_aggregates[speaker_id].add(utt["scores"])
+        
+        # Write only the new utterance row
+        if not batch:
+            self.batch_save()
+    
+    def delete_utterance(self, utt_id, batch=False):
+        """
+        Delete an utterance.
+        
+        Args:
+            utt_id (str): Utterance ID.
+            batch (bool): If True, leave the write pending until the next batch_save().
         
-        # Save the updated database
-        self.batch_save()
+        Returns:
+            bool: True if the utterance existed.
+        """
+        if not self._forget(utt_id, None):
+            return False
+        del self.data["utterances"][utt_id]
+        self.storage.delete_utterance(utt_id)
+        if not batch:
+            self.batch_save()
+        return True
+    
+    def _forget(self, utt_id, speaker_id):
+        # Drop a stored utterance from the derived state before it is replaced (or deleted, with speaker_id=None)
+        self._score_store = None
+        previous = self.data["utterances"].get(utt_id)
+        if previous is None:
+            return False
+        if previous["speaker_id"] in self.speaker_aggregates:
+            self.speaker_aggregates[previous["speaker_id"]].remove(previous["scores"])
+        if previous["speaker_id"] != speaker_id:
+            self.data["speakers"][previous["speaker_id"]].remove(utt_id)
+        if self.phone_index is not None:
+            self.phone_index.remove(previous)
+        if self.cohort_stats is not None:
+            self.cohort_stats.remove(previous)
+        elif self.shards is not None:
+            self._cohort_journal.append((-1, previous))
+        return True
     
     def get_speaker_utterances(self, speaker_id):
         utt_ids = self.data["speakers"].get(speaker_id, [])
@@ -224,6 +353,151 @@ class Database:
     def get_speaker_history(self, speaker_id):
         return self.get_speaker_utterances(speaker_id)
     
+    def get_speaker_aggregate(self, speaker_id):
+        """
+        Get the running score and phoneme issue aggregate for a speaker.
+        
+        Args:
+            speaker_id (str): Speaker ID.
+        
+        Returns:
+            SpeakerAggregate: Aggregate over all of the speaker's utterances.
+        """
+        aggregate = self.speaker_aggregates.get(speaker_id)
+        if aggregate is None:
+            aggregate = SpeakerAggregate()
+            for utt in self.get_speaker_utterances(speaker_id):
+                aggregate.add(utt["scores"])
+            self.speaker_aggregates[speaker_id] = aggregate
+        return aggregate
+    
+    def get_score_store(self):
+        """
+        Get a columnar NumPy view of all scores for vectorized cohort queries.
+        
+        Returns:
+            ScoreStore: Columnar store over all utterances in the database.
+        """
+        if self._score_store is None:
+            from src.score_store import ScoreStore
+            self._score_store = ScoreStore.from_utterances(self.data["utterances"].values())
+        return self._score_store
+    
+    def get_cohort_stats(self):
+        """
+        Get the population baselines (score percentiles, phone error rates, word difficulty).
+        
+        Returns:
+            CohortStats: Statistics over all utterances in the database.
+        """
+        if self.cohort_stats is None:
+            start = time.perf_counter()
+            source = "score_store"
+            if self.shards is not None and self.cohort_path is not None:
+                source = self._load_cohort_stats()
+            if self.cohort_stats is None:
+                self.cohort_stats = CohortStats.from_score_store(self.get_score_store())
+            self._cohort_journal = []
+            METRICS.observe("pfg_cohort_stats_seconds", time.perf_counter() - start, source=source)
+        return self.cohort_stats
+    
+    def _load_cohort_stats(self):
+        """
+        Load the stored baselines of a lazy database and apply the utterances committed since
+        and this process's uncommitted changes, or rebuild them from every speaker shard.
+        
+        A rewritten row is taken out with the contribution stored for it and added again, so
+        only a replaced table (deleted utterances) or an older file format forces a rebuild.
+        
+        Returns:
+            str: Where the statistics came from ("file" or "rebuild").
+        """
+        stored = read_cohort_stats(self.cohort_path)
+        if stored is not None:
+            key, stats = stored
+            changes = self.storage.load_changes(key)
+            replaced = changes is not None and any(utt["utt_id"] in stats.utt_ids for utt in changes)
+            refresh = changes is not None and len(changes) >= SNAPSHOT_REFRESH_ROWS
+            if replaced or refresh:
+                # Overwritten rows are taken out with what they added; a rewritten file needs every utterance's part
+                stats.contributions = read_cohort_contributions(self.cohort_path, key)
+            if changes is not None and (stats.contributions is not None or not replaced):
+                for utt in changes:
+                    if utt["utt_id"] in stats.utt_ids:
+                        stats.discard(utt["utt_id"])
+                    stats.add(utt)
+                if refresh and stats.contributions is not None:
+                    write_cohort_stats(self.cohort_path, stats, self.storage.loaded_key)
+                # The pending writes, in order, as the insert and delete hooks would have applied them
+                for sign, utt in self._cohort_journal:
+                    if sign > 0:
+                        stats.add(utt)
+                    else:
+                        stats.remove(utt)
+                self.cohort_stats = stats
+                return "file"
+            log(f"Cohort statistics {self.cohort_path} are stale, rebuilding them")
+        if self.storage.in_transaction():
+            # The contents include uncommitted rows, which must not be stored as committed statistics
+            self.cohort_stats = CohortStats.from_score_store(self.get_score_store())
+            return "rebuild"
+        # Read the key first: rows written during the scan are then replayed (and detected) by the next load
+        key = self.storage.current_key()
+        # One pass that also records each utterance's contribution, so later loads can apply rewritten rows
+        self.cohort_stats = CohortStats.from_utterances(self.data["utterances"].values(), contributions=True)
+        write_cohort_stats(self.cohort_path, self.cohort_stats, key)
+        return "rebuild"
+    
+    def get_phone_index(self):
+        """
+        Get the inverted index of phone errors for "who struggles with X" queries.
+        
+        Returns:
+            PhoneIndex: Index over all utterances in the database.
+        """
+        if self.phone_index is None:
+            # Lazy databases scan every speaker shard once, on the first query
+            self._build_phone_index()
+        return self.phone_index
+    
+    def verify(self):
+        """
+        Check the derived in-memory state against a recomputation from the utterances.
+        
+        Compares the speaker lists, the phone index, the cohort baselines and the
+        cached speaker aggregates with what the utterances give. Meant for checks
+        and debugging: it walks every utterance (every speaker shard when lazy).
+        
+        Returns:
+            list: Descriptions of the inconsistencies found, empty if there are none.
+        """
+        problems = []
+        utterances = list(self.data["utterances"].values())
+        by_speaker = {}
+        for utt in utterances:
+            by_speaker.setdefault(utt["speaker_id"], []).append(utt["utt_id"])
+        listed = {speaker_id: sorted(utt_ids) for speaker_id, utt_ids in self.data["speakers"].items() if utt_ids}
+        if listed != {speaker_id: sorted(utt_ids) for speaker_id, utt_ids in by_speaker.items()}:
+            problems.append("speaker lists differ from the utterances' speakers")
+        
+        if self.phone_index is not None:
+            rebuilt = PhoneIndex.from_utterances(utterances)
+            phones = set(self.phone_index.phones.names) | set(rebuilt.phones.names)
+            differing = sorted(phone for phone in phones
+                               if Counter(self.phone_index.errors(phone)) != Counter(rebuilt.errors(phone)))
+            if differing:
+                problems.append(f"phone index differs from a rebuild ({', '.join(differing[:10])})")
+        if self.cohort_stats is not None and self.cohort_stats != CohortStats.from_utterances(utterances):
+            problems.append("cohort baselines differ from a rebuild")
+        for speaker_id, aggregate in self.speaker_aggregates.items():
+            expected = SpeakerAggregate()
+            for utt_id in by_speaker.get(speaker_id, []):
+                expected.add(self.data["utterances"][utt_id]["scores"])
+            if aggregate.count != expected.count or aggregate.phoneme_issues != expected.phoneme_issues \
+                    or any(abs(aggregate.sums[key] - expected.sums[key]) > 1e-6 for key in SpeakerAggregate.SCORE_KEYS):
+                problems.append(f"aggregate of speaker {speaker_id} differs from a rebuild")
+        return problems
+    
     def get_speaker_analysis_history(self, speaker_id):
         utterances = self.get_speaker_utterances(speaker_id)
         return [utt["analysis_feedback"] for utt in utterances]
@@ -235,17 +509,37 @@ class Database:
     def save_analysis_feedback(self, utt_id, feedback, batch=False):
         if utt_id in self.data["utterances"]:
             self.data["utterances"][utt_id]["analysis_feedback"] = feedback
-            print(f"Saved analysis feedback for utterance {utt_id}: {feedback[:50]}...")
+            self.storage.put_feedback(utt_id, feedback)
+            log(f"Saved analysis feedback for utterance {utt_id}: {feedback[:50]}...")
         if not batch:
-            print(f"Non-batch save: Writing database for utterance {utt_id}")
+            log(f"Non-batch save: Writing database for utterance {utt_id}")
             self.batch_save()
     
+    def save_analysis_feedback_many(self, items):
+        """
+        Save analysis feedback for many utterances, leaving the write pending until batch_save().
+        
+        Args:
+            items (iterable): (utt_id, feedback) pairs.
+        
+        Returns:
+            int: Number of utterances updated.
+        """
+        count = 0
+        for utt_id, feedback in items:
+            utt = self.data["utterances"].get(utt_id)
+            if utt is None:
+                continue
+            utt["analysis_feedback"] = feedback
+            self.storage.put_feedback(utt_id, feedback)
+            count += 1
+        return count
+    
     def batch_save(self):
-        """Save all data to files in a single operation."""
-        print("Batch saving database...")
-        # Debug: Count how many utterances have non-null analysis feedback
-        non_null_feedbacks = sum(1 for utt in self.data["utterances"].values() if utt["analysis_feedback"] is not None)
-        print(f"Number of utterances with analysis feedback: {non_null_feedbacks}")
-        with open(self.database_path, "w") as f:
-            json.dump(self.data, f, indent=2)
-        print("Database saved successfully")
\ No newline at end of file
+        """Write pending changes to the storage backend in a single operation."""
+        log("Batch saving database...")
+        with METRICS.timer("pfg_batch_save_seconds"):
+            written = self.storage.commit(self.data)
+        self._cohort_journal = []
+        METRICS.count("pfg_batch_save_bytes_total", written)
+        log("Database saved successfully")
@@ -0,0 +1,379 @@
+import hashlib
+import json
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from statistics import mean
+from src.instrumentation import METRICS, log
+
+_WHITESPACE = re.compile(r"\s*")
+# Bump whenever build_utterance derives different entries from the same sources,
+# so that `update_database.py` re-derives every utterance
+BUILD_VERSION = 1
+
+def iter_json_object(path, chunk_size=1 << 20):
+    """
+    Stream the (key, value) pairs of a top-level JSON object.
+    
+    Only one value is decoded at a time, so `scores-detail.json` never has to be
+    held in memory as a whole.
+    
+    Args:
+        path (str): Path of the JSON file.
+        chunk_size (int): Number of characters read from the file at a time.
+    
+    Yields:
+        tuple: (key, value) pairs in file order.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r") as f:
+        buf = ""
+        pos = 0
+        eof = False
+        state = "start"
+        key = None
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos == len(buf):
+                if eof:
+                    raise ValueError(f"Unexpected end of file in {path}")
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            
+            char = buf[pos]
+            if state == "start":
+                if char != "{":
+                    raise ValueError(f"{path} does not contain a JSON object")
+                pos += 1
+                state = "key_or_end"
+            elif state in ("key_or_end", "comma_or_end"):
+                if char == "}":
+                    return
+                if state == "comma_or_end":
+                    if char != ",":
+                        raise ValueError(f"Expected ',' at offset {pos} in {path}")
+                    pos += 1
+                state = "key"
+            elif state == "colon":
+                if char != ":":
+                    raise ValueError(f"Expected ':' at offset {pos} in {path}")
+                pos += 1
+                state = "value"
+            else:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    end = None
+                # A value ending at the buffer edge may be truncated (e.g. a number)
+                if end is None or (end == len(buf) and not eof):
+                    chunk = f.read(chunk_size)
+                    eof = not chunk
+                    buf = buf[pos:] + chunk
+                    pos = 0
+                    continue
+                pos = end
+                if state == "key":
+                    key = value
+                    state = "colon"
+                else:
+                    yield key, value
+                    state = "comma_or_end"
+
+def load_utt2spk(utt2spk_path):
+    utt2spk = {}
+    with open(utt2spk_path, "r") as f:
+        for line in f:
+            parts = line.strip().split()
+            if len(parts) != 2:
+                print(f"Invalid utt2spk line: {line.strip()}")
+                continue
+            utt_id, spk_id = parts
+            utt2spk[utt_id] = spk_id
+    log(f"Loaded {len(utt2spk)} utt2spk mappings. Sample: {list(utt2spk.items())[:5]}")
+    return utt2spk
+
+def load_text_phone(text_phone_path):
+    text_phone = {}
+    with open(text_phone_path, "r") as f:
+        for line in f:
+            parts = line.strip().split(maxsplit=1)
+            if len(parts) == 2:
+                utt_id, phones = parts
+                text_phone[utt_id] = phones
+    return text_phone
+
+# Expert phone tokens are classified into bit flags so that tokens matching several
+# annotation patterns keep the precedence used by phone scoring and by detection
+UNKNOWN = 1  # (phone): unknown / unrecognizable
+SUBSTITUTION = 2  # {phone}: heavy accent
+INSERTION = 4  # [phone]: inserted phone
+MARKED = 8  # any annotation bracket at all
+
+_TOKENS = {}
+
+def classify_token(token):
+    """
+    Classify one expert phone token, caching the result.
+    
+    Args:
+        token (str): A token from an expert's `phones` string, e.g. `AH0`, `(AH0)`, `{AH0}` or `[S]`.
+    
+    Returns:
+        tuple: (flags, phone score, inserted phone or None).
+    """
+    entry = _TOKENS.get(token)
+    if entry is None:
+        flags = 0
+        if "(" in token and ")" in token:
+            flags |= UNKNOWN
+        if "{" in token and "}" in token:
+            flags |= SUBSTITUTION
+        if "[" in token and "]" in token:
+            flags |= INSERTION
+        if any(c in token for c in "(){}[]"):
+            flags |= MARKED
+        score = 0 if flags & UNKNOWN else 1 if flags & SUBSTITUTION else 2
+        inserted = token.strip("[]") if flags & INSERTION and not flags & UNKNOWN else None
+        entry = _TOKENS[token] = (flags, score, inserted)
+    return entry
+
+def tokenize_word(phones_list, ref_length):
+    """
+    Tokenize every expert's phones for one word in a single pass.
+    
+    Args:
+        phones_list (list): One phones string per expert.
+        ref_length (int): Number of reference phones in the word.
+    
+    Returns:
+        tuple: (columns, marked) where columns[i] holds the classified tokens of all
+        experts for reference phone i, and marked tells whether any expert annotated
+        the word at all.
+    """
+    columns = [[] for _ in range(ref_length)]
+    marked = 0
+    for expert_phones in phones_list:
+        for i, token in enumerate(expert_phones.split()):
+            entry = _TOKENS.get(token) or classify_token(token)
+            marked |= entry[0]
+            # Ensure we don’t exceed the length of ref_phones
+            if i < ref_length:
+                columns[i].append(entry)
+    return columns, bool(marked & MARKED)
+
+def _exact_mean(total, count):
+    # Same result as statistics.mean for integer inputs
+    return total // count if total % count == 0 else total / count
+
+def score_word(phones_list, ref_phones):
+    """
+    Compute phone accuracies and mispronunciations for one word.
+    
+    Args:
+        phones_list (list): One phones string per expert.
+        ref_phones (list): Reference phones of the word.
+    
+    Returns:
+        tuple: (phones-accuracy list, mispronunciations list or None when no expert
+        annotated the word).
+    """
+    columns, marked = tokenize_word(phones_list, len(ref_phones))
+    # Default to 2.0 if no scores for a phoneme
+    phones_accuracy = [_exact_mean(sum(entry[1] for entry in column), len(column)) if column else 2.0
+                       for column in columns]
+    if not marked:
+        return phones_accuracy, None
+    
+    mispronunciations = []
+    for i, column in enumerate(columns):
+        unknown = False
+        inserted = {}
+        for flags, _, phone in column:
+            if flags & UNKNOWN:
+                unknown = True
+            elif phone is not None:
+                inserted[phone] = inserted.get(phone, 0) + 1
+        if unknown:
+            mispronunciations.append({"canonical-phone": ref_phones[i], "index": i, "pronounced-phone": "<unk>"})
+        if inserted:
+            most_common = max(inserted.items(), key=lambda x: x[1])[0]
+            mispronunciations.append({"canonical-phone": ref_phones[i], "index": i, "pronounced-phone": most_common})
+    return phones_accuracy, mispronunciations
+
+def _mean_score(value):
+    if not isinstance(value, list):
+        return value
+    if all(type(v) is int for v in value):
+        return _exact_mean(sum(value), len(value))
+    return mean(value)
+
+def build_utterance(utt_id, detail, speaker_id, text_phone):
+    """
+    Build the database entry for one speechocean762 utterance.
+    
+    Args:
+        utt_id (str): Utterance ID.
+        detail (dict): The utterance's entry in scores-detail.json.
+        speaker_id (str): Speaker ID.
+        text_phone (str): Canonical phones of the utterance text.
+    
+    Returns:
+        dict: The utterance entry stored in the database.
+    """
+    # Build scores for the utterance
+    score_entry = {
+        "accuracy": _mean_score(detail["accuracy"]),
+        "completeness": _mean_score(detail["completeness"]),
+        "fluency": _mean_score(detail["fluency"]),
+        "prosodic": _mean_score(detail["prosodic"]),
+        "total": _mean_score(detail["total"])
+    }
+    
+    word_scores = []
+    for word in detail.get("words", []):
+        ref_phones = word["ref-phones"].split()
+        phones_accuracy, mispronunciations = score_word(word["phones"], ref_phones)
+        word_entry = {
+            "text": word["text"],
+            "accuracy": _mean_score(word["accuracy"]),
+            "stress": _mean_score(word["stress"]),
+            "total": _mean_score(word["total"]),
+            "phones": ref_phones,
+            "phones-accuracy": phones_accuracy
+        }
+        if mispronunciations is not None:
+            word_entry["mispronunciations"] = mispronunciations
+        word_scores.append(word_entry)
+    score_entry["word_scores"] = word_scores
+    
+    return {
+        "utt_id": utt_id,
+        "speaker_id": speaker_id,
+        "text": detail["text"],
+        "audio_path": f"WAVE/SPEAKER{speaker_id}/{utt_id}.wav",
+        "text_phone": text_phone,
+        "scores": score_entry,
+        "analysis_feedback": None  # Placeholder for analysis feedback
+    }
+
+def source_hash(utt_id, detail, speaker_id, text_phone):
+    """
+    Hash everything `build_utterance` reads for one utterance.
+    
+    Args:
+        utt_id (str): Utterance ID.
+        detail (dict): The utterance's entry in scores-detail.json.
+        speaker_id (str): Speaker ID.
+        text_phone (str): Canonical phones of the utterance text.
+    
+    Returns:
+        str: Hex digest that changes whenever the derived entry could change.
+    """
+    inputs = json.dumps([BUILD_VERSION, utt_id, speaker_id, text_phone, detail], sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(inputs.encode("utf-8"), digest_size=16).hexdigest()
+
+def iter_sources(scores_detail_path, text_phone_path, utt2spk_path):
+    """
+    Stream the inputs of every utterance in scores-detail.json order.
+    
+    Args:
+        scores_detail_path (str): Path of scores-detail.json.
+        text_phone_path (str): Path of text-phone.
+        utt2spk_path (str): Path of utt2spk.
+    
+    Yields:
+        tuple: (utt_id, detail, speaker_id, text_phone), the arguments of `build_utterance`.
+    """
+    with METRICS.timer("pfg_build_stage_seconds", stage="utt2spk"):
+        utt2spk = load_utt2spk(utt2spk_path)
+    with METRICS.timer("pfg_build_stage_seconds", stage="text_phone"):
+        text_phone = load_text_phone(text_phone_path)
+    details = METRICS.timed_iter("pfg_build_stage_seconds", iter_json_object(scores_detail_path), stage="parse")
+    for utt_id, detail in details:
+        yield utt_id, detail, utt2spk.get(utt_id, utt_id[:5]), text_phone.get(utt_id, "")
+
+def _build_chunk(chunk):
+    return [build_utterance(*item) for item in chunk]
+
+def iter_chunks(items, chunk_size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def ordered_map(pool, fn, iterable, max_pending):
+    # Keep a bounded number of chunks in flight and yield results in submission order
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def build_database(scores_detail_path, text_phone_path, utt2spk_path, workers=1, chunk_size=64, hashes=None):
+    """
+    Build the database contents from the speechocean762 sources.
+    
+    scores-detail.json is streamed utterance by utterance and the per-utterance
+    scoring is fanned out to a process pool. Results are merged in file order, so
+    the output does not depend on the number of workers.
+    
+    Args:
+        scores_detail_path (str): Path of scores-detail.json.
+        text_phone_path (str): Path of text-phone.
+        utt2spk_path (str): Path of utt2spk.
+        workers (int): Number of worker processes; 1 builds in-process.
+        chunk_size (int): Number of utterances sent to a worker at a time.
+        hashes (dict, optional): Filled with the `source_hash` of every utterance, for the source manifest.
+    
+    Returns:
+        dict: Database data with "speakers" and "utterances" dictionaries.
+    """
+    items = iter_sources(scores_detail_path, text_phone_path, utt2spk_path)
+    if hashes is not None:
+        items = _hashed(items, hashes)
+    chunks = iter_chunks(items, chunk_size)
+    
+    data = {
+        "speakers": {},
+        "utterances": {}
+    }
+    start = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            _merge(data, ordered_map(pool, _build_chunk, chunks, max_pending=workers * 4))
+    else:
+        _merge(data, map(_build_chunk, chunks))
+    # Sort each speaker's utterances once instead of after every append
+    for utt_ids in data["speakers"].values():
+        utt_ids.sort()
+    elapsed = time.perf_counter() - start
+    
+    count = len(data["utterances"])
+    METRICS.observe("pfg_build_stage_seconds", elapsed, stage="total")
+    METRICS.count("pfg_build_utterances_total", count)
+    rate = count / elapsed if elapsed > 0 else float("inf")
+    print(f"Built {count} utterances in {elapsed:.2f}s ({rate:.0f} utterances/s, {workers} worker(s))")
+    return data
+
+def _hashed(items, hashes):
+    for item in items:
+        hashes[item[0]] = source_hash(*item)
+        yield item
+
+def _merge(data, results):
+    for chunk in results:
+        for utt in chunk:
+            data["utterances"][utt["utt_id"]] = utt
+            data["speakers"].setdefault(utt["speaker_id"], []).append(utt["utt_id"])
@@ -0,0 +1,133 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from src.analysis_gen import AnalysisGenerator
+from src.database_builder import build_utterance, iter_chunks, iter_sources, ordered_map, source_hash
+from src.source_manifest import SourceManifest
+
+def _build_chunk(chunk):
+    # Returns (utterances, (utt_id, error) pairs for malformed sources)
+    built = []
+    failed = []
+    for item in chunk:
+        try:
+            built.append(build_utterance(*item))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            failed.append((item[0], f"{type(e).__name__}: {e}"))
+    return built, failed
+
+def _body(utt):
+    # Everything but the generated feedback
+    return {key: value for key, value in utt.items() if key != "analysis_feedback"}
+
+def update_database(db, scores_detail_path, text_phone_path, utt2spk_path, workers=1, chunk_size=64, dry_run=False):
+    """
+    Bring a database up to date with changed speechocean762 sources.
+    
+    Every source utterance is hashed (`source_hash`) and compared with the
+    database's source manifest; only utterances whose inputs changed are scored
+    again and written, and utterances that disappeared from the sources are
+    deleted. Utterances that were never in the sources (e.g. added through
+    `insert_utterance`) are left alone. If the source files have the same size
+    and modification time as when the manifest was written, nothing is read.
+    
+    Without a manifest (a database imported from JSON, or built before
+    manifests existed), every source utterance is derived once and compared with
+    the stored entry instead, and the manifest is written for the next update.
+    
+    Analysis feedback is kept when an utterance's text and scores are unchanged.
+    Otherwise it is regenerated if the utterance had feedback before, and left
+    for prepare_data.py if it did not.
+    
+    Args:
+        db (Database): Database to update, preferably opened with lazy=True.
+        scores_detail_path (str): Path of scores-detail.json.
+        text_phone_path (str): Path of text-phone.
+        utt2spk_path (str): Path of utt2spk.
+        workers (int): Number of worker processes scoring changed utterances; 1 scores in-process.
+        chunk_size (int): Number of utterances sent to a worker at a time.
+        dry_run (bool): Report the changes without writing anything.
+    
+    Returns:
+        dict: Number of utterances per outcome ("added", "changed", "unchanged",
+        "removed", "failed", "feedback_kept", "feedback_regenerated").
+    """
+    start = time.perf_counter()
+    summary = dict.fromkeys(("added", "changed", "unchanged", "removed", "failed",
+                             "feedback_kept", "feedback_regenerated"), 0)
+    signatures = SourceManifest.file_signatures([scores_detail_path, text_phone_path, utt2spk_path])
+    manifest = SourceManifest.load(db.manifest_path, db.storage.epoch())
+    if manifest is not None and manifest.files == signatures:
+        print(f"Sources unchanged since {db.manifest_path} was written; nothing to update")
+        return summary
+    if manifest is None:
+        print(f"No source manifest for {db.database_path}; comparing every source utterance with the database once")
+    
+    hashes = {}
+    
+    def changed_items():
+        for item in iter_sources(scores_detail_path, text_phone_path, utt2spk_path):
+            hashes[item[0]] = source_hash(*item)
+            if manifest is not None and manifest.hashes.get(item[0]) == hashes[item[0]]:
+                summary["unchanged"] += 1
+            else:
+                yield item
+    
+    analysis_gen = None
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        chunks = iter_chunks(changed_items(), chunk_size)
+        if pool is not None:
+            results = ordered_map(pool, _build_chunk, chunks, max_pending=workers * 4)
+        else:
+            results = map(_build_chunk, chunks)
+        for built, failed in results:
+            for utt_id, error in failed:
+                print(f"Could not build utterance {utt_id}: {error}")
+                # Keep the old hash (if any) so the next update retries it
+                if manifest is not None and utt_id in manifest.hashes:
+                    hashes[utt_id] = manifest.hashes[utt_id]
+                else:
+                    del hashes[utt_id]
+            summary["failed"] += len(failed)
+            for utt in built:
+                stored = db.data["utterances"].get(utt["utt_id"])
+                if stored is not None and _body(stored) == _body(utt):
+                    summary["unchanged"] += 1
+                    continue
+                summary["added" if stored is None else "changed"] += 1
+                if stored is not None and stored["analysis_feedback"] is not None:
+                    if stored["text"] == utt["text"] and stored["scores"] == utt["scores"]:
+                        utt["analysis_feedback"] = stored["analysis_feedback"]
+                        summary["feedback_kept"] += 1
+                    else:
+                        if analysis_gen is None:
+                            analysis_gen = AnalysisGenerator()
+                        utt["analysis_feedback"] = analysis_gen.generate_analysis(utt["utt_id"], utt["text"], utt["scores"])
+                        summary["feedback_regenerated"] += 1
+                if not dry_run:
+                    db.replace_utterance(utt, batch=True)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    
+    # Only utterances that came from the sources are ever deleted
+    if manifest is not None:
+        for utt_id in manifest.hashes.keys() - hashes.keys():
+            if dry_run:
+                summary["removed"] += utt_id in db.data["utterances"]
+            elif db.delete_utterance(utt_id, batch=True):
+                summary["removed"] += 1
+    
+    if not dry_run:
+        db.batch_save()
+        # After a failure, leave out the file signatures so the next update reads the sources again
+        SourceManifest(db.manifest_path, db.storage.epoch(), {} if summary["failed"] else signatures, hashes).save()
+    
+    elapsed = time.perf_counter() - start
+    print(f"{'Would update' if dry_run else 'Updated'} {db.database_path} in {elapsed:.2f}s: "
+          f"{summary['added']} added, {summary['changed']} changed, {summary['removed']} removed, "
+          f"{summary['unchanged']} unchanged, {summary['failed']} failed")
+    if summary["feedback_kept"] or summary["feedback_regenerated"]:
+        print(f"Analysis feedback: kept for {summary['feedback_kept']} changed utterances with unchanged scores, "
+              f"regenerated for {summary['feedback_regenerated']}")
+    return summary
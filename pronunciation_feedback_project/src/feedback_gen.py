@@ -1,24 +1,49 @@
-import json
 import os
-from src.database import Database
-from src.personalized_gen import PersonalizedGenerator
+import threading
+from src.analysis_gen import AnalysisGenerator
+from src.database import Database, DEFAULT_DATABASE_PATH, LEGACY_DATABASE_PATH
+from src.feedback_log import FeedbackLog, LEGACY_FEEDBACK_PATH
 
 class FeedbackGenerator:
-    def __init__(self, token=None):
+    def __init__(self, token=None, model_name="google/gemma-2-2b-it", lazy=True, database_path=DEFAULT_DATABASE_PATH, compact=False,
+                 backend=None):
         # Load the precomputed database
-        if not os.path.exists("data/database.json"):
-            raise FileNotFoundError("Database file 'data/database.json' not found. Run prepare_data.py first.")
-        
-        self.db = Database()
-        self.personalized_gen = PersonalizedGenerator(token=token)
-        self.personalized_feedback_file = "data/personalized_feedback.json"
-        try:
-            with open(self.personalized_feedback_file, "r") as f:
-                self.personalized_feedback = json.load(f)
-        except FileNotFoundError:
-            self.personalized_feedback = []
+        if not os.path.exists(database_path) and not os.path.exists(LEGACY_DATABASE_PATH):
+            raise FileNotFoundError(f"Database file '{database_path}' not found. Run prepare_data.py first.")
+        
+        # A single CLI request only touches one speaker, so load speakers on demand by default;
+        # long-running processes pass lazy=False to keep the whole database in memory
+        # (and compact=True to hold it as compact records)
+        self.db = Database(database_path=database_path, lazy=lazy, compact=compact)
+        # New utterances are rendered exactly like the precomputed ones
+        self.analysis_gen = AnalysisGenerator()
+        # backend: a generation backend from src/llm_backends.py (default: the Hugging Face Inference API).
+        # The personalized generator is created on first use, so analysis-only callers never import
+        # huggingface_hub or set up an API client
+        self.model_name = model_name
+        self.token = token
+        self.backend = backend
+        self._personalized_gen = None
+        self._personalized_lock = threading.Lock()
+        # Personalized feedback is appended to a JSONL log instead of rewriting a JSON file
+        self.feedback_log = FeedbackLog()
+        if not os.path.exists(self.feedback_log.path) and os.path.exists(LEGACY_FEEDBACK_PATH):
+            imported = self.feedback_log.import_json(LEGACY_FEEDBACK_PATH)
+            print(f"Imported {imported} entries from {LEGACY_FEEDBACK_PATH} into {self.feedback_log.path}")
+    
+    @property
+    def personalized_gen(self):
+        """The PersonalizedGenerator, with its LLM client and response cache, created on first access."""
+        if self._personalized_gen is None:
+            with self._personalized_lock:
+                if self._personalized_gen is None:
+                    from src.personalized_gen import PersonalizedGenerator
+                    from src.response_cache import ResponseCache
+                    self._personalized_gen = PersonalizedGenerator(model_name=self.model_name, token=self.token,
+                                                                   cache=ResponseCache(), backend=self.backend)
+        return self._personalized_gen
     
-    def generate_analysis(self, utt_id, speaker_id=None, text=None, scores=None):
+    def generate_analysis(self, utt_id, speaker_id=None, text=None, scores=None, batch=False):
         """
         Generate or retrieve analysis feedback for an utterance.
         If the utterance is new (i.e., utt_id is not in the database), generate feedback and store it.
@@ -28,6 +53,7 @@ class FeedbackGenerator:
             speaker_id (str, optional): Speaker ID (required for new utterances).
             text (str, optional): The spoken text (required for new utterances).
             scores (dict, optional): Scores for the utterance (required for new utterances).
+            batch (bool): If True, the database write is left pending until the next batch_save().
         
         Returns:
             str: Analysis feedback.
@@ -42,27 +68,10 @@ class FeedbackGenerator:
             return f"Cannot generate analysis feedback for new utterance {utt_id}. Missing required inputs: speaker_id, text, or scores."
         
         # Generate analysis feedback for the new utterance
-        feedback = [f"Your sentence '{text}' scores:"]
-        feedback.append(f"- Accuracy {scores['accuracy']:.1f}: {'Good' if scores['accuracy'] >= 7 else 'Needs improvement'}, {'few' if scores['accuracy'] >= 7 else 'several'} pronunciation mistakes.")
-        feedback.append(f"- Completeness {scores['completeness']:.1f}: {'All' if scores['completeness'] == 1.0 else 'Some'} words pronounced.")
-        feedback.append(f"- Fluency {scores['fluency']:.1f}: {'Fluent' if scores['fluency'] >= 7 else 'Needs work'}, {'no noticeable pauses' if scores['fluency'] >= 7 else 'some pauses'}.")
-        feedback.append(f"- Prosodic {scores['prosodic']:.1f}: {'Nearly correct' if scores['prosodic'] >= 7 else 'Needs improvement'} intonation, {'little' if scores['prosodic'] >= 7 else 'some'} stammering.")
-        
-        for word_score in scores["word_scores"]:
-            word = word_score["word"]
-            phones = word_score.get("phones", [])
-            phones_accuracy = word_score.get("phones-accuracy", [])
-            stress = word_score.get("stress", 0.0)
-            mispronunciations = word_score.get("mispronunciations", [])
-            
-            feedback.append(f"- '{word}' (accuracy: {word_score['accuracy']:.1f}, stress: {stress:.1f}):")
-            for mis in mispronunciations:
-                feedback.append(f"  You said '{mis['produced-phone']}' instead of '{mis['canonical-phone']}'. Focus on '{mis['canonical-phone']}'—heavy accent pronunciation.")
-        
-        analysis_feedback = "\n".join(feedback)
+        analysis_feedback = self.analysis_gen.generate_analysis(utt_id, text, scores)
         
         # Store the new utterance in the database
-        self.db.insert_utterance(utt_id, speaker_id, text, scores, analysis_feedback)
+        self.db.insert_utterance(utt_id, speaker_id, text, scores, analysis_feedback, batch=batch)
         
         return analysis_feedback
     
@@ -78,17 +87,84 @@ class FeedbackGenerator:
             str: Personalized feedback.
         """
         feedback = self.personalized_gen.generate_personalized(self.db, speaker_id, current_utt_id)
-        self._save_personalized_feedback(speaker_id, feedback)
+        self._save_personalized_feedback(speaker_id, feedback, current_utt_id)
         return feedback
     
-    def _save_personalized_feedback(self, speaker_id, feedback):
+    def stream_personalized(self, speaker_id, current_utt_id=None, sentences=False):
+        """
+        Generate personalized feedback for a speaker, yielding it as it is produced.
+        The complete feedback is saved once the stream ends.
+        
+        Args:
+            speaker_id (str): Speaker ID.
+            current_utt_id (str, optional): Current utterance ID.
+            sentences (bool): Yield whole sentences instead of tokens.
+        
+        Yields:
+            str: Pieces of the personalized feedback.
+        """
+        pieces = []
+        for piece in self.personalized_gen.stream_personalized(self.db, speaker_id, current_utt_id, sentences=sentences):
+            pieces.append(piece)
+            yield piece
+        self._save_personalized_feedback(speaker_id, "".join(pieces).strip(), current_utt_id)
+    
+    def get_latest_personalized(self, speaker_id):
+        """
+        Get the most recently saved personalized feedback for a speaker.
+        
+        Args:
+            speaker_id (str): Speaker ID.
+        
+        Returns:
+            dict: Log record with timestamp, speaker_id, utt_id, model and personalized_feedback,
+            or None if the speaker has no saved feedback.
+        """
+        return self.feedback_log.latest(speaker_id)
+    
+    def generate_personalized_many(self, speaker_ids, on_result=None, concurrency=8, rate=4.0):
+        """
+        Generate and save personalized feedback for many speakers concurrently.
+        
+        Args:
+            speaker_ids (iterable): Speaker IDs.
+            on_result (callable, optional): Called with (speaker_id, feedback) as each speaker finishes.
+            concurrency (int): Maximum number of API requests in flight.
+            rate (float): Maximum API requests per second.
+        
+        Returns:
+            dict: Speaker ID to personalized feedback.
+        """
+        import asyncio
+        
+        async def run():
+            results = {}
+            async for speaker_id, feedback in self.personalized_gen.generate_personalized_many(
+                    self.db, speaker_ids, concurrency=concurrency, rate=rate):
+                self._save_personalized_feedback(speaker_id, feedback)
+                results[speaker_id] = feedback
+                if on_result is not None:
+                    on_result(speaker_id, feedback)
+            return results
+        
+        return asyncio.run(run())
+    
+    def flush(self):
+        """Write pending database changes."""
+        self.db.batch_save()
+    
+    def close(self):
+        """Stop the generation backend, if personalized feedback was generated."""
+        if self._personalized_gen is not None:
+            self._personalized_gen.close()
+    
+    def _save_personalized_feedback(self, speaker_id, feedback, utt_id=None):
         """
-        Save personalized feedback to a separate file (not the database).
+        Append personalized feedback to the feedback log (not the database).
         
         Args:
             speaker_id (str): Speaker ID.
             feedback (str): Personalized feedback.
+            utt_id (str, optional): Utterance the feedback was generated for.
         """
-        self.personalized_feedback.append({"speaker_id": speaker_id, "personalized_feedback": feedback})
-        with open(self.personalized_feedback_file, "w") as f:
-            json.dump(self.personalized_feedback, f, indent=2)
\ No newline at end of file
+        self.feedback_log.append(speaker_id, feedback, utt_id=utt_id, model=self.personalized_gen.model_name)
@@ -0,0 +1,258 @@
+import json
+import os
+import shutil
+import threading
+import time
+from src.file_io import FileLock, atomic_write
+
+DEFAULT_FEEDBACK_LOG_PATH = "data/personalized_feedback.jsonl"
+LEGACY_FEEDBACK_PATH = "data/personalized_feedback.json"
+INDEX_VERSION = 1
+# Save the sidecar index once this many records had to be scanned to bring it up to date
+INDEX_REFRESH_RECORDS = 256
+
+class FeedbackLog:
+    """
+    Append-only JSONL log of personalized feedback.
+    
+    Each save appends one line (timestamp, speaker_id, utt_id, model and the
+    feedback), so the cost of a save does not depend on how much history exists.
+    Appends take an advisory lock, so several processes can share the log.
+    
+    A per-speaker index maps each speaker to the byte offset of their latest
+    record and their record count. It lives in memory and in a sidecar
+    `<log>.idx` file that records how many bytes of the log it covers; records
+    appended after that point (by any process) are picked up by scanning only the
+    tail of the log.
+    
+    A writer killed in the middle of an append leaves a partial last line. The
+    next append ends that line first, and readers skip lines that do not decode.
+    
+    Args:
+        path (str): Path of the JSONL log.
+    """
+    def __init__(self, path=DEFAULT_FEEDBACK_LOG_PATH):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.latest_offsets = {}
+        self.counts = {}
+        self._file_id = None
+        self._indexed_size = 0
+        self._lock = threading.Lock()
+        self._load_index()
+    
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None, 0
+        return [st.st_dev, st.st_ino], st.st_size
+    
+    def _reset_index(self, file_id):
+        self.latest_offsets = {}
+        self.counts = {}
+        self._file_id = file_id
+        self._indexed_size = 0
+    
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if index.get("version") != INDEX_VERSION:
+            return
+        self._file_id = index["file_id"]
+        self._indexed_size = index["size"]
+        self.latest_offsets = index["latest_offsets"]
+        self.counts = index["counts"]
+    
+    def save_index(self):
+        """Write the in-memory index to the sidecar file."""
+        index = {
+            "version": INDEX_VERSION,
+            "file_id": self._file_id,
+            "size": self._indexed_size,
+            "latest_offsets": self.latest_offsets,
+            "counts": self.counts
+        }
+        with atomic_write(self.index_path) as f:
+            json.dump(index, f, separators=(",", ":"))
+    
+    def _index_record(self, record, offset):
+        speaker_id = record["speaker_id"]
+        self.latest_offsets[speaker_id] = offset
+        self.counts[speaker_id] = self.counts.get(speaker_id, 0) + 1
+    
+    def refresh(self):
+        """Index records appended since the index was last brought up to date."""
+        with self._lock:
+            file_id, size = self._stat()
+            if file_id != self._file_id or size < self._indexed_size:
+                # The log was compacted or replaced; index it from the start
+                self._reset_index(file_id)
+            if size == self._indexed_size:
+                return
+            scanned = 0
+            with open(self.path, "rb") as f:
+                f.seek(self._indexed_size)
+                offset = self._indexed_size
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # a record still being written
+                    record = _decode(line)
+                    if record is not None:
+                        self._index_record(record, offset)
+                    offset += len(line)
+                    scanned += 1
+            self._indexed_size = offset
+            if scanned >= INDEX_REFRESH_RECORDS:
+                self.save_index()
+    
+    def append(self, speaker_id, feedback, utt_id=None, model=None):
+        """
+        Append one personalized feedback record.
+        
+        Args:
+            speaker_id (str): Speaker ID.
+            feedback (str): Personalized feedback.
+            utt_id (str, optional): Utterance the feedback was generated for.
+            model (str, optional): Model that generated the feedback.
+        
+        Returns:
+            dict: The appended record.
+        """
+        record = {
+            "timestamp": time.time(),
+            "speaker_id": speaker_id,
+            "utt_id": utt_id,
+            "model": model,
+            "personalized_feedback": feedback
+        }
+        with self._lock, FileLock(self.path):
+            self._write_records([record])
+        return record
+    
+    def _write_records(self, records):
+        # Called with both locks held
+        lines = [(json.dumps(record) + "\n").encode("utf-8") for record in records]
+        with open(self.path, "a+b") as f:
+            offset = f.seek(0, os.SEEK_END)
+            if offset:
+                f.seek(offset - 1)
+                if f.read(1) != b"\n":
+                    # An append was interrupted; end its partial line so these records start on their own
+                    f.write(b"\n")
+                    offset += 1
+            f.write(b"".join(lines))
+        file_id = self._stat()[0]
+        if offset == 0 and self._indexed_size == 0:
+            self._file_id = file_id  # this append created the log
+        # Only extend the index if no other process appended since it was last refreshed
+        if offset != self._indexed_size or self._file_id != file_id:
+            return
+        for record, line in zip(records, lines):
+            self._index_record(record, offset)
+            offset += len(line)
+        self._indexed_size = offset
+    
+    def _read_at(self, offset):
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+    
+    def latest(self, speaker_id):
+        """
+        Get a speaker's most recent feedback record.
+        
+        Args:
+            speaker_id (str): Speaker ID.
+        
+        Returns:
+            dict: The record, or None if the speaker has no feedback.
+        """
+        self.refresh()
+        offset = self.latest_offsets.get(speaker_id)
+        return self._read_at(offset) if offset is not None else None
+    
+    def __iter__(self):
+        """Iterate over all records in append order."""
+        try:
+            with open(self.path, "rb") as f:
+                for line in f:
+                    record = _decode(line) if line.endswith(b"\n") else None
+                    if record is not None:
+                        yield record
+        except FileNotFoundError:
+            return
+    
+    def history(self, speaker_id):
+        """Get all feedback records of a speaker, oldest first (scans the log)."""
+        return [record for record in self if record["speaker_id"] == speaker_id]
+    
+    def import_json(self, path=LEGACY_FEEDBACK_PATH):
+        """
+        Import a `personalized_feedback.json` list written by earlier versions.
+        
+        Nothing is imported if the log already has records, so processes starting
+        at the same time import the file only once.
+        
+        Returns:
+            int: Number of imported entries.
+        """
+        with open(path, "r") as f:
+            entries = json.load(f)
+        records = [{
+            "timestamp": None,
+            "speaker_id": entry["speaker_id"],
+            "utt_id": entry.get("utt_id"),
+            "model": entry.get("model"),
+            "personalized_feedback": entry["personalized_feedback"]
+        } for entry in entries]
+        with self._lock, FileLock(self.path):
+            if self._stat()[1] > 0:
+                return 0
+            self._write_records(records)
+        return len(records)
+    
+    def compact(self, keep=1, archive_path=None):
+        """
+        Rewrite the log keeping only each speaker's most recent records.
+        
+        Args:
+            keep (int): Number of records to keep per speaker.
+            archive_path (str, optional): Copy the full log here before compacting (rotation).
+        
+        Returns:
+            tuple: (records before, records after).
+        """
+        with self._lock, FileLock(self.path):
+            if not os.path.exists(self.path):
+                return 0, 0
+            if archive_path is not None:
+                shutil.copyfile(self.path, archive_path)
+            records = list(self)
+            seen = {}
+            kept = []
+            # Walk backwards so the newest records of each speaker are the ones kept
+            for record in reversed(records):
+                count = seen.get(record["speaker_id"], 0)
+                if count < keep:
+                    seen[record["speaker_id"]] = count + 1
+                    kept.append(record)
+            kept.reverse()
+            with atomic_write(self.path, "wb") as f:
+                for record in kept:
+                    f.write((json.dumps(record) + "\n").encode("utf-8"))
+            self._reset_index(None)
+        self.refresh()
+        self.save_index()
+        return len(records), len(kept)
+
+def _decode(line):
+    # A complete record, or None for what is left of an interrupted append
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) and "speaker_id" in record else None
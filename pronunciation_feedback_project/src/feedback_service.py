@@ -0,0 +1,356 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.feedback_gen import FeedbackGenerator
+from src.instrumentation import METRICS
+from src.validation import validate_scores
+
+class ReadWriteLock:
+    """
+    Many concurrent readers or one writer.
+    
+    Waiting writers block new readers, so a steady stream of reads cannot starve
+    inserts and flushes.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+    
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+    
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+    
+    def acquire_write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+    
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+    
+    def read(self):
+        return _Held(self.acquire_read, self.release_read)
+    
+    def write(self):
+        return _Held(self.acquire_write, self.release_write)
+
+class _Held:
+    def __init__(self, acquire, release):
+        self._acquire = acquire
+        self._release = release
+    
+    def __enter__(self):
+        self._acquire()
+        return self
+    
+    def __exit__(self, *exc):
+        self._release()
+
+class FeedbackService:
+    """
+    Resident wrapper around FeedbackGenerator for serving many requests.
+    
+    The database is loaded once and kept in memory. Lookups run concurrently under
+    a shared lock; inserting an utterance takes the exclusive lock only for the
+    in-memory update and leaves the storage write pending. A background thread
+    commits pending writes every `flush_interval` seconds, or sooner once
+    `flush_every` writes have queued up (write-behind). The LLM call for
+    personalized feedback runs outside the lock, and its result is appended to
+    the feedback log directly.
+    
+    Args:
+        token (str, optional): Hugging Face API token.
+        model_name (str): Model name or inference endpoint URL.
+        flush_interval (float): Maximum seconds a write stays pending.
+        flush_every (int): Number of pending writes that triggers an early flush.
+        compact (bool): Hold the utterances as compact records instead of dictionaries.
+        backend (optional): Generation backend from src/llm_backends.py (default: the Inference API).
+            Concurrent personalized requests share the batches of a local backend.
+    """
+    def __init__(self, token=None, model_name="google/gemma-2-2b-it", flush_interval=1.0, flush_every=500, compact=True,
+                 backend=None):
+        self.fg = FeedbackGenerator(token=token, model_name=model_name, lazy=False, compact=compact, backend=backend)
+        self.lock = ReadWriteLock()
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.pending = 0
+        self.flushes = 0
+        self._wake = threading.Event()
+        self._stopping = False
+        self._flusher = threading.Thread(target=self._flush_loop, name="write-behind", daemon=True)
+        self._flusher.start()
+    
+    def analysis(self, utt_id, speaker_id=None, text=None, scores=None):
+        """
+        Get analysis feedback for an utterance, storing it first if it is new.
+        
+        Returns:
+            str: Analysis feedback.
+        
+        Raises:
+            ValueError: If the scores of a new utterance are malformed or out of range.
+        """
+        with self.lock.read():
+            feedback = self.fg.db.get_analysis_feedback(utt_id)
+        if feedback is not None:
+            return feedback
+        if scores is not None:
+            scores = validate_scores(scores)
+        
+        with self.lock.write():
+            # generate_analysis writes when the utterance is new or has no feedback yet
+            stored = self.fg.db.get_analysis_feedback(utt_id)
+            feedback = self.fg.generate_analysis(utt_id, speaker_id=speaker_id, text=text, scores=scores, batch=True)
+            if stored is None and self.fg.db.get_analysis_feedback(utt_id) is not None:
+                self._queued()
+        return feedback
+    
+    def personalized(self, speaker_id, current_utt_id=None):
+        """
+        Generate personalized feedback for a speaker.
+        
+        Returns:
+            str: Personalized feedback, or an error message.
+        """
+        generator = self.fg.personalized_gen
+        self._fill_caches(speaker_id)
+        with self.lock.read():
+            prompt, error = generator.build_prompt(self.fg.db, speaker_id, current_utt_id)
+        if error is not None:
+            return error
+        
+        feedback = generator.generate_from_prompt(prompt)
+        # Appending to the feedback log is cheap and has its own locking
+        self.fg._save_personalized_feedback(speaker_id, feedback, current_utt_id)
+        return feedback
+    
+    def personalized_stream(self, speaker_id, current_utt_id=None, sentences=False):
+        """
+        Generate personalized feedback for a speaker, yielding it as it is produced.
+        
+        Only the prompt is built under the lock. The complete feedback is
+        appended to the feedback log when the stream ends; a stream the client
+        abandons is not saved.
+        
+        Yields:
+            str: Pieces of the personalized feedback, or one error message.
+        """
+        generator = self.fg.personalized_gen
+        self._fill_caches(speaker_id)
+        with self.lock.read():
+            prompt, error = generator.build_prompt(self.fg.db, speaker_id, current_utt_id)
+        if error is not None:
+            yield error
+            return
+        
+        pieces = []
+        for piece in generator.stream_from_prompt(prompt, sentences=sentences):
+            pieces.append(piece)
+            yield piece
+        self.fg._save_personalized_feedback(speaker_id, "".join(pieces).strip(), current_utt_id)
+    
+    def _fill_caches(self, speaker_id):
+        # build_prompt runs under the shared lock and only reads the speaker aggregate and the
+        # cohort baselines; creating them mutates the database, so that takes the exclusive lock
+        db = self.fg.db
+        if speaker_id not in db.speaker_aggregates or db.cohort_stats is None:
+            with self.lock.write():
+                db.get_speaker_aggregate(speaker_id)
+                db.get_cohort_stats()
+    
+    def status(self):
+        with self.lock.read():
+            return {
+                "utterances": len(self.fg.db.data["utterances"]),
+                "speakers": len(self.fg.db.data["speakers"]),
+                "pending_writes": self.pending,
+                "flushes": self.flushes
+            }
+    
+    def _queued(self):
+        # Called with the write lock held
+        self.pending += 1
+        if self.pending >= self.flush_every:
+            self._wake.set()
+    
+    def flush(self):
+        """Commit all pending writes now."""
+        with self.lock.write():
+            if not self.pending:
+                return
+            with METRICS.timer("pfg_service_flush_seconds"):
+                self.fg.flush()
+            METRICS.count("pfg_service_flushed_writes_total", self.pending)
+            self.pending = 0
+            self.flushes += 1
+    
+    def _flush_loop(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Write-behind flush failed: {str(e)}. Retrying in {self.flush_interval} seconds...")
+    
+    def close(self):
+        """Stop the background flusher and commit everything still pending."""
+        self._stopping = True
+        self._wake.set()
+        self._flusher.join()
+        self.flush()
+        self.fg.close()
+
+# Request timings are labelled with these paths; any other path is labelled "unknown"
+ENDPOINTS = frozenset(["/analysis", "/personalized", "/personalized/stream", "/flush", "/health", "/metrics"])
+
+class FeedbackRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON-over-HTTP front end for a FeedbackService.
+    
+    Endpoints:
+        POST /analysis      {"utt_id", and for new utterances "speaker_id", "text", "scores"}
+        POST /personalized  {"speaker_id", optional "utt_id"}
+        POST /personalized/stream  {"speaker_id", optional "utt_id" and "sentences"}; newline-delimited
+                            JSON sent as it is generated: {"delta": text} lines, then
+                            {"done": true, "speaker_id", "personalized_feedback"}
+        POST /flush         commit pending writes immediately
+        GET  /health        database size and write-behind state
+        GET  /metrics       timings and counts in the Prometheus text format (JSON with ?format=json)
+    
+    Every request is timed into `pfg_http_request_seconds` by endpoint and status; paths
+    outside ENDPOINTS share the endpoint label "unknown".
+    """
+    service = None
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, keep-alive clients wait on delayed ACKs
+    disable_nagle_algorithm = True
+    
+    def do_GET(self):
+        self._start = time.perf_counter()
+        path, _, query = self.path.partition("?")
+        if path == "/health":
+            self._send(200, self.service.status())
+        elif path == "/metrics":
+            status = self.service.status()
+            METRICS.set("pfg_service_pending_writes", status["pending_writes"])
+            METRICS.set("pfg_database_utterances", status["utterances"])
+            if query == "format=json":
+                self._send(200, METRICS.snapshot())
+            else:
+                self._send_text(200, METRICS.to_prometheus(), "text/plain; version=0.0.4")
+        else:
+            self._send(404, {"error": f"Unknown endpoint {self.path}"})
+    
+    def do_POST(self):
+        self._start = time.perf_counter()
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("Request body must be a JSON object")
+        except ValueError as e:
+            self._send(400, {"error": f"Invalid request body: {str(e)}"})
+            return
+        
+        try:
+            if self.path == "/analysis":
+                if "utt_id" not in payload:
+                    raise KeyError("utt_id")
+                feedback = self.service.analysis(payload["utt_id"], payload.get("speaker_id"),
+                                                 payload.get("text"), payload.get("scores"))
+                self._send(200, {"utt_id": payload["utt_id"], "analysis_feedback": feedback})
+            elif self.path == "/personalized":
+                if "speaker_id" not in payload:
+                    raise KeyError("speaker_id")
+                feedback = self.service.personalized(payload["speaker_id"], payload.get("utt_id"))
+                self._send(200, {"speaker_id": payload["speaker_id"], "personalized_feedback": feedback})
+            elif self.path == "/personalized/stream":
+                if "speaker_id" not in payload:
+                    raise KeyError("speaker_id")
+                self._send_stream(payload["speaker_id"], payload.get("utt_id"), bool(payload.get("sentences")))
+            elif self.path == "/flush":
+                self.service.flush()
+                self._send(200, self.service.status())
+            else:
+                self._send(404, {"error": f"Unknown endpoint {self.path}"})
+        except KeyError as e:
+            self._send(400, {"error": f"Missing field: {e.args[0]}"})
+        except (TypeError, ValueError) as e:
+            self._send(400, {"error": f"Invalid scores: {str(e)}"})
+    
+    def _send_stream(self, speaker_id, utt_id, sentences):
+        # Chunked transfer encoding, one JSON line per chunk, so clients can show each piece as it arrives
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        
+        def chunk(body):
+            data = (json.dumps(body) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+        
+        pieces = []
+        stream = self.service.personalized_stream(speaker_id, utt_id, sentences=sentences)
+        try:
+            for piece in stream:
+                pieces.append(piece)
+                chunk({"delta": piece})
+            chunk({"done": True, "speaker_id": speaker_id, "personalized_feedback": "".join(pieces).strip()})
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away; stop generating
+            stream.close()
+            self.close_connection = True
+            METRICS.count("pfg_http_stream_abandoned_total")
+        METRICS.observe("pfg_http_request_seconds", time.perf_counter() - self._start, endpoint=self._endpoint(), status=200)
+    
+    def _send(self, status, body):
+        self._send_text(status, json.dumps(body), "application/json")
+    
+    def _send_text(self, status, text, content_type):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        METRICS.observe("pfg_http_request_seconds", time.perf_counter() - self._start, endpoint=self._endpoint(), status=status)
+    
+    def _endpoint(self):
+        # Unknown paths share one label whatever the status, so probing clients cannot grow the registry without bound
+        path = self.path.partition("?")[0]
+        return path if path in ENDPOINTS else "unknown"
+    
+    def log_message(self, format, *args):
+        pass
+
+def make_server(service, host="127.0.0.1", port=8000):
+    """
+    Create the HTTP server for a FeedbackService; one thread handles each connection.
+    
+    Returns:
+        ThreadingHTTPServer: Call `serve_forever()` to start it.
+    """
+    handler = type("Handler", (FeedbackRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
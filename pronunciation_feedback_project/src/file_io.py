@@ -0,0 +1,80 @@
+import contextlib
+import os
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+@contextlib.contextmanager
+def atomic_write(path, mode="w"):
+    """
+    Open a temporary file that replaces `path` when the block exits without error.
+    
+    The temporary file is created next to `path` with a unique name, flushed to
+    disk and renamed over the target, so readers see either the old or the new
+    file, never a partial one, and concurrent writers cannot clobber each other's
+    temporary files.
+    
+    Args:
+        path (str): File to write.
+        mode (str): "w" for text or "wb" for binary.
+    
+    Yields:
+        file: The open temporary file.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        # "x" fails instead of reusing an existing file; permissions follow the umask like open(path, "w")
+        with open(tmp_path, mode.replace("w", "x")) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+class FileLock:
+    """
+    Exclusive advisory lock held on a separate `<path>.lock` file.
+    
+    Only cooperating processes that take the same lock are serialized; readers
+    that rely on `atomic_write` do not need it.
+    
+    Args:
+        path (str): The file being protected.
+    """
+    def __init__(self, path):
+        self.lock_path = f"{path}.lock"
+        self._file = None
+    
+    def __enter__(self):
+        directory = os.path.dirname(self.lock_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.lock_path, "a+")
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            # LK_LOCK retries for about 10 seconds before giving up
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        return self
+    
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
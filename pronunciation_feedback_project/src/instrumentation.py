@@ -0,0 +1,275 @@
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from src.file_io import atomic_write
+
+# Progress messages (the per-utterance and per-batch prints) are suppressed in quiet mode
+_quiet = False
+
+def set_quiet(quiet):
+    global _quiet
+    _quiet = quiet
+
+def is_quiet():
+    return _quiet
+
+def log(*args, **kwargs):
+    """Print a progress message unless quiet mode is on; warnings and errors use print."""
+    if not _quiet:
+        print(*args, **kwargs)
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+class _Timer:
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+        self.start = None
+        self.seconds = None
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self.registry._observe(self.key, self.seconds)
+
+class Summary:
+    """
+    A summary with fixed labels, from `Registry.summary`, for call sites on hot paths.
+    
+    Resolving the name and labels once saves about a microsecond per observation:
+        start = time.perf_counter()
+        ...
+        RENDER_SECONDS.observe(time.perf_counter() - start)
+    """
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+    
+    def observe(self, value):
+        self.registry._observe(self.key, value)
+    
+    def time(self):
+        return _Timer(self.registry, self.key)
+
+class Registry:
+    """
+    In-process registry of counters, gauges and timing summaries.
+    
+    Metrics are identified by a name and optional labels, e.g.
+    `count("pfg_llm_retries_total", mode="async")`. A summary keeps the count,
+    sum, minimum and maximum of its observations. Every method may be called from
+    several threads. Worker processes record into their own registry and hand it
+    to the parent with `take()`, which the parent adds with `merge()`.
+    
+    The registry can be dumped as JSON (`snapshot()`, `to_json()`) or in the
+    Prometheus text exposition format (`to_prometheus()`).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._summaries = {}
+    
+    def count(self, name, value=1, **labels):
+        """Add `value` to a counter."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+    
+    def set(self, name, value, **labels):
+        """Set a gauge."""
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+    
+    def observe(self, name, value, **labels):
+        """Add one observation (usually seconds) to a summary."""
+        self._observe((name, _label_key(labels)), value)
+    
+    def _observe(self, key, value):
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = [1, value, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                if value < summary[2]:
+                    summary[2] = value
+                if value > summary[3]:
+                    summary[3] = value
+    
+    def timer(self, name, **labels):
+        """
+        Time a block into a summary.
+        
+        Usage:
+            with METRICS.timer("pfg_batch_save_seconds") as timer:
+                ...
+            timer.seconds  # the elapsed time, after the block
+        """
+        return _Timer(self, (name, _label_key(labels)))
+    
+    def summary(self, name, **labels):
+        """Get a handle on one summary, to observe it without resolving its labels every time."""
+        return Summary(self, (name, _label_key(labels)))
+    
+    def timed_iter(self, name, iterable, **labels):
+        """
+        Yield from an iterable, observing the total time spent producing its items once it is exhausted.
+        
+        Useful for streaming parsers, whose time is otherwise interleaved with the consumer's.
+        """
+        elapsed = 0.0
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            self.observe(name, elapsed, **labels)
+    
+    def snapshot(self):
+        """
+        Get every metric as plain data.
+        
+        Returns:
+            dict: "counters" and "gauges" ({name, labels, value} lists) and
+            "summaries" ({name, labels, count, sum, min, max} list).
+        """
+        with self._lock:
+            counters = [{"name": name, "labels": dict(key), "value": value} for (name, key), value in self._counters.items()]
+            gauges = [{"name": name, "labels": dict(key), "value": value} for (name, key), value in self._gauges.items()]
+            summaries = [{"name": name, "labels": dict(key), "count": s[0], "sum": s[1], "min": s[2], "max": s[3]}
+                         for (name, key), s in self._summaries.items()]
+        order = lambda metric: (metric["name"], sorted(metric["labels"].items()))
+        return {"counters": sorted(counters, key=order), "gauges": sorted(gauges, key=order),
+                "summaries": sorted(summaries, key=order)}
+    
+    def merge(self, snapshot):
+        """Add the metrics of a `snapshot()` (e.g. from a worker process) to this registry."""
+        for counter in snapshot["counters"]:
+            self.count(counter["name"], counter["value"], **counter["labels"])
+        for gauge in snapshot["gauges"]:
+            self.set(gauge["name"], gauge["value"], **gauge["labels"])
+        with self._lock:
+            for s in snapshot["summaries"]:
+                key = (s["name"], _label_key(s["labels"]))
+                summary = self._summaries.get(key)
+                if summary is None:
+                    self._summaries[key] = [s["count"], s["sum"], s["min"], s["max"]]
+                else:
+                    summary[0] += s["count"]
+                    summary[1] += s["sum"]
+                    summary[2] = min(summary[2], s["min"])
+                    summary[3] = max(summary[3], s["max"])
+    
+    def take(self):
+        """Get a snapshot and reset the registry."""
+        with self._lock:
+            taken = Registry()
+            taken._counters, self._counters = self._counters, {}
+            taken._gauges, self._gauges = self._gauges, {}
+            taken._summaries, self._summaries = self._summaries, {}
+        return taken.snapshot()
+    
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+    
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+    
+    def to_prometheus(self):
+        """
+        Render the metrics in the Prometheus text exposition format.
+        
+        Summaries are exposed as `<name>_count` and `<name>_sum`, with the
+        largest observation as a separate `<name>_max` gauge.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        
+        def family(metrics, kind, suffix="", field="value"):
+            name = None
+            for metric in metrics:
+                if metric["name"] != name:
+                    name = metric["name"]
+                    lines.append(f"# TYPE {name}{suffix} {kind}")
+                labels = _format_labels(_label_key(metric["labels"]))
+                if kind == "summary":
+                    lines.append(f"{name}_count{labels} {metric['count']}")
+                    lines.append(f"{name}_sum{labels} {metric['sum']:.9g}")
+                else:
+                    lines.append(f"{name}{suffix}{labels} {metric[field]:.9g}")
+        
+        family(snapshot["counters"], "counter")
+        family(snapshot["gauges"], "gauge")
+        family(snapshot["summaries"], "summary")
+        family(snapshot["summaries"], "gauge", suffix="_max", field="max")
+        return "\n".join(lines) + "\n"
+    
+    def write(self, path):
+        """Write the metrics to a file: Prometheus text for `.prom` or `.txt`, JSON otherwise."""
+        text = self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with atomic_write(path) as f:
+            f.write(text)
+
+# The registry every module records into
+METRICS = Registry()
+
+def add_command_arguments(parser):
+    """Add --quiet, --metrics_out and --profile to a command's argument parser."""
+    parser.add_argument("--quiet", action="store_true", help="Only print warnings, errors and summaries")
+    parser.add_argument("--metrics_out", help="Write timings and counts to this file when the command ends "
+                                              "(Prometheus text for .prom/.txt, JSON otherwise)")
+    parser.add_argument("--profile", help="Write cProfile statistics of the command to this file (view with python -m pstats)")
+
+@contextlib.contextmanager
+def instrumented_command(args):
+    """
+    Apply the options added by `add_command_arguments` around a command's work.
+    
+    Args:
+        args (argparse.Namespace): Parsed arguments with quiet, metrics_out and profile.
+    """
+    set_quiet(args.quiet)
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with METRICS.timer("pfg_command_seconds"):
+            yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            # stderr, so commands that write results to stdout can still be piped
+            print(f"Profile written to {args.profile} (python -m pstats {args.profile})", file=sys.stderr)
+        if args.metrics_out:
+            METRICS.write(args.metrics_out)
+            print(f"Metrics written to {args.metrics_out}", file=sys.stderr)
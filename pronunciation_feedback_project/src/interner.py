@@ -0,0 +1,18 @@
+class Interner:
+    """Map strings to small consecutive integer IDs."""
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+    
+    def intern(self, name):
+        index = self.ids.get(name)
+        if index is None:
+            index = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return index
+    
+    def get(self, name):
+        return self.ids.get(name)
+    
+    def __len__(self):
+        return len(self.names)
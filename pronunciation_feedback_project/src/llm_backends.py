@@ -0,0 +1,314 @@
+import abc
+import queue
+import threading
+import time
+from src.instrumentation import METRICS
+
+# Model libraries, asyncio and concurrent.futures are imported where they are used: command-line
+# scripts import this module for add_backend_arguments, and many runs never generate anything
+
+class InferenceAPIBackend:
+    """
+    Text generation through the Hugging Face Inference API (the default backend).
+    
+    Every prompt is one HTTP request. `model_name` may also be an endpoint URL,
+    such as the stub server in `benchmarks/stub_inference_server.py`.
+    
+    Args:
+        model_name (str): Model name or inference endpoint URL.
+        token (str, optional): Hugging Face API token.
+    """
+    def __init__(self, model_name="google/gemma-2-2b-it", token=None):
+        from huggingface_hub import InferenceClient
+        self.model_name = model_name
+        self.token = token
+        self.client = InferenceClient(model=model_name, token=token)
+        self.async_client = None  # Created on first use by the async API
+    
+    def generate(self, prompt, params):
+        return self.client.text_generation(prompt, **params)
+    
+    def stream(self, prompt, params):
+        """Yield the generated text token by token as the endpoint produces it."""
+        return iter(self.client.text_generation(prompt, stream=True, **params))
+    
+    async def generate_async(self, prompt, params):
+        if self.async_client is None:
+            from huggingface_hub import AsyncInferenceClient
+            self.async_client = AsyncInferenceClient(model=self.model_name, token=self.token)
+        return await self.async_client.text_generation(prompt, **params)
+    
+    def close(self):
+        pass
+
+class DynamicBatcher:
+    """
+    Collect prompts submitted concurrently and run them as one batched generation.
+    
+    A background thread takes the first waiting prompt, then keeps collecting
+    prompts for up to `max_wait` seconds or until `max_batch_size` are waiting,
+    and calls `run_batch(prompts, params)` once for the batch. Prompts with
+    different generation parameters go into separate batches. A lone prompt
+    waits at most `max_wait`; under load batches fill up without waiting.
+    
+    Args:
+        run_batch (callable): Takes a list of prompts and a parameter dict and
+            returns the generated texts in the same order.
+        max_batch_size (int): Maximum prompts per batch.
+        max_wait (float): Seconds to wait for more prompts after the first one.
+    """
+    def __init__(self, run_batch, max_batch_size=8, max_wait=0.005):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.prompts = 0
+        self._closed = False
+        self._closing = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name="llm-batcher", daemon=True)
+        self._thread.start()
+    
+    def submit(self, prompt, params):
+        """
+        Queue a prompt.
+        
+        Returns:
+            concurrent.futures.Future: Resolves to the generated text.
+        
+        Raises:
+            RuntimeError: If the batcher has been closed.
+        """
+        from concurrent.futures import Future
+        future = Future()
+        with self._closing:
+            if self._closed:
+                raise RuntimeError("Cannot submit a prompt to a closed batcher")
+            self.queue.put((prompt, params, future, time.perf_counter()))
+        return future
+    
+    def _loop(self):
+        held = []  # Prompts taken from the queue with other parameters than the batch being collected
+        stopping = False
+        while held or not stopping:
+            if held:
+                first = held.pop(0)
+            else:
+                first = self.queue.get()
+                if first is None:
+                    break
+            key = sorted(first[1].items())
+            batch = [first] + [item for item in held if sorted(item[1].items()) == key][:self.max_batch_size - 1]
+            held = [item for item in held if not any(item is taken for taken in batch)]
+            deadline = time.perf_counter() + self.max_wait
+            while not stopping and len(batch) < self.max_batch_size:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                elif sorted(item[1].items()) == key:
+                    batch.append(item)
+                else:
+                    held.append(item)
+            self._run(batch)
+    
+    def _run(self, batch):
+        start = time.perf_counter()
+        for _, _, _, queued in batch:
+            METRICS.observe("pfg_llm_batch_wait_seconds", start - queued)
+        try:
+            texts = self.run_batch([prompt for prompt, _, _, _ in batch], batch[0][1])
+        except Exception as e:
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+        else:
+            for (_, _, future, _), text in zip(batch, texts):
+                future.set_result(text)
+        METRICS.observe("pfg_llm_batch_seconds", time.perf_counter() - start)
+        METRICS.observe("pfg_llm_batch_size", len(batch))
+        self.batches += 1
+        self.prompts += len(batch)
+    
+    def close(self):
+        """Finish the queued prompts and stop the batching thread; later submissions raise RuntimeError."""
+        with self._closing:
+            if self._closed:
+                return
+            self._closed = True
+            self.queue.put(None)
+        self._thread.join()
+        # Fail whatever the thread left behind (only if it stopped on an error), so no caller waits forever
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and not item[2].done():
+                item[2].set_exception(RuntimeError("The batcher was closed before the prompt was generated"))
+
+class LocalBackend(abc.ABC):
+    """
+    Base class of the backends that run a model in this process.
+    
+    Prompts from every thread and event loop go through one DynamicBatcher, so
+    concurrent requests (the feedback service, `regenerate_personalized.py`)
+    share batched generations and the model is only ever used from one thread.
+    Subclasses implement `generate_batch(prompts, params)`.
+    """
+    def __init__(self, model_name, max_batch_size=8, max_wait=0.005):
+        self.model_name = model_name
+        self.batcher = DynamicBatcher(self.generate_batch, max_batch_size=max_batch_size, max_wait=max_wait)
+    
+    def generate(self, prompt, params):
+        return self.batcher.submit(prompt, params).result()
+    
+    def stream(self, prompt, params):
+        """Yield the generated text; batched generations finish together, so it arrives in one piece."""
+        yield self.generate(prompt, params)
+    
+    async def generate_async(self, prompt, params):
+        import asyncio
+        return await asyncio.wrap_future(self.batcher.submit(prompt, params))
+    
+    @abc.abstractmethod
+    def generate_batch(self, prompts, params):
+        """Generate the texts of a batch of prompts sharing the same parameters, in order."""
+    
+    def close(self):
+        self.batcher.close()
+
+class TransformersBackend(LocalBackend):
+    """
+    Local generation with Hugging Face transformers on the CPU (or a GPU).
+    
+    Batches are left-padded and generated with one `model.generate` call.
+    Needs `pip install torch transformers`.
+    
+    Args:
+        model_path (str): Local model directory or Hub model name.
+        device (str): Torch device, e.g. "cpu" or "cuda".
+        threads (int, optional): Torch CPU threads.
+        max_batch_size (int): Maximum prompts per batched generation.
+        max_wait (float): Seconds the batcher waits for more prompts.
+    """
+    def __init__(self, model_path, device="cpu", threads=None, max_batch_size=8, max_wait=0.005):
+        try:
+            import torch
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+        except ImportError as e:
+            raise ImportError("The transformers backend needs torch and transformers: "
+                              "pip install torch transformers") from e
+        if threads:
+            torch.set_num_threads(threads)
+        self.torch = torch
+        self.device = device
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.model = AutoModelForCausalLM.from_pretrained(model_path).to(device)
+        self.model.eval()
+        super().__init__(model_path, max_batch_size=max_batch_size, max_wait=max_wait)
+    
+    def generate_batch(self, prompts, params):
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.device)
+        kwargs = {"max_new_tokens": params.get("max_new_tokens", 300), "do_sample": params.get("do_sample", False),
+                  "pad_token_id": self.tokenizer.pad_token_id}
+        if kwargs["do_sample"]:
+            kwargs["temperature"] = params.get("temperature", 1.0)
+            kwargs["top_p"] = params.get("top_p", 1.0)
+        with self.torch.no_grad():
+            output = self.model.generate(**inputs, **kwargs)
+        # Left padding puts every prompt's end at the same position
+        new_tokens = output[:, inputs["input_ids"].shape[1]:]
+        return self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+
+class LlamaCppBackend(LocalBackend):
+    """
+    Local generation from a GGUF model file with llama.cpp.
+    
+    llama-cpp-python generates one sequence at a time, so a batch runs its
+    prompts back to back; the batcher still serializes access to the model and
+    keeps the KV cache warm between requests. Needs `pip install llama-cpp-python`.
+    
+    Args:
+        model_path (str): Path of the .gguf model file.
+        threads (int, optional): CPU threads used by llama.cpp.
+        context_size (int): Context window in tokens.
+        max_batch_size (int): Maximum prompts taken from the queue at a time.
+        max_wait (float): Seconds the batcher waits for more prompts.
+    """
+    def __init__(self, model_path, threads=None, context_size=2048, max_batch_size=8, max_wait=0.005):
+        try:
+            from llama_cpp import Llama
+        except ImportError as e:
+            raise ImportError("The llama.cpp backend needs llama-cpp-python: pip install llama-cpp-python") from e
+        self.llm = Llama(model_path=model_path, n_ctx=context_size, n_threads=threads, verbose=False)
+        super().__init__(model_path, max_batch_size=max_batch_size, max_wait=max_wait)
+    
+    def generate_batch(self, prompts, params):
+        texts = []
+        for prompt in prompts:
+            output = self.llm(prompt, max_tokens=params.get("max_new_tokens", 300),
+                              temperature=params.get("temperature", 0.7) if params.get("do_sample", False) else 0.0,
+                              top_p=params.get("top_p", 1.0))
+            texts.append(output["choices"][0]["text"])
+        return texts
+
+BACKENDS = ("api", "transformers", "llama_cpp")
+
+def add_backend_arguments(parser):
+    """Add the options selecting and tuning the generation backend to a command's argument parser."""
+    parser.add_argument("--backend", choices=BACKENDS, default="api",
+                        help="Where personalized feedback is generated: the Hugging Face Inference API (default), "
+                             "or a local model with transformers or llama.cpp")
+    parser.add_argument("--model_path", help="Local backends: model directory or Hub name (transformers), .gguf file (llama_cpp)")
+    parser.add_argument("--threads", type=int, help="Local backends: CPU threads")
+    parser.add_argument("--max_batch_size", type=int, default=8, help="Local backends: maximum prompts per batched generation (default: 8)")
+    parser.add_argument("--max_batch_wait", type=float, default=0.005,
+                        help="Local backends: seconds to wait for more prompts before generating (default: 0.005)")
+
+def backend_from_args(args, model_name="google/gemma-2-2b-it", token=None):
+    """
+    Create the backend selected by the options of `add_backend_arguments`.
+    
+    Returns:
+        The backend, or None for the API backend (PersonalizedGenerator's default).
+    """
+    if args.backend == "api":
+        return None
+    if args.model_path is None:
+        raise SystemExit(f"--backend {args.backend} needs --model_path")
+    return make_backend(args.backend, model_name, token, args.model_path, threads=args.threads,
+                        max_batch_size=args.max_batch_size, max_wait=args.max_batch_wait)
+
+def make_backend(name="api", model_name="google/gemma-2-2b-it", token=None, model_path=None, threads=None,
+                 max_batch_size=8, max_wait=0.005):
+    """
+    Create a generation backend by name.
+    
+    Args:
+        name (str): "api", "transformers" or "llama_cpp".
+        model_name (str): Model name or endpoint URL for the API backend.
+        token (str, optional): Hugging Face API token for the API backend.
+        model_path (str, optional): Local model for the transformers (directory or
+            Hub name) and llama_cpp (.gguf file) backends.
+        threads (int, optional): CPU threads for local backends.
+        max_batch_size (int): Maximum prompts per batched generation (local backends).
+        max_wait (float): Seconds the batcher waits for more prompts (local backends).
+    
+    Returns:
+        A backend with `generate(prompt, params)`, `generate_async(prompt, params)`,
+        `stream(prompt, params)` and `close()`.
+    """
+    if name == "api":
+        return InferenceAPIBackend(model_name, token)
+    if model_path is None:
+        raise ValueError(f"The {name} backend needs a local model path")
+    if name == "transformers":
+        return TransformersBackend(model_path, threads=threads, max_batch_size=max_batch_size, max_wait=max_wait)
+    if name == "llama_cpp":
+        return LlamaCppBackend(model_path, threads=threads, max_batch_size=max_batch_size, max_wait=max_wait)
+    raise ValueError(f"Unknown backend {name!r} (expected one of {', '.join(BACKENDS)})")
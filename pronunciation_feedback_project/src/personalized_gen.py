@@ -1,13 +1,90 @@
+import asyncio
+import itertools
 import json
-from huggingface_hub import InferenceClient
+import re
 import time
+from src.instrumentation import METRICS, log
+from src.llm_backends import InferenceAPIBackend, LocalBackend
+from src.rate_limit import TokenBucket, backoff_delay
+
+PROMPT_BUILD_SECONDS = METRICS.summary("pfg_prompt_build_seconds")
+# A sentence ends at terminal punctuation followed by whitespace ("3.5" and "e.g.," do not end one), or at a newline
+SENTENCE_END = re.compile(r"[.!?](?=\s)|\n")
+# Cohort figures in the prompt are rounded to these steps (percent). They shift with every insert
+# anywhere in the corpus; rounded, the prompt (and so the response cache key) only changes when a
+# speaker's standing really does
+COHORT_PERCENTILE_STEP = 10
+COHORT_ERROR_RATE_STEP = 5
+
+class _PromptEcho:
+    """
+    Drop the prompt from the start of a token stream, as `_finish` does for whole responses.
+    
+    Some endpoints echo the prompt before the generated text. Tokens are held
+    back only while the text so far could still be the start of the prompt;
+    leading whitespace of the feedback is dropped too.
+    """
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self.pending = ""
+        self.stage = "echo"  # then "leading" (skipping whitespace), then "body"
+    
+    def feed(self, text):
+        if self.stage == "echo":
+            self.pending += text
+            candidate = self.pending.lstrip()
+            if len(candidate) < len(self.prompt) and self.prompt.startswith(candidate):
+                return ""
+            text = candidate[len(self.prompt):] if candidate.startswith(self.prompt) else candidate
+            self.pending = ""
+            self.stage = "leading"
+        if self.stage == "leading":
+            text = text.lstrip()
+            if text:
+                self.stage = "body"
+        return text
+    
+    def finish(self):
+        # A stream that ended while it still looked like the start of the prompt was not an echo
+        if self.stage == "echo":
+            self.stage = "body"
+            return self.pending.strip()
+        return ""
+
+def _rounded(percent, step):
+    return int(round(percent / step)) * step
+
+def _sentences(pieces):
+    # Regroup streamed pieces into whole sentences (the last one may be unfinished)
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        end = 0
+        for match in SENTENCE_END.finditer(buffer):
+            end = match.end()
+        if end:
+            yield buffer[:end]
+            buffer = buffer[end:]
+    if buffer:
+        yield buffer
 
 class PersonalizedGenerator:
-    def __init__(self, model_name="google/gemma-2-2b-it", token=None):
-        # Initialize the Hugging Face Inference API client
-        print(f"Initializing Inference API client for {model_name}...")
-        self.client = InferenceClient(model=model_name, token=token)
-        print("Inference API client initialized successfully")
+    def __init__(self, model_name="google/gemma-2-2b-it", token=None, cache=None, backend=None):
+        # Generation backend (src/llm_backends.py); the Hugging Face Inference API unless a local one is given
+        if backend is None:
+            log(f"Initializing Inference API client for {model_name}...")
+            backend = InferenceAPIBackend(model_name, token)
+        self.backend = backend
+        self.model_name = backend.model_name
+        self.generation_params = {
+            "max_new_tokens": 300,  # Increased to allow for longer responses
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "do_sample": True
+        }
+        # Optional ResponseCache; unchanged prompts are answered without an API call
+        self.cache = cache
+        log(f"{type(backend).__name__} for {self.model_name} initialized successfully")
     
     def prepare_user_history(self, db, speaker_id, current_utt_id):
         """
@@ -21,48 +98,34 @@ class PersonalizedGenerator:
         Returns:
             dict: Structured user history for the LLM.
         """
-        history = db.get_speaker_history(speaker_id)
-        analysis_history = db.get_speaker_analysis_history(speaker_id)
+        aggregate = db.get_speaker_aggregate(speaker_id)
         
-        if not history or len(analysis_history) < 2:
+        if aggregate.count < 2:
             return {"error": f"Not enough history for speaker {speaker_id}. Need at least 2 attempts for trends."}
         
+        # Averages and phoneme issue counts are maintained incrementally by the database
         user_history = {
             "speaker_id": speaker_id,
-            "total_attempts": len(history),
-            "attempts": [],
-            "phoneme_issues": {}
+            "total_attempts": aggregate.count,
+            "averages": {key: aggregate.mean(key) for key in aggregate.SCORE_KEYS},
+            "phoneme_issues": dict(aggregate.phoneme_issues)
         }
         
-        for i, (utt, analysis_entry) in enumerate(zip(history, analysis_history)):
-            score_entry = utt["scores"]
-            attempt = {
-                "utt_id": utt["utt_id"],
-                "scores": {
-                    "accuracy": score_entry["accuracy"],
-                    "fluency": score_entry["fluency"],
-                    "prosodic": score_entry["prosodic"]
-                },
-                "analysis_feedback": analysis_entry if analysis_entry else "Not available"
+        # Where the speaker stands among all learners, from the precomputed baselines
+        # (a few histogram lookups, whatever the size of the corpus)
+        cohort = db.get_cohort_stats()
+        if cohort.speaker_count() > 1:
+            user_history["cohort"] = {
+                "speakers": cohort.speaker_count(),
+                "percentiles": {key: cohort.speaker_rank(speaker_id, key) for key in aggregate.SCORE_KEYS},
+                "phone_error_rates": {phone: cohort.phone_error_rate(phone) for phone in user_history["phoneme_issues"]}
             }
-            user_history["attempts"].append(attempt)
-            
-            for w in score_entry["word_scores"]:
-                for i, score in enumerate(w["phones-accuracy"]):
-                    if score < 1.5:
-                        phone = w["phones"][i]
-                        user_history["phoneme_issues"][phone] = user_history["phoneme_issues"].get(phone, 0) + 1
-                if "mispronunciations" in w and w["mispronunciations"]:
-                    for mis in w["mispronunciations"]:
-                        phone = mis["canonical-phone"]
-                        user_history["phoneme_issues"][phone] = user_history["phoneme_issues"].get(phone, 0) + 1
-        
-        user_history["attempts"].sort(key=lambda x: x["utt_id"])
+        
         return user_history
     
     def generate_personalized(self, db, speaker_id, current_utt_id):
         """
-        Generate personalized feedback using the Hugging Face Inference API.
+        Generate personalized feedback with the generation backend (the Hugging Face Inference API by default).
         
         Args:
             db: Database instance.
@@ -72,40 +135,259 @@ class PersonalizedGenerator:
         Returns:
             str: Personalized feedback generated by the API.
         """
-        # Prepare the user history
-        user_history = self.prepare_user_history(db, speaker_id, current_utt_id)
+        prompt, error = self.build_prompt(db, speaker_id, current_utt_id)
+        if error is not None:
+            return error
+        return self.generate_from_prompt(prompt)
+    
+    def generate_from_prompt(self, prompt):
+        """
+        Generate feedback for a prompt built by `build_prompt`.
         
-        if "error" in user_history:
-            return user_history["error"]
+        Kept separate from the history lookup so callers that share the database
+        between threads only need to hold their lock while the prompt is built.
         
-        # Create a prompt for the LLM
-        prompt = self._create_prompt(user_history)
+        Args:
+            prompt (str): The prompt for the LLM.
+        
+        Returns:
+            str: Personalized feedback generated by the API, or an error message.
+        """
+        cache_key, cached = self._lookup_cache(prompt)
+        if cached is not None:
+            return cached
+        
+        # Generate feedback with retry logic
+        max_retries = 3
+        for attempt in range(max_retries):
+            start = time.perf_counter()
+            try:
+                response = self.backend.generate(prompt, self.generation_params)
+                METRICS.observe("pfg_llm_request_seconds", time.perf_counter() - start, mode="sync", outcome="ok")
+                return self._finish(prompt, response, cache_key)
+            except Exception as e:
+                METRICS.observe("pfg_llm_request_seconds", time.perf_counter() - start, mode="sync", outcome="error")
+                if attempt < max_retries - 1:
+                    METRICS.count("pfg_llm_retries_total", mode="sync")
+                    print(f"API call failed (attempt {attempt + 1}/{max_retries}): {str(e)}. Retrying in 5 seconds...")
+                    time.sleep(5)
+                else:
+                    METRICS.count("pfg_llm_failures_total", mode="sync")
+                    return f"Error generating feedback via API after {max_retries} attempts: {str(e)}"
+    
+    def stream_personalized(self, db, speaker_id, current_utt_id=None, sentences=False):
+        """
+        Generate personalized feedback, yielding it as it is produced.
+        
+        Args:
+            db: Database instance.
+            speaker_id (str): Speaker ID.
+            current_utt_id (str, optional): Current utterance ID.
+            sentences (bool): Yield whole sentences instead of tokens.
+        
+        Yields:
+            str: Pieces of the feedback (see `stream_from_prompt`), or one error message.
+        """
+        prompt, error = self.build_prompt(db, speaker_id, current_utt_id)
+        if error is not None:
+            yield error
+            return
+        yield from self.stream_from_prompt(prompt, sentences=sentences)
+    
+    def stream_from_prompt(self, prompt, sentences=False):
+        """
+        Stream feedback for a prompt built by `build_prompt` with the backend's streaming mode.
+        
+        Failures before the first token are retried like in `generate_from_prompt`.
+        Once text has been yielded, a retry would repeat it, so a failure ends the
+        stream with a note instead. The time from this call to the first token
+        (retries included) is recorded as `pfg_llm_time_to_first_token_seconds`,
+        and the complete feedback is cached like a whole response. Cached
+        feedback is yielded in one piece.
+        
+        Args:
+            prompt (str): The prompt for the LLM.
+            sentences (bool): Yield whole sentences instead of tokens.
+        
+        Yields:
+            str: Pieces of the feedback; joined and stripped, they are what
+            `generate_from_prompt` returns.
+        """
+        pieces = self._stream_pieces(prompt)
+        return _sentences(pieces) if sentences else pieces
+    
+    def _stream_pieces(self, prompt):
+        call_start = time.perf_counter()
+        cache_key, cached = self._lookup_cache(prompt)
+        if cached is not None:
+            yield cached
+            return
         
-        # Use the Inference API to generate feedback with retry logic
         max_retries = 3
         for attempt in range(max_retries):
+            start = time.perf_counter()
             try:
-                response = self.client.text_generation(
-                    prompt,
-                    max_new_tokens=300,  # Increased to allow for longer responses
-                    temperature=0.7,
-                    top_p=0.9,
-                    do_sample=True
-                )
-                
-                # Extract the feedback part (remove the prompt if it's included in the output)
-                feedback = response.strip()
-                if feedback.startswith(prompt):
-                    feedback = feedback[len(prompt):].strip()
-                
-                return feedback
+                tokens = iter(self.backend.stream(prompt, self.generation_params))
+                first = next(tokens, "")
+                break
             except Exception as e:
+                METRICS.observe("pfg_llm_request_seconds", time.perf_counter() - start, mode="stream", outcome="error")
                 if attempt < max_retries - 1:
+                    METRICS.count("pfg_llm_retries_total", mode="stream")
                     print(f"API call failed (attempt {attempt + 1}/{max_retries}): {str(e)}. Retrying in 5 seconds...")
                     time.sleep(5)
                 else:
+                    METRICS.count("pfg_llm_failures_total", mode="stream")
+                    yield f"Error generating feedback via API after {max_retries} attempts: {str(e)}"
+                    return
+        METRICS.observe("pfg_llm_time_to_first_token_seconds", time.perf_counter() - call_start, mode="stream")
+        
+        echo = _PromptEcho(prompt)
+        parts = []
+        try:
+            for token in itertools.chain([first], tokens):
+                text = echo.feed(token)
+                if text:
+                    parts.append(text)
+                    yield text
+            text = echo.finish()
+            if text:
+                parts.append(text)
+                yield text
+        except Exception as e:
+            METRICS.observe("pfg_llm_request_seconds", time.perf_counter() - start, mode="stream", outcome="interrupted")
+            METRICS.count("pfg_llm_failures_total", mode="stream")
+            yield f"\n[Feedback interrupted: {str(e)}]"
+            return
+        finally:
+            # Also closes the connection when the caller stops reading early
+            close = getattr(tokens, "close", None)
+            if close is not None:
+                close()
+        METRICS.observe("pfg_llm_request_seconds", time.perf_counter() - start, mode="stream", outcome="ok")
+        
+        feedback = "".join(parts).strip()
+        if cache_key is not None:
+            self.cache.put(cache_key, feedback)
+    
+    async def generate_personalized_async(self, db, speaker_id, current_utt_id=None, limiter=None, max_retries=5):
+        """
+        Generate personalized feedback with the backend's async API.
+        
+        Failed calls are retried with exponential backoff and jitter instead of a
+        fixed sleep, without blocking the event loop.
+        
+        Args:
+            db: Database instance.
+            speaker_id (str): Speaker ID.
+            current_utt_id (str, optional): Current utterance ID.
+            limiter (TokenBucket, optional): Rate limiter shared by concurrent calls.
+            max_retries (int): Maximum number of API attempts.
+        
+        Returns:
+            str: Personalized feedback generated by the API, or an error message.
+        """
+        prompt, error = self.build_prompt(db, speaker_id, current_utt_id)
+        if error is not None:
+            return error
+        
+        cache_key, cached = self._lookup_cache(prompt)
+        if cached is not None:
+            return cached
+        
+        for attempt in range(max_retries):
+            if limiter is not None:
+                await limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = await self.backend.generate_async(prompt, self.generation_params)
+                METRICS.observe("pfg_llm_request_seconds", time.perf_counter() - start, mode="async", outcome="ok")
+                return self._finish(prompt, response, cache_key)
+            except Exception as e:
+                METRICS.observe("pfg_llm_request_seconds", time.perf_counter() - start, mode="async", outcome="error")
+                if attempt < max_retries - 1:
+                    METRICS.count("pfg_llm_retries_total", mode="async")
+                    delay = backoff_delay(attempt)
+                    print(f"API call for speaker {speaker_id} failed (attempt {attempt + 1}/{max_retries}): {str(e)}. "
+                          f"Retrying in {delay:.1f} seconds...")
+                    await asyncio.sleep(delay)
+                else:
+                    METRICS.count("pfg_llm_failures_total", mode="async")
                     return f"Error generating feedback via API after {max_retries} attempts: {str(e)}"
     
+    async def generate_personalized_many(self, db, speaker_ids, concurrency=8, rate=4.0, max_retries=5):
+        """
+        Generate personalized feedback for many speakers concurrently.
+        
+        Results are yielded as soon as each speaker is done, so callers can stream
+        or save them while the rest are still being generated.
+        
+        Args:
+            db: Database instance.
+            speaker_ids (iterable): Speaker IDs.
+            concurrency (int): Maximum number of requests in flight.
+            rate (float): Maximum API requests per second (token bucket); not applied to local backends,
+                whose concurrent prompts are batched instead.
+            max_retries (int): Maximum number of API attempts per speaker.
+        
+        Yields:
+            tuple: (speaker_id, feedback) in completion order.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        limiter = None if isinstance(self.backend, LocalBackend) else TokenBucket(rate)
+        
+        async def run(speaker_id):
+            async with semaphore:
+                feedback = await self.generate_personalized_async(db, speaker_id, limiter=limiter, max_retries=max_retries)
+                return speaker_id, feedback
+        
+        tasks = [asyncio.ensure_future(run(speaker_id)) for speaker_id in speaker_ids]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def close(self):
+        """Release the backend (stops the batching thread of local backends)."""
+        self.backend.close()
+    
+    def build_prompt(self, db, speaker_id, current_utt_id=None):
+        """
+        Build the LLM prompt from a speaker's history.
+        
+        Returns:
+            tuple: (prompt, None), or (None, error message) if there is not enough history.
+        """
+        start = time.perf_counter()
+        user_history = self.prepare_user_history(db, speaker_id, current_utt_id)
+        if "error" in user_history:
+            METRICS.count("pfg_prompt_insufficient_history_total")
+            return None, user_history["error"]
+        prompt = self._create_prompt(user_history)
+        PROMPT_BUILD_SECONDS.observe(time.perf_counter() - start)
+        return prompt, None
+    
+    def _lookup_cache(self, prompt):
+        # Returns (cache key, cached response or None)
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.make_key(self.model_name, self.generation_params, prompt)
+        cached = self.cache.get(cache_key)
+        METRICS.count("pfg_llm_cache_total", result="miss" if cached is None else "hit")
+        return cache_key, cached
+    
+    def _finish(self, prompt, response, cache_key):
+        # Extract the feedback part (remove the prompt if it's included in the output)
+        feedback = response.strip()
+        if feedback.startswith(prompt):
+            feedback = feedback[len(prompt):].strip()
+        
+        if cache_key is not None:
+            self.cache.put(cache_key, feedback)
+        return feedback
+    
     def _create_prompt(self, user_history):
         """
         Create a prompt for the LLM based on the user's history.
@@ -119,14 +401,10 @@ class PersonalizedGenerator:
         speaker_id = user_history["speaker_id"]
         total_attempts = user_history["total_attempts"]
         
-        # Summarize scores and trends
-        accuracy_scores = [attempt["scores"]["accuracy"] for attempt in user_history["attempts"]]
-        fluency_scores = [attempt["scores"]["fluency"] for attempt in user_history["attempts"]]
-        prosodic_scores = [attempt["scores"]["prosodic"] for attempt in user_history["attempts"]]
-        
-        avg_accuracy = sum(accuracy_scores) / len(accuracy_scores)
-        avg_fluency = sum(fluency_scores) / len(fluency_scores)
-        avg_prosodic = sum(prosodic_scores) / len(prosodic_scores)
+        # Summarize scores
+        avg_accuracy = user_history["averages"]["accuracy"]
+        avg_fluency = user_history["averages"]["fluency"]
+        avg_prosodic = user_history["averages"]["prosodic"]
         
         # Identify phoneme issues
         phoneme_issues = user_history["phoneme_issues"]
@@ -145,6 +423,27 @@ class PersonalizedGenerator:
         for phoneme, count in top_phonemes:
             prompt += f"- '{phoneme}': {count} times\n"
         
+        # Population context, when the database provided it
+        cohort = user_history.get("cohort")
+        if cohort:
+            prompt += "Compared with all learners in the database:\n"
+            for key, label in (("accuracy", "Accuracy"), ("fluency", "Fluency"), ("prosodic", "Prosodic")):
+                percentile = cohort["percentiles"].get(key)
+                if percentile is None:
+                    continue
+                percentile = _rounded(percentile, COHORT_PERCENTILE_STEP)
+                if percentile == 0:
+                    prompt += f"- {label} is lower than that of almost all learners\n"
+                elif percentile == 100:
+                    prompt += f"- {label} is higher than that of almost all learners\n"
+                else:
+                    prompt += f"- {label} is higher than that of about {percentile}% of learners\n"
+            for phoneme, _ in top_phonemes:
+                rate = cohort["phone_error_rates"].get(phoneme)
+                if rate is not None:
+                    prompt += (f"- '{phoneme}' is mispronounced in about {_rounded(rate * 100, COHORT_ERROR_RATE_STEP)}% "
+                               f"of attempts across all learners\n")
+        
         prompt += (
             "\nBased on this information, provide concise, encouraging feedback (3-4 sentences) to help the speaker improve. "
             "Focus on their strengths to build their confidence, highlight specific areas for improvement, and offer practical, actionable tips for practicing the phonemes they struggle with (e.g., specific exercises, tongue placement, or example words). "
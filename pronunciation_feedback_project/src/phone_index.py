@@ -0,0 +1,182 @@
+import heapq
+from src.interner import Interner
+
+# A phone scored below this in phones-accuracy counts as an error
+PHONE_ERROR_THRESHOLD = 1.5
+
+class PhoneIndex:
+    """
+    Inverted index from phone to the places it was pronounced wrong.
+    
+    A phone occurrence is an error if it is listed in the word's
+    mispronunciations (by its canonical phone) or scored below
+    PHONE_ERROR_THRESHOLD in phones-accuracy; an occurrence that is both is
+    indexed once. Phones are interned to integer IDs, and each phone ID maps to
+    its postings, grouped by utterance:
+        
+        (speaker_id, utt_id, word_index, phone_index, score)
+    
+    A mispronunciation without an index (as inserted through generate_feedback.py)
+    is located at the first occurrence of its canonical phone in the word, like
+    ScoreStore does. `score` is the phone's phones-accuracy (None if unknown) and
+    `phone_index` is None for a mispronunciation whose canonical phone is not in
+    the word. Error counts per (phone, speaker) are kept next to the postings, so
+    top-K and per-speaker queries cost time proportional to their answer rather
+    than to the corpus.
+    """
+    def __init__(self):
+        self.phones = Interner()
+        # phone ID -> {utt_id: [postings]}
+        self.postings = []
+        # phone ID -> {speaker_id: error count}
+        self.speaker_counts = []
+        # speaker_id -> {phone ID: error count}
+        self.speaker_errors = {}
+    
+    @classmethod
+    def from_utterances(cls, utterances):
+        """
+        Build the index in one pass over database utterances.
+        
+        Args:
+            utterances (iterable): Utterance dictionaries as stored in `Database.data["utterances"]`.
+        
+        Returns:
+            PhoneIndex: The index.
+        """
+        index = cls()
+        for utt in utterances:
+            index.add(utt)
+        return index
+    
+    @staticmethod
+    def word_errors(word):
+        """
+        Get the phone errors of one word score.
+        
+        Args:
+            word (dict): Word-level scores.
+        
+        Returns:
+            list: (phone, phone_index, score) for each error, in phone order.
+        """
+        phones = word.get("phones", [])
+        phones_accuracy = word.get("phones-accuracy", [])
+        if len(phones) == len(phones_accuracy):
+            errors = [(phones[i], i, score) for i, score in enumerate(phones_accuracy) if score < PHONE_ERROR_THRESHOLD]
+        else:
+            errors = []
+        mispronunciations = word.get("mispronunciations")
+        if not mispronunciations:
+            return errors
+        # Mispronounced phones that were not already scored below the threshold
+        indexed = {i for _, i, _ in errors}
+        extra = []
+        for mis in mispronunciations:
+            i = mis.get("index")
+            if i is None and mis["canonical-phone"] in phones:
+                i = phones.index(mis["canonical-phone"])
+            if i is None or i not in indexed:
+                score = phones_accuracy[i] if i is not None and 0 <= i < len(phones_accuracy) else None
+                extra.append((mis["canonical-phone"], i, score))
+                if i is not None:
+                    indexed.add(i)
+        if extra:
+            errors += extra
+            # In phone order, unindexed mispronunciations last
+            errors.sort(key=lambda error: (error[1] is None, error[1] or 0))
+        return errors
+    
+    def _update(self, utt, sign):
+        speaker_id = utt["speaker_id"]
+        utt_id = utt["utt_id"]
+        speaker_errors = self.speaker_errors.setdefault(speaker_id, {})
+        for word_index, word in enumerate((utt.get("scores") or {}).get("word_scores", [])):
+            for phone, phone_index, score in self.word_errors(word):
+                phone_id = self.phones.ids.get(phone)
+                if phone_id is None:
+                    phone_id = self.phones.intern(phone)
+                    self.postings.append({})
+                    self.speaker_counts.append({})
+                postings = self.postings[phone_id]
+                if sign > 0:
+                    utt_postings = postings.get(utt_id)
+                    if utt_postings is None:
+                        utt_postings = postings[utt_id] = []
+                    utt_postings.append((speaker_id, utt_id, word_index, phone_index, score))
+                else:
+                    postings.pop(utt_id, None)
+                _bump(self.speaker_counts[phone_id], speaker_id, sign)
+                _bump(speaker_errors, phone_id, sign)
+        if not speaker_errors:
+            del self.speaker_errors[speaker_id]
+    
+    def add(self, utt):
+        """Index the errors of one utterance."""
+        self._update(utt, 1)
+    
+    def remove(self, utt):
+        """Remove the errors of one utterance (as it was indexed) from the index."""
+        self._update(utt, -1)
+    
+    def errors(self, phone, speaker_id=None):
+        """
+        Get every error on a phone.
+        
+        Args:
+            phone (str): Canonical phone (e.g., "TH").
+            speaker_id (str, optional): Only this speaker's errors.
+        
+        Returns:
+            list: (speaker_id, utt_id, word_index, phone_index, score) postings.
+        """
+        phone_id = self.phones.get(phone)
+        if phone_id is None:
+            return []
+        postings = [posting for utt_postings in self.postings[phone_id].values() for posting in utt_postings]
+        if speaker_id is not None:
+            postings = [posting for posting in postings if posting[0] == speaker_id]
+        return postings
+    
+    def utterances(self, phone):
+        """Get the sorted IDs of the utterances with an error on a phone."""
+        phone_id = self.phones.get(phone)
+        return sorted(self.postings[phone_id]) if phone_id is not None else []
+    
+    def top_speakers(self, phone, k=10):
+        """
+        Get the speakers with the most errors on a phone.
+        
+        Args:
+            phone (str): Canonical phone.
+            k (int): Number of speakers to return.
+        
+        Returns:
+            list: (speaker_id, error count), most errors first.
+        """
+        phone_id = self.phones.get(phone)
+        if phone_id is None:
+            return []
+        return heapq.nsmallest(k, self.speaker_counts[phone_id].items(), key=lambda item: (-item[1], item[0]))
+    
+    def speaker_phone_errors(self, speaker_id, k=None):
+        """
+        Get how often a speaker got each phone wrong.
+        
+        Args:
+            speaker_id (str): Speaker ID.
+            k (int, optional): Only the k most frequent phones.
+        
+        Returns:
+            list: (phone, error count), most frequent first.
+        """
+        counts = [(self.phones.names[phone_id], count) for phone_id, count in self.speaker_errors.get(speaker_id, {}).items()]
+        counts.sort(key=lambda item: (-item[1], item[0]))
+        return counts if k is None else counts[:k]
+
+def _bump(counts, key, sign):
+    count = counts.get(key, 0) + sign
+    if count > 0:
+        counts[key] = count
+    else:
+        counts.pop(key, None)
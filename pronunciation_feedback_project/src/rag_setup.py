@@ -1,4 +1,7 @@
 # from sentence_transformers import SentenceTransformer
+import math
+from bisect import bisect_left
+from src.instrumentation import METRICS
 
 SCORE_MEANINGS = {
     "accuracy": {
@@ -28,23 +31,111 @@ SCORE_MEANINGS = {
     }
 }
 
-class RAGSetup:
-    def __init__(self):
-        self.meanings = SCORE_MEANINGS
+OUT_OF_RANGE = "Score out of range"
+# A range "low-high" covers [low, high + RANGE_SLACK]; a single value "v" matches scores within POINT_TOLERANCE
+RANGE_SLACK = 0.999
+POINT_TOLERANCE = 0.001
+
+def _point_bounds(point):
+    # Smallest and largest floats s with abs(point - s) < POINT_TOLERANCE
+    low, high = point - POINT_TOLERANCE, point + POINT_TOLERANCE
+    while abs(point - low) < POINT_TOLERANCE:
+        low = math.nextafter(low, -math.inf)
+    while abs(point - low) >= POINT_TOLERANCE:
+        low = math.nextafter(low, math.inf)
+    while abs(point - high) < POINT_TOLERANCE:
+        high = math.nextafter(high, math.inf)
+    while abs(point - high) >= POINT_TOLERANCE:
+        high = math.nextafter(high, -math.inf)
+    return low, high
+
+class CompiledMeanings:
+    """
+    Score meanings of one parameter compiled into sorted breakpoints.
     
-    def _get_range(self, param, score):
-        ranges = self.meanings[param]
-        score = float(score)
+    Every range key becomes a closed interval of floats. The sorted interval ends
+    (`edges`) split the number line into the edges themselves and the open gaps
+    between them, and the meaning of each is resolved once with the original
+    rule: the first key in `SCORE_MEANINGS` order that contains the score wins.
+    A lookup is then one binary search.
+    """
+    def __init__(self, ranges):
+        intervals = []
         for range_str, desc in ranges.items():
             if "-" in range_str:
                 low, high = map(float, range_str.split("-"))
-                if low <= score <= high + 0.999:
-                    return desc
+                intervals.append((low, high + RANGE_SLACK, desc))
             else:
-                if abs(float(range_str) - score) < 0.001:
+                intervals.append((*_point_bounds(float(range_str)), desc))
+        
+        def resolve(score):
+            for low, high, desc in intervals:
+                if low <= score <= high:
                     return desc
-        return "Score out of range"
+            return OUT_OF_RANGE
+        
+        self.edges = sorted({end for low, high, _ in intervals for end in (low, high)})
+        self.descriptions = [OUT_OF_RANGE] + sorted({desc for _, _, desc in intervals})
+        code = {desc: i for i, desc in enumerate(self.descriptions)}
+        # edge_codes[i]: meaning at edges[i]; gap_codes[i]: meaning strictly between edges[i - 1] and edges[i]
+        self.edge_codes = [code[resolve(edge)] for edge in self.edges]
+        # Any score strictly inside a gap has the same meaning, so sample one per gap
+        samples = [self.edges[0] - 1]
+        samples += [(a + b) / 2 for a, b in zip(self.edges, self.edges[1:])]
+        samples.append(self.edges[-1] + 1)
+        self.gap_codes = [code[resolve(sample)] for sample in samples]
+    
+    def lookup(self, score):
+        i = bisect_left(self.edges, score)
+        if i < len(self.edges) and self.edges[i] == score:
+            return self.descriptions[self.edge_codes[i]]
+        return self.descriptions[self.gap_codes[i]]
+
+class RAGSetup:
+    def __init__(self):
+        self.meanings = SCORE_MEANINGS
+        # Parse the range keys once instead of on every lookup
+        self.compiled = {param: CompiledMeanings(ranges) for param, ranges in self.meanings.items()}
+    
+    def lookup(self, param, score):
+        """
+        Get the meaning of a score.
+        
+        Args:
+            param (str): "accuracy", "completeness", "fluency" or "prosodic".
+            score (float): The score.
+        
+        Returns:
+            str: Meaning of the score, or "Score out of range".
+        """
+        return self.compiled[param].lookup(float(score))
+    
+    def lookup_many(self, param, scores):
+        """
+        Get the meanings of many scores of one parameter at once.
+        
+        Args:
+            param (str): "accuracy", "completeness", "fluency" or "prosodic".
+            scores (array-like): The scores.
+        
+        Returns:
+            np.ndarray: Meaning of each score (object array of str).
+        """
+        import numpy as np
+        METRICS.count("pfg_rag_lookups_total", len(scores), mode="batch")
+        compiled = self.compiled[param]
+        scores = np.asarray(scores, dtype=np.float64)
+        edges = np.asarray(compiled.edges, dtype=np.float64)
+        index = np.searchsorted(edges, scores, side="left")
+        on_edge = edges[np.minimum(index, len(edges) - 1)] == scores
+        on_edge &= index < len(edges)
+        codes = np.where(on_edge,
+                         np.asarray(compiled.edge_codes + [0])[index],
+                         np.asarray(compiled.gap_codes)[index])
+        return np.asarray(compiled.descriptions, dtype=object)[codes]
     
     def retrieve(self, query):
-        param, score = query.split(": ")
-        return self._get_range(param, score)
\ No newline at end of file
+        """Compatibility wrapper for `lookup` taking a "param: score" string."""
+        with METRICS.timer("pfg_rag_retrieve_seconds"):
+            param, score = query.split(": ")
+            return self.lookup(param, score)
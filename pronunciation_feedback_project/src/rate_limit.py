@@ -0,0 +1,41 @@
+import asyncio
+import random
+import time
+
+class TokenBucket:
+    """
+    Asyncio token bucket allowing `rate` requests per second on average, with
+    bursts of up to `capacity` requests.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """
+    Exponential backoff with full jitter.
+    
+    Args:
+        attempt (int): Zero-based number of the attempt that just failed.
+        base (float): Delay scale in seconds.
+        cap (float): Maximum delay in seconds.
+    
+    Returns:
+        float: Seconds to wait before the next attempt.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
@@ -0,0 +1,316 @@
+import sys
+from array import array
+from collections.abc import Mapping
+from src.interner import Interner
+
+# Process-wide phone table: records hold phone IDs instead of phone strings
+PHONES = Interner()
+# Value of an optional field the record does not have
+_ABSENT = object()
+
+def _pack_phones(phones):
+    ids = [PHONES.intern(phone) for phone in phones]
+    return bytes(ids) if len(PHONES) <= 256 else array("I", ids)
+
+_NUMBER_TYPES = {int, float}
+
+def _is_number(value):
+    return type(value) in _NUMBER_TYPES
+
+def _all_of(values, types):
+    return set(map(type, values)) <= types
+
+def to_plain(value):
+    """`default` hook for json.dump: serialize records as the dictionaries they stand for."""
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class Record(Mapping):
+    """
+    Base class of the compact records, which read like the dictionaries they replace.
+    
+    Subclasses list their keys in FIELDS as (key, attribute) pairs; the attribute
+    is a slot or a property that decodes the compact representation. Optional
+    fields hold _ABSENT when the original dictionary did not have them. Records
+    compare equal to the equivalent dictionaries, serialize through to_dict()
+    and pickle as dictionaries, because phone IDs are only valid in the process
+    that interned them.
+    """
+    __slots__ = ()
+    FIELDS = ()
+    
+    def __init_subclass__(cls):
+        super().__init_subclass__()
+        cls._ATTRIBUTES = dict(cls.FIELDS)
+    
+    def __getitem__(self, key):
+        attribute = self._ATTRIBUTES.get(key)
+        if attribute is None:
+            raise KeyError(key)
+        value = getattr(self, attribute)
+        if value is _ABSENT:
+            raise KeyError(key)
+        return value
+    
+    def __contains__(self, key):
+        attribute = self._ATTRIBUTES.get(key)
+        return attribute is not None and getattr(self, attribute) is not _ABSENT
+    
+    def __iter__(self):
+        for key, attribute in self.FIELDS:
+            if getattr(self, attribute) is not _ABSENT:
+                yield key
+    
+    def __len__(self):
+        return sum(1 for _ in self)
+    
+    def __setitem__(self, key, value):
+        attribute = self._ATTRIBUTES.get(key)
+        if attribute is None:
+            raise KeyError(f"{type(self).__name__} has no field '{key}'")
+        setattr(self, attribute, value)
+    
+    def to_dict(self):
+        """Get the record as the plain dictionary it was built from."""
+        return {key: _plain(self[key]) for key in self}
+    
+    def __reduce__(self):
+        return (_restore, (type(self), self.to_dict()))
+    
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+def _restore(cls, value):
+    record = cls.from_dict(value)
+    return value if record is None else record
+
+def _plain(value):
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+class Mispronunciation(Record):
+    """A mispronounced phone of a word: canonical-phone, index and pronounced-phone."""
+    __slots__ = ("_canonical", "index", "_pronounced")
+    FIELDS = (("canonical-phone", "canonical_phone"), ("index", "index"), ("pronounced-phone", "pronounced_phone"))
+    
+    def __init__(self, canonical_phone, index, pronounced_phone):
+        self._canonical = PHONES.intern(canonical_phone)
+        self.index = index
+        self._pronounced = PHONES.intern(pronounced_phone)
+    
+    @property
+    def canonical_phone(self):
+        return PHONES.names[self._canonical]
+    
+    @canonical_phone.setter
+    def canonical_phone(self, phone):
+        self._canonical = PHONES.intern(phone)
+    
+    @property
+    def pronounced_phone(self):
+        return PHONES.names[self._pronounced]
+    
+    @pronounced_phone.setter
+    def pronounced_phone(self, phone):
+        self._pronounced = PHONES.intern(phone)
+    
+    @classmethod
+    def from_dict(cls, mis):
+        if mis.keys() != {"canonical-phone", "index", "pronounced-phone"} or type(mis["index"]) is not int \
+                or not isinstance(mis["canonical-phone"], str) or not isinstance(mis["pronounced-phone"], str):
+            return None
+        return cls(mis["canonical-phone"], mis["index"], mis["pronounced-phone"])
+
+class WordScore(Record):
+    """
+    Scores of one word.
+    
+    Phones are stored as interned phone IDs and phones-accuracy as an array of
+    doubles, so the "phones" and "phones-accuracy" lists (of floats) are built
+    when read.
+    """
+    __slots__ = ("text", "accuracy", "stress", "total", "_phones", "_phones_accuracy", "_mispronunciations")
+    FIELDS = (
+        ("text", "text"), ("accuracy", "accuracy"), ("stress", "stress"), ("total", "total"),
+        ("phones", "phones"), ("phones-accuracy", "phones_accuracy"), ("mispronunciations", "mispronunciations")
+    )
+    
+    def __init__(self, text, accuracy, stress, phones, phones_accuracy, total=_ABSENT, mispronunciations=_ABSENT):
+        self.text = sys.intern(text)
+        self.accuracy = accuracy
+        self.stress = stress
+        self.total = total
+        self.phones = phones
+        self.phones_accuracy = phones_accuracy
+        self.mispronunciations = mispronunciations
+    
+    @property
+    def phones(self):
+        return [PHONES.names[i] for i in self._phones]
+    
+    @phones.setter
+    def phones(self, phones):
+        self._phones = _pack_phones(phones)
+    
+    @property
+    def phones_accuracy(self):
+        return self._phones_accuracy.tolist()
+    
+    @phones_accuracy.setter
+    def phones_accuracy(self, scores):
+        self._phones_accuracy = array("d", scores)
+    
+    @property
+    def mispronunciations(self):
+        return self._mispronunciations if self._mispronunciations is _ABSENT else list(self._mispronunciations)
+    
+    @mispronunciations.setter
+    def mispronunciations(self, mispronunciations):
+        self._mispronunciations = mispronunciations if mispronunciations is _ABSENT else tuple(mispronunciations)
+    
+    @classmethod
+    def from_dict(cls, word):
+        required = ("text", "accuracy", "stress", "phones", "phones-accuracy")
+        if not all(key in word for key in required) or not word.keys() <= cls._ATTRIBUTES.keys():
+            return None
+        if not isinstance(word["text"], str) or not all(_is_number(word[key]) for key in ("accuracy", "stress")) \
+                or not _is_number(word.get("total", 0)):
+            return None
+        phones, phones_accuracy = word["phones"], word["phones-accuracy"]
+        if not isinstance(phones, list) or not _all_of(phones, {str}) \
+                or not isinstance(phones_accuracy, list) or not _all_of(phones_accuracy, _NUMBER_TYPES):
+            return None
+        mispronunciations = word.get("mispronunciations", _ABSENT)
+        if mispronunciations is not _ABSENT:
+            if not isinstance(mispronunciations, list):
+                return None
+            mispronunciations = [Mispronunciation.from_dict(mis) if isinstance(mis, dict) else None for mis in mispronunciations]
+            if any(mis is None for mis in mispronunciations):
+                return None
+        return cls(word["text"], word["accuracy"], word["stress"], phones, phones_accuracy,
+                   total=word.get("total", _ABSENT), mispronunciations=mispronunciations)
+
+class UtteranceScores(Record):
+    """Utterance-level scores and the word scores of one utterance."""
+    __slots__ = ("accuracy", "completeness", "fluency", "prosodic", "total", "_word_scores")
+    FIELDS = (
+        ("accuracy", "accuracy"), ("completeness", "completeness"), ("fluency", "fluency"),
+        ("prosodic", "prosodic"), ("total", "total"), ("word_scores", "word_scores")
+    )
+    
+    def __init__(self, accuracy, completeness, fluency, prosodic, word_scores, total=_ABSENT):
+        self.accuracy = accuracy
+        self.completeness = completeness
+        self.fluency = fluency
+        self.prosodic = prosodic
+        self.total = total
+        self.word_scores = word_scores
+    
+    @property
+    def word_scores(self):
+        return list(self._word_scores)
+    
+    @word_scores.setter
+    def word_scores(self, word_scores):
+        self._word_scores = tuple(word_scores)
+    
+    @classmethod
+    def from_dict(cls, scores):
+        required = ("accuracy", "completeness", "fluency", "prosodic", "word_scores")
+        if not all(key in scores for key in required) or not scores.keys() <= cls._ATTRIBUTES.keys():
+            return None
+        if not all(_is_number(scores[key]) for key in required[:4]) or not _is_number(scores.get("total", 0)) \
+                or not isinstance(scores["word_scores"], list):
+            return None
+        # Words that do not fit the record layout stay dictionaries
+        word_scores = []
+        for word in scores["word_scores"]:
+            record = WordScore.from_dict(word) if isinstance(word, dict) else None
+            word_scores.append(word if record is None else record)
+        return cls(scores["accuracy"], scores["completeness"], scores["fluency"], scores["prosodic"], word_scores,
+                   total=scores.get("total", _ABSENT))
+
+class Utterance(Record):
+    """
+    One database utterance.
+    
+    audio_path is only stored when it differs from the path derived from the
+    speaker and utterance IDs.
+    """
+    __slots__ = ("utt_id", "speaker_id", "text", "_audio_path", "text_phone", "scores", "analysis_feedback")
+    FIELDS = (
+        ("utt_id", "utt_id"), ("speaker_id", "speaker_id"), ("text", "text"), ("audio_path", "audio_path"),
+        ("text_phone", "text_phone"), ("scores", "scores"), ("analysis_feedback", "analysis_feedback")
+    )
+    
+    def __init__(self, utt_id, speaker_id, text, audio_path, text_phone, scores, analysis_feedback):
+        self.utt_id = utt_id
+        # Many speakers read the same sentences
+        self.speaker_id = sys.intern(speaker_id)
+        self.text = sys.intern(text)
+        self.audio_path = audio_path
+        self.text_phone = sys.intern(text_phone)
+        self.scores = scores
+        self.analysis_feedback = analysis_feedback
+    
+    def _derived_audio_path(self):
+        return f"WAVE/SPEAKER{self.speaker_id}/{self.utt_id}.wav"
+    
+    @property
+    def audio_path(self):
+        return self._derived_audio_path() if self._audio_path is None else self._audio_path
+    
+    @audio_path.setter
+    def audio_path(self, path):
+        self._audio_path = None if path == self._derived_audio_path() else path
+    
+    @classmethod
+    def from_dict(cls, utt):
+        if utt.keys() != cls._ATTRIBUTES.keys():
+            return None
+        if not all(isinstance(utt[key], str) for key in ("utt_id", "speaker_id", "text", "audio_path", "text_phone")):
+            return None
+        scores = utt["scores"]
+        if isinstance(scores, dict):
+            record = UtteranceScores.from_dict(scores)
+            scores = scores if record is None else record
+        return cls(utt["utt_id"], utt["speaker_id"], utt["text"], utt["audio_path"], utt["text_phone"],
+                   scores, utt["analysis_feedback"])
+
+def compact_utterance(utt):
+    """
+    Convert a database utterance dictionary to a compact Utterance record.
+    
+    Args:
+        utt (dict): Utterance as stored in `Database.data["utterances"]`.
+    
+    Returns:
+        Utterance: The record, or `utt` itself if it has fields or value types the
+        records do not model (such utterances keep working as dictionaries).
+    """
+    if isinstance(utt, Record) or not isinstance(utt, dict):
+        return utt
+    record = Utterance.from_dict(utt)
+    return utt if record is None else record
+
+def compact_utterances(utterances):
+    """
+    Replace the utterance dictionaries of a mapping with compact records, in place.
+    
+    Args:
+        utterances (dict): `Database.data["utterances"]`.
+    
+    Returns:
+        int: Number of utterances converted.
+    """
+    converted = 0
+    for utt_id, utt in utterances.items():
+        record = compact_utterance(utt)
+        if record is not utt:
+            utterances[utt_id] = record
+            converted += 1
+    return converted
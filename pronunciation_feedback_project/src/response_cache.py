@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM responses: an in-memory LRU in front of a SQLite file.
+    
+    Entries are content-addressed by the model name, the generation parameters and
+    a hash of the prompt, so any change to the prompt (for example new history for
+    the speaker) or to the parameters is a miss. Entries older than `ttl` seconds
+    are ignored, and the least recently used disk entries are evicted once the
+    stored responses exceed `max_bytes`.
+    
+    A cache instance may be shared between threads.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL,
+            size INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS responses_by_access ON responses (accessed);
+    """
+    
+    def __init__(self, path="data/llm_cache.db", memory_entries=256, max_bytes=64 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.memory = OrderedDict()
+        self.conn = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self.lock = threading.RLock()
+    
+    def _connect(self):
+        if self.conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(self.SCHEMA)
+        return self.conn
+    
+    @staticmethod
+    def make_key(model_name, params, prompt):
+        """
+        Build the cache key for a generation request.
+        
+        Args:
+            model_name (str): Model used for generation.
+            params (dict): Generation parameters.
+            prompt (str): The prompt.
+        
+        Returns:
+            str: Hex digest identifying the request.
+        """
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        material = json.dumps({"model": model_name, "params": params, "prompt": prompt_hash}, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+    
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+    
+    def get(self, key):
+        """
+        Look up a cached response.
+        
+        Args:
+            key (str): Key from `make_key`.
+        
+        Returns:
+            str: The cached response, or None on a miss.
+        """
+        with self.lock:
+            now = time.time()
+            entry = self.memory.get(key)
+            if entry is not None:
+                response, created = entry
+                if not self._expired(created, now):
+                    self.memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return response
+                del self.memory[key]
+            
+            conn = self._connect()
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or self._expired(row[1], now):
+                if row is not None:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    conn.commit()
+                self.stats["misses"] += 1
+                return None
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self._remember(key, row[0], row[1])
+            self.stats["disk_hits"] += 1
+            return row[0]
+    
+    def put(self, key, response):
+        """
+        Store a response in both tiers.
+        
+        Args:
+            key (str): Key from `make_key`.
+            response (str): The generated response.
+        """
+        with self.lock:
+            now = time.time()
+            self._remember(key, response, now)
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                (key, response, now, now, len(response.encode("utf-8")))
+            )
+            conn.commit()
+            self._evict()
+    
+    def _remember(self, key, response, created):
+        self.memory[key] = (response, created)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+    
+    def _evict(self):
+        conn = self._connect()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until the disk tier fits again
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.memory.pop(key, None)
+            total -= size
+            self.stats["evictions"] += 1
+        conn.commit()
+    
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
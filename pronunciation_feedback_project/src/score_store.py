@@ -0,0 +1,209 @@
+import numpy as np
+from src.interner import Interner
+
+UTTERANCE_FIELDS = ("accuracy", "completeness", "fluency", "prosodic", "total")
+WORD_FIELDS = ("accuracy", "stress", "total")
+
+class ScoreStore:
+    """
+    Columnar view of all utterance, word and phone scores.
+    
+    Each level is a set of contiguous NumPy arrays. Offset arrays link the levels:
+    the words of utterance i are `word_offsets[i]:word_offsets[i + 1]` and the
+    phones of word row j are `phone_offsets[j]:phone_offsets[j + 1]`; the
+    "utterance" and "word_row" columns point back up. Speakers, word texts and
+    phones are interned to integer IDs ("speaker", "word" and "phone" columns), so
+    group-by queries are `np.bincount` calls instead of loops over dictionaries.
+    """
+    def __init__(self):
+        self.speakers = Interner()
+        self.words = Interner()
+        self.phones = Interner()
+        self.utt_ids = []
+        self.utterance = {}
+        self.word = {}
+        self.phone = {}
+    
+    @classmethod
+    def from_utterances(cls, utterances):
+        """
+        Build the store in one pass over database utterances.
+        
+        Args:
+            utterances (iterable): Utterance dictionaries as stored in `Database.data["utterances"]`.
+        
+        Returns:
+            ScoreStore: The columnar store.
+        """
+        store = cls()
+        nan = float("nan")
+        utt_speaker, utt_scores, word_offsets = [], {field: [] for field in UTTERANCE_FIELDS}, [0]
+        word_utt, word_text, word_scores, phone_offsets = [], [], {field: [] for field in WORD_FIELDS}, [0]
+        phone_id, phone_accuracy, phone_word, phone_mispronounced = [], [], [], []
+        
+        for utt in utterances:
+            utt_index = len(store.utt_ids)
+            store.utt_ids.append(utt["utt_id"])
+            utt_speaker.append(store.speakers.intern(utt["speaker_id"]))
+            scores = utt["scores"]
+            for field in UTTERANCE_FIELDS:
+                utt_scores[field].append(scores.get(field, nan))
+            
+            for w in scores.get("word_scores", []):
+                word_index = len(word_utt)
+                word_utt.append(utt_index)
+                # Words inserted through generate_feedback.py use "word" instead of "text"
+                word_text.append(store.words.intern(w.get("text", w.get("word"))))
+                for field in WORD_FIELDS:
+                    word_scores[field].append(w.get(field, nan))
+                
+                phones = w.get("phones", [])
+                first_phone = len(phone_id)
+                for phone, score in zip(phones, w.get("phones-accuracy", [])):
+                    phone_id.append(store.phones.intern(phone))
+                    phone_accuracy.append(score)
+                    phone_word.append(word_index)
+                    phone_mispronounced.append(False)
+                for mis in w.get("mispronunciations") or []:
+                    index = mis.get("index")
+                    if index is None and mis["canonical-phone"] in phones:
+                        index = phones.index(mis["canonical-phone"])
+                    if index is not None and first_phone + index < len(phone_id):
+                        phone_mispronounced[first_phone + index] = True
+                phone_offsets.append(len(phone_id))
+            word_offsets.append(len(word_utt))
+        
+        store.utterance = {field: np.asarray(values, dtype=np.float64) for field, values in utt_scores.items()}
+        store.utterance["speaker"] = np.asarray(utt_speaker, dtype=np.int32)
+        store.word_offsets = np.asarray(word_offsets, dtype=np.int64)
+        
+        store.word = {field: np.asarray(values, dtype=np.float64) for field, values in word_scores.items()}
+        store.word["utterance"] = np.asarray(word_utt, dtype=np.int32)
+        store.word["word"] = np.asarray(word_text, dtype=np.int32)
+        store.word["speaker"] = store.utterance["speaker"][store.word["utterance"]]
+        store.phone_offsets = np.asarray(phone_offsets, dtype=np.int64)
+        
+        store.phone = {
+            "accuracy": np.asarray(phone_accuracy, dtype=np.float64),
+            "phone": np.asarray(phone_id, dtype=np.int32),
+            "word_row": np.asarray(phone_word, dtype=np.int32),
+            "mispronounced": np.asarray(phone_mispronounced, dtype=bool)
+        }
+        store.phone["word"] = store.word["word"][store.phone["word_row"]]
+        store.phone["utterance"] = store.word["utterance"][store.phone["word_row"]]
+        store.phone["speaker"] = store.utterance["speaker"][store.phone["utterance"]]
+        return store
+    
+    def _level(self, level):
+        columns = {"utterance": self.utterance, "word": self.word, "phone": self.phone}.get(level)
+        if columns is None:
+            raise ValueError(f"Unknown level '{level}'. Expected 'utterance', 'word' or 'phone'.")
+        return columns
+    
+    def _interner(self, key):
+        interner = {"speaker": self.speakers, "word": self.words, "phone": self.phones}.get(key)
+        if interner is None:
+            raise ValueError(f"Cannot group by '{key}'. Expected 'speaker', 'word' or 'phone'.")
+        return interner
+    
+    def mask(self, level, speaker_id=None, word=None, phone=None, low=None, high=None, field="accuracy"):
+        """
+        Build a boolean row mask for a level.
+        
+        Args:
+            level (str): "utterance", "word" or "phone".
+            speaker_id (str, optional): Keep only rows of this speaker.
+            word (str, optional): Keep only rows of this word text (word and phone levels).
+            phone (str, optional): Keep only rows of this phone (phone level).
+            low (float, optional): Keep only rows with `field` >= low.
+            high (float, optional): Keep only rows with `field` <= high.
+            field (str): Score field the low/high bounds apply to.
+        
+        Returns:
+            np.ndarray: Boolean mask over the rows of the level.
+        """
+        columns = self._level(level)
+        values = columns[field]
+        mask = ~np.isnan(values)
+        for key, name in (("speaker", speaker_id), ("word", word), ("phone", phone)):
+            if name is None:
+                continue
+            if key not in columns:
+                raise ValueError(f"Level '{level}' cannot be filtered by {key}")
+            ids = columns[key]
+            index = self._interner(key).get(name)
+            mask &= ids == (-1 if index is None else index)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        return mask
+    
+    def values(self, level, field="accuracy", **filters):
+        """Return the `field` scores of a level, filtered like `mask`."""
+        return self._level(level)[field][self.mask(level, field=field, **filters)]
+    
+    def group_by(self, level, by, field="accuracy", stat="mean", **filters):
+        """
+        Aggregate a score field per speaker, word or phone.
+        
+        Args:
+            level (str): "utterance", "word" or "phone".
+            by (str): "speaker", "word" or "phone".
+            field (str): Score field to aggregate.
+            stat (str): "mean", "sum", "count", "min" or "max".
+            **filters: Row filters, see `mask`.
+        
+        Returns:
+            dict: Group name to aggregated value, for groups with at least one row.
+        """
+        columns = self._level(level)
+        if by not in columns:
+            raise ValueError(f"Level '{level}' cannot be grouped by '{by}'")
+        mask = self.mask(level, field=field, **filters)
+        groups = columns[by][mask]
+        values = columns[field][mask]
+        names = self._interner(by).names
+        
+        counts = np.bincount(groups, minlength=len(names))
+        if stat in ("mean", "sum"):
+            result = np.bincount(groups, weights=values, minlength=len(names))
+            if stat == "mean":
+                result = result / np.maximum(counts, 1)
+        elif stat == "count":
+            result = counts
+        elif stat in ("min", "max"):
+            result = np.full(len(names), np.inf if stat == "min" else -np.inf)
+            (np.minimum if stat == "min" else np.maximum).at(result, groups, values)
+        else:
+            raise ValueError(f"Unknown stat '{stat}'")
+        present = np.flatnonzero(counts)
+        return {names[i]: result[i].item() for i in present}
+    
+    def group_by_speaker(self, field="accuracy", level="utterance", stat="mean", **filters):
+        return self.group_by(level, "speaker", field=field, stat=stat, **filters)
+    
+    def group_by_phone(self, field="accuracy", stat="mean", **filters):
+        return self.group_by("phone", "phone", field=field, stat=stat, **filters)
+    
+    def percentiles(self, level, field="accuracy", q=(10, 25, 50, 75, 90), **filters):
+        """
+        Compute percentiles of a score field.
+        
+        Args:
+            level (str): "utterance", "word" or "phone".
+            field (str): Score field.
+            q (sequence): Percentiles to compute, between 0 and 100.
+            **filters: Row filters, see `mask`.
+        
+        Returns:
+            dict: Percentile to value, or an empty dict if no rows match.
+        """
+        values = self.values(level, field=field, **filters)
+        if not len(values):
+            return {}
+        return dict(zip(q, np.percentile(values, q).tolist()))
+    
+    def filter_utterances(self, field="accuracy", **filters):
+        """Return the IDs of utterances matching the filters, see `mask`."""
+        return [self.utt_ids[i] for i in np.flatnonzero(self.mask("utterance", field=field, **filters))]
@@ -0,0 +1,49 @@
+import gc
+import pickle
+from src.file_io import atomic_write
+
+SNAPSHOT_VERSION = 1
+
+def write_snapshot(path, data, key):
+    """
+    Write a binary snapshot of the database contents.
+    
+    The snapshot is written to a temporary file and renamed into place, so readers
+    never see a partial file and concurrent processes can write it safely.
+    
+    Args:
+        path (str): Snapshot file path.
+        data (dict): Database data with "speakers" and "utterances".
+        key (tuple): Storage (epoch, generation) the data corresponds to.
+    """
+    with atomic_write(path, "wb") as f:
+        pickle.dump({"version": SNAPSHOT_VERSION, "key": key}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def read_snapshot(path):
+    """
+    Read a snapshot written by `write_snapshot`.
+    
+    Args:
+        path (str): Snapshot file path.
+    
+    Returns:
+        tuple: (key, data), or None if there is no usable snapshot.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = pickle.load(f)
+            if not isinstance(header, dict) or header.get("version") != SNAPSHOT_VERSION:
+                return None
+            # Loading creates millions of small containers; pausing the cyclic GC
+            # avoids repeated full collections while they are allocated
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                data = pickle.load(f)
+            finally:
+                if gc_enabled:
+                    gc.enable()
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    return tuple(header["key"]), data
@@ -0,0 +1,78 @@
+import json
+import os
+from src.file_io import atomic_write
+
+MANIFEST_VERSION = 1
+
+class SourceManifest:
+    """
+    Content hashes of the speechocean762 inputs each database utterance was derived from.
+    
+    Kept next to the database (`<database_path>.manifest`) so that
+    `update_database.py` can tell which utterances changed since the last build or
+    update. Besides one `source_hash` per utterance, the manifest records the size
+    and modification time of every source file, so an update with untouched
+    sources returns without reading them, and the storage epoch it belongs to, so
+    a manifest outlives neither a rebuilt nor a re-imported database.
+    
+    Args:
+        path (str): Manifest file path.
+        epoch (str): Storage epoch of the database (None for JSON databases).
+        files (dict): Source path to [size, mtime_ns].
+        hashes (dict): Utterance ID to source hash.
+    """
+    def __init__(self, path, epoch=None, files=None, hashes=None):
+        self.path = path
+        self.epoch = epoch
+        self.files = files or {}
+        self.hashes = hashes or {}
+    
+    @staticmethod
+    def file_signatures(paths):
+        """
+        Get the [size, mtime_ns] of each source file.
+        
+        Args:
+            paths (list): Source file paths.
+        
+        Returns:
+            dict: Path to [size, mtime_ns], or to None for a missing file.
+        """
+        signatures = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                signatures[path] = [stat.st_size, stat.st_mtime_ns]
+            except FileNotFoundError:
+                signatures[path] = None
+        return signatures
+    
+    @classmethod
+    def load(cls, path, epoch):
+        """
+        Read a manifest written for the database with the given epoch.
+        
+        Args:
+            path (str): Manifest file path.
+            epoch (str): Current storage epoch of the database.
+        
+        Returns:
+            SourceManifest: The manifest, or None if it is missing, unreadable or
+            was written for other database contents.
+        """
+        try:
+            with open(path, "r") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+            return None
+        if manifest.get("epoch") != epoch:
+            print(f"Ignoring {path}: it was written for a different database")
+            return None
+        return cls(path, epoch, manifest["files"], manifest["hashes"])
+    
+    def save(self):
+        with atomic_write(self.path) as f:
+            json.dump({"version": MANIFEST_VERSION, "epoch": self.epoch, "files": self.files, "hashes": self.hashes},
+                      f, separators=(",", ":"))
@@ -0,0 +1,156 @@
+import json
+from collections import OrderedDict
+from collections.abc import Mapping
+from src.instrumentation import METRICS
+from src.records import to_plain
+
+class SpeakerShardCache:
+    """
+    LRU cache of per-speaker shards loaded on demand from the storage backend.
+    
+    A shard holds one speaker's sorted utterance IDs and utterances. The cache is
+    bounded by the stored size of the shards it holds: the least recently used
+    shards are dropped once `max_bytes` is exceeded (the most recent shard is always
+    kept). Writes go through the storage backend, so a dropped shard is simply
+    reloaded the next time it is needed.
+    """
+    def __init__(self, storage, max_bytes=64 * 1024 * 1024):
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.shards = OrderedDict()
+        self.utt_speaker = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, speaker_id, create=False):
+        """
+        Get a speaker's shard, loading it from storage if needed.
+        
+        Args:
+            speaker_id (str): Speaker ID.
+            create (bool): Create an empty shard for a speaker without utterances.
+        
+        Returns:
+            dict: The shard, or None if the speaker has no utterances and create is False.
+        """
+        shard = self.shards.get(speaker_id)
+        if shard is not None:
+            self.hits += 1
+            self.shards.move_to_end(speaker_id)
+            return shard
+        
+        self.misses += 1
+        with METRICS.timer("pfg_shard_load_seconds"):
+            rows = self.storage.load_speaker(speaker_id)
+        if not rows and not create:
+            return None
+        shard = {
+            "utt_ids": [utt["utt_id"] for utt, _ in rows],
+            "utterances": {utt["utt_id"]: utt for utt, _ in rows},
+            "sizes": {utt["utt_id"]: size for utt, size in rows},
+            "bytes": sum(size for _, size in rows)
+        }
+        self.shards[speaker_id] = shard
+        self.bytes += shard["bytes"]
+        for utt_id in shard["utt_ids"]:
+            self.utt_speaker[utt_id] = speaker_id
+        self._evict()
+        return shard
+    
+    def shard_for_utterance(self, utt_id):
+        speaker_id = self.utt_speaker.get(utt_id)
+        if speaker_id is None:
+            speaker_id = self.storage.speaker_of(utt_id)
+            if speaker_id is None:
+                return None
+        return self.get(speaker_id)
+    
+    def add(self, utt):
+        """Add or replace an utterance in its speaker's shard."""
+        utt_id = utt["utt_id"]
+        previous = self.shards.get(self.utt_speaker.get(utt_id))
+        shard = self.get(utt["speaker_id"], create=True)
+        if previous is not None and previous is not shard:
+            # The utterance moved to another speaker
+            self._discard(previous, utt_id)
+        self._discard(shard, utt_id)
+        size = len(json.dumps(utt, default=to_plain))
+        shard["utterances"][utt_id] = utt
+        shard["sizes"][utt_id] = size
+        shard["bytes"] += size
+        self.bytes += size
+        self.utt_speaker[utt_id] = utt["speaker_id"]
+        self._evict()
+    
+    def remove(self, utt_id):
+        """Remove an utterance from its speaker's shard (the shard's utt_ids are left to the caller)."""
+        shard = self.shard_for_utterance(utt_id)
+        if shard is not None:
+            self._discard(shard, utt_id)
+        self.utt_speaker.pop(utt_id, None)
+    
+    def _discard(self, shard, utt_id):
+        # Drop an utterance and its size from a cached shard
+        shard["utterances"].pop(utt_id, None)
+        size = shard["sizes"].pop(utt_id, 0)
+        shard["bytes"] -= size
+        self.bytes -= size
+    
+    def has_speaker(self, speaker_id):
+        return speaker_id in self.shards or self.storage.has_speaker(speaker_id)
+    
+    def _evict(self):
+        while self.bytes > self.max_bytes and len(self.shards) > 1:
+            _, shard = self.shards.popitem(last=False)
+            self.bytes -= shard["bytes"]
+            self.evictions += 1
+            for utt_id in shard["utterances"]:
+                self.utt_speaker.pop(utt_id, None)
+
+class LazySpeakers(Mapping):
+    """`Database.data["speakers"]` backed by a SpeakerShardCache."""
+    def __init__(self, cache):
+        self.cache = cache
+    
+    def __getitem__(self, speaker_id):
+        shard = self.cache.get(speaker_id)
+        if shard is None:
+            raise KeyError(speaker_id)
+        return shard["utt_ids"]
+    
+    def __setitem__(self, speaker_id, utt_ids):
+        self.cache.get(speaker_id, create=True)["utt_ids"] = utt_ids
+    
+    def __contains__(self, speaker_id):
+        return self.cache.has_speaker(speaker_id)
+    
+    def __iter__(self):
+        return iter(self.cache.storage.speaker_manifest())
+    
+    def __len__(self):
+        return len(self.cache.storage.speaker_manifest())
+
+class LazyUtterances(Mapping):
+    """`Database.data["utterances"]` backed by a SpeakerShardCache."""
+    def __init__(self, cache):
+        self.cache = cache
+    
+    def __getitem__(self, utt_id):
+        shard = self.cache.shard_for_utterance(utt_id)
+        if shard is None or utt_id not in shard["utterances"]:
+            raise KeyError(utt_id)
+        return shard["utterances"][utt_id]
+    
+    def __setitem__(self, utt_id, utt):
+        self.cache.add(utt)
+    
+    def __delitem__(self, utt_id):
+        self.cache.remove(utt_id)
+    
+    def __iter__(self):
+        return iter(self.cache.storage.utt_ids())
+    
+    def __len__(self):
+        return sum(self.cache.storage.speaker_manifest().values())
@@ -0,0 +1,425 @@
+import json
+import os
+import sqlite3
+import uuid
+from src.file_io import FileLock, atomic_write
+from src.records import to_plain
+
+class JSONStorage:
+    """
+    Whole-file JSON storage, the original `data/database.json` layout.
+    
+    Every commit re-serializes the full database, so this backend is only kept
+    for compatibility with existing files and for exporting.
+    
+    Commits are safe with several processes writing the same file: under an
+    advisory lock, the current file is re-read, the utterances this process
+    changed are merged into it, and the result is written to a temporary file
+    that is renamed into place. Changes from other processes are kept instead of
+    being overwritten by this process's stale copy.
+    """
+    supports_snapshots = False
+    supports_lazy = False
+    
+    def __init__(self, path):
+        self.path = path
+        self._pending = set()
+    
+    def exists(self):
+        return os.path.exists(self.path)
+    
+    def needs_migration(self):
+        # The legacy list layout is converted when the file is loaded
+        return False
+    
+    def load(self, record=None):
+        """
+        Read the whole file.
+        
+        Args:
+            record (callable, optional): Applied to each utterance after reading (e.g. records.compact_utterance).
+        
+        Returns:
+            dict: Database data.
+        """
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        if record is not None:
+            utterances = data["utterances"]
+            # The legacy layout keeps utterances in a list
+            keys = list(utterances) if isinstance(utterances, dict) else range(len(utterances))
+            for key in keys:
+                utterances[key] = record(utterances[key])
+        return data
+    
+    def put_utterance(self, utt):
+        self._pending.add(utt["utt_id"])
+    
+    def put_feedback(self, utt_id, feedback):
+        self._pending.add(utt_id)
+    
+    def delete_utterance(self, utt_id):
+        # Removed from the file at commit time, because it is no longer in `data`
+        self._pending.add(utt_id)
+    
+    def epoch(self):
+        # Whole-file writes leave nothing to tell one version of the contents from another
+        return None
+    
+    def _write(self, data):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with atomic_write(self.path) as f:
+            json.dump(data, f, indent=2, default=to_plain)
+        return os.path.getsize(self.path)
+    
+    def replace_all(self, data):
+        with FileLock(self.path):
+            self._write(data)
+        self._pending.clear()
+    
+    def commit(self, data):
+        """
+        Merge the pending utterances into the file.
+        
+        Returns:
+            int: Bytes written (the size of the whole file).
+        """
+        if not self._pending:
+            return 0
+        with FileLock(self.path):
+            current = self.load() if self.exists() else {"speakers": {}, "utterances": {}}
+            for utt_id in self._pending:
+                utt = data["utterances"].get(utt_id)
+                previous = current["utterances"].get(utt_id)
+                if utt is None:
+                    # Deleted by this process
+                    if previous is not None:
+                        del current["utterances"][utt_id]
+                        current["speakers"][previous["speaker_id"]].remove(utt_id)
+                    continue
+                if previous is not None and previous["speaker_id"] != utt["speaker_id"]:
+                    current["speakers"][previous["speaker_id"]].remove(utt_id)
+                current["utterances"][utt_id] = utt
+                utt_ids = current["speakers"].setdefault(utt["speaker_id"], [])
+                if utt_id not in utt_ids:
+                    utt_ids.append(utt_id)
+                    utt_ids.sort()
+            written = self._write(current)
+        self._pending.clear()
+        return written
+    
+    def close(self):
+        pass
+
+class SQLiteStorage:
+    """
+    SQLite storage in WAL mode with one row per utterance.
+    
+    The speakers dictionary is derived from the `speaker_id` column, so inserting
+    an utterance writes exactly one row and saving analysis feedback updates one
+    column of one row.
+    
+    Every write transaction bumps a generation counter in the `meta` table and
+    stamps the rows it touches with it, so a snapshot taken at generation G can be
+    brought up to date by reading only the rows with a higher generation. The
+    `epoch` changes whenever the whole table is replaced.
+    
+    The schema version is kept in `PRAGMA user_version`:
+        1: utterances table only (files written before the format was versioned).
+        2: adds the per-row generation and the meta table.
+    """
+    SCHEMA_VERSION = 2
+    SCHEMA = """
+        CREATE TABLE utterances (
+            utt_id TEXT PRIMARY KEY,
+            speaker_id TEXT NOT NULL,
+            body TEXT NOT NULL,
+            analysis_feedback TEXT,
+            generation INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX utterances_by_speaker ON utterances (speaker_id, utt_id);
+        CREATE INDEX utterances_by_generation ON utterances (generation);
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value);
+    """
+    # Statements upgrading a database from the given version to the next one
+    MIGRATIONS = {
+        1: [
+            "ALTER TABLE utterances ADD COLUMN generation INTEGER NOT NULL DEFAULT 0",
+            "CREATE INDEX utterances_by_generation ON utterances (generation)",
+            "CREATE TABLE meta (key TEXT PRIMARY KEY, value)"
+        ]
+    }
+    supports_snapshots = True
+    supports_lazy = True
+    
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+        self.version = None
+        self.loaded_key = None
+        self._generation = None
+        # Bytes of row data written by the open transaction
+        self._pending_bytes = 0
+    
+    def _connect(self):
+        if self.conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Callers that share a Database between threads serialize access themselves.
+            # Writers in other processes hold the lock briefly; wait for them instead of failing.
+            self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            has_table = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'utterances'"
+            ).fetchone()
+            if not has_table:
+                self.conn.executescript(self.SCHEMA)
+                self._init_meta()
+                version = self.SCHEMA_VERSION
+            elif version == 0:
+                version = 1
+            self.version = version
+        return self.conn
+    
+    def _init_meta(self):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex,))
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', 0)")
+        self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.conn.commit()
+    
+    def exists(self):
+        if not os.path.exists(self.path):
+            return False
+        return self._connect().execute("SELECT 1 FROM utterances LIMIT 1").fetchone() is not None
+    
+    def needs_migration(self):
+        self._connect()
+        return self.version < self.SCHEMA_VERSION
+    
+    def migrate(self):
+        """
+        Upgrade the database file to the current schema version.
+        
+        Returns:
+            list: The versions that were migrated from, in order.
+        """
+        conn = self._connect()
+        applied = []
+        while self.version < self.SCHEMA_VERSION:
+            for statement in self.MIGRATIONS[self.version]:
+                conn.execute(statement)
+            applied.append(self.version)
+            self.version += 1
+        if applied:
+            self._init_meta()
+        return applied
+    
+    @staticmethod
+    def _encode(utt):
+        # analysis_feedback is stored in its own column so it can be updated in place
+        body = {key: value for key, value in utt.items() if key != "analysis_feedback"}
+        return json.dumps(body, separators=(",", ":"), default=to_plain)
+    
+    @staticmethod
+    def _decode(body, analysis_feedback):
+        utt = json.loads(body)
+        utt["analysis_feedback"] = analysis_feedback
+        return utt
+    
+    def _read_key(self, conn=None):
+        rows = dict((conn or self.conn).execute("SELECT key, value FROM meta WHERE key IN ('epoch', 'generation')"))
+        return rows["epoch"], rows["generation"]
+    
+    def load(self, record=None):
+        """
+        Read every utterance.
+        
+        Args:
+            record (callable, optional): Applied to each utterance as it is decoded
+                (e.g. records.compact_utterance), so the decoded dictionaries never all exist at once.
+        
+        Returns:
+            dict: Database data.
+        """
+        conn = self._connect()
+        data = {"speakers": {}, "utterances": {}}
+        # Read the rows and the snapshot key from the same read transaction
+        conn.execute("BEGIN")
+        try:
+            self.loaded_key = self._read_key()
+            for body, analysis_feedback in conn.execute("SELECT body, analysis_feedback FROM utterances ORDER BY rowid"):
+                utt = self._decode(body, analysis_feedback)
+                if record is not None:
+                    utt = record(utt)
+                data["utterances"][utt["utt_id"]] = utt
+                data["speakers"].setdefault(utt["speaker_id"], []).append(utt["utt_id"])
+        finally:
+            conn.rollback()
+        for utt_ids in data["speakers"].values():
+            utt_ids.sort()
+        return data
+    
+    def load_changes(self, key):
+        """
+        Read the utterances written after a snapshot was taken.
+        
+        Args:
+            key (tuple): (epoch, generation) the snapshot was taken at.
+        
+        Only committed rows are read, also while this connection has uncommitted writes.
+        
+        Returns:
+            list: Changed utterances in write order, or None if the table has been
+            replaced since and the snapshot cannot be used.
+        """
+        conn = self._connect()
+        # The open transaction cannot start a read transaction; a second connection sees the committed rows
+        reader = sqlite3.connect(self.path, timeout=30) if conn.in_transaction else conn
+        reader.execute("BEGIN")
+        try:
+            epoch, generation = self._read_key(reader)
+            if epoch != key[0] or generation < key[1]:
+                return None
+            rows = reader.execute(
+                "SELECT body, analysis_feedback FROM utterances WHERE generation > ? ORDER BY generation, rowid", (key[1],)
+            ).fetchall()
+            self.loaded_key = (epoch, generation)
+        finally:
+            reader.rollback()
+            if reader is not conn:
+                reader.close()
+        return [self._decode(body, analysis_feedback) for body, analysis_feedback in rows]
+    
+    def speaker_manifest(self):
+        """
+        Get the number of utterances per speaker without reading any utterance bodies.
+        
+        Returns:
+            dict: Speaker ID to utterance count, in first-insertion order.
+        """
+        rows = self._connect().execute(
+            "SELECT speaker_id, COUNT(*) FROM utterances GROUP BY speaker_id ORDER BY MIN(rowid)"
+        )
+        return dict(rows)
+    
+    def has_speaker(self, speaker_id):
+        return self._connect().execute(
+            "SELECT 1 FROM utterances WHERE speaker_id = ? LIMIT 1", (speaker_id,)
+        ).fetchone() is not None
+    
+    def speaker_of(self, utt_id):
+        row = self._connect().execute("SELECT speaker_id FROM utterances WHERE utt_id = ?", (utt_id,)).fetchone()
+        return row[0] if row else None
+    
+    def load_speaker(self, speaker_id):
+        """
+        Load one speaker's utterances.
+        
+        Args:
+            speaker_id (str): Speaker ID.
+        
+        Returns:
+            list: (utterance, stored size in bytes) pairs sorted by utterance ID.
+        """
+        rows = self._connect().execute(
+            "SELECT body, analysis_feedback FROM utterances WHERE speaker_id = ? ORDER BY utt_id", (speaker_id,)
+        )
+        return [(self._decode(body, analysis_feedback), len(body) + len(analysis_feedback or ""))
+                for body, analysis_feedback in rows]
+    
+    def utt_ids(self):
+        return [row[0] for row in self._connect().execute("SELECT utt_id FROM utterances ORDER BY rowid")]
+    
+    def _write_generation(self):
+        # The first write of a transaction takes the next generation number
+        if self._generation is None:
+            self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+            self._generation = self.conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+        return self._generation
+    
+    def put_utterance(self, utt):
+        conn = self._connect()
+        body = self._encode(utt)
+        self._pending_bytes += len(body) + len(utt.get("analysis_feedback") or "")
+        conn.execute(
+            "INSERT INTO utterances (utt_id, speaker_id, body, analysis_feedback, generation) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (utt_id) DO UPDATE SET speaker_id = excluded.speaker_id, body = excluded.body, "
+            "analysis_feedback = excluded.analysis_feedback, generation = excluded.generation",
+            (utt["utt_id"], utt["speaker_id"], body, utt.get("analysis_feedback"), self._write_generation())
+        )
+    
+    def put_feedback(self, utt_id, feedback):
+        conn = self._connect()
+        self._pending_bytes += len(feedback or "")
+        conn.execute("UPDATE utterances SET analysis_feedback = ?, generation = ? WHERE utt_id = ?",
+                     (feedback, self._write_generation(), utt_id))
+    
+    def delete_utterance(self, utt_id):
+        conn = self._connect()
+        if conn.execute("DELETE FROM utterances WHERE utt_id = ?", (utt_id,)).rowcount:
+            # Snapshots only replay rows written after them and cannot see a deletion,
+            # so a new epoch makes them stale
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'epoch'", (uuid.uuid4().hex,))
+            self._write_generation()
+    
+    def epoch(self):
+        self._connect()
+        return self._read_key()[0]
+    
+    def current_key(self):
+        """Get the (epoch, generation) of the committed contents, as tagged on snapshots."""
+        self._connect()
+        return self._read_key()
+    
+    def in_transaction(self):
+        """Check for uncommitted writes."""
+        return self.conn is not None and self.conn.in_transaction
+    
+    def replace_all(self, data):
+        conn = self._connect()
+        conn.execute("DELETE FROM utterances")
+        conn.executemany(
+            "INSERT INTO utterances (utt_id, speaker_id, body, analysis_feedback) VALUES (?, ?, ?, ?)",
+            ((utt["utt_id"], utt["speaker_id"], self._encode(utt), utt.get("analysis_feedback"))
+             for utt in data["utterances"].values())
+        )
+        # A new epoch invalidates every snapshot of the old contents
+        self._init_meta()
+        self._generation = None
+        self.loaded_key = self._read_key()
+    
+    def commit(self, data):
+        """
+        Commit the open transaction.
+        
+        Returns:
+            int: Bytes of row data written by the transaction.
+        """
+        self._connect().commit()
+        self._generation = None
+        written, self._pending_bytes = self._pending_bytes, 0
+        return written
+    
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+def open_storage(path):
+    """
+    Pick a storage backend from the database file extension.
+    
+    Args:
+        path (str): Path of the database file.
+    
+    Returns:
+        JSONStorage for `.json` files, SQLiteStorage otherwise.
+    """
+    if path.endswith(".json"):
+        return JSONStorage(path)
+    return SQLiteStorage(path)
@@ -0,0 +1,142 @@
+import json
+from collections.abc import Mapping
+from numbers import Real
+
+SCORE_FIELDS = ["accuracy", "fluency", "prosodic", "completeness"]
+
+def validate_score(value, name):
+    """
+    Validate that a score is a number between 0 and 10.
+    
+    Returns:
+        float: The score.
+    
+    Raises:
+        ValueError: If the score is not a number in range.
+    """
+    try:
+        score = float(value)
+        if not 0 <= score <= 10:
+            raise ValueError(f"{name} must be between 0 and 10, got {score}")
+        return score
+    except (TypeError, ValueError) as e:
+        # TypeError: null or a non-number in a JSON record
+        raise ValueError(f"Invalid {name}: {str(e)}")
+
+def validate_word_scores(value):
+    """
+    Validate word scores given as a JSON string or an already parsed list.
+    
+    Returns:
+        list: The word scores.
+    
+    Raises:
+        ValueError: If the word scores are malformed or out of range.
+    """
+    try:
+        word_scores = json.loads(value) if isinstance(value, str) else value
+        if not isinstance(word_scores, list):
+            raise ValueError("word_scores must be a list of word score objects")
+        
+        # The word may also be given as "text" and the produced phone as "pronounced-phone",
+        # the key names used in the speechocean762 scores
+        required_fields = ["accuracy", "stress", "phones", "phones-accuracy", "mispronunciations"]
+        for i, word_score in enumerate(word_scores):
+            # Check for required fields
+            if not isinstance(word_score, dict):
+                raise ValueError(f"Word score at index {i} must be an object")
+            if "word" not in word_score and "text" not in word_score:
+                raise ValueError(f"Word score at index {i} is missing required field: word")
+            for field in required_fields:
+                if field not in word_score:
+                    raise ValueError(f"Word score at index {i} is missing required field: {field}")
+            
+            # Validate numerical fields
+            if not 0 <= word_score["accuracy"] <= 10:
+                raise ValueError(f"Word score at index {i} has invalid accuracy: {word_score['accuracy']} (must be between 0 and 10)")
+            if not 0 <= word_score["stress"] <= 10:
+                raise ValueError(f"Word score at index {i} has invalid stress: {word_score['stress']} (must be between 0 and 10)")
+            
+            # Validate phones and phones-accuracy
+            if len(word_score["phones"]) != len(word_score["phones-accuracy"]):
+                raise ValueError(f"Word score at index {i} has mismatched phones and phones-accuracy lengths")
+            for score in word_score["phones-accuracy"]:
+                if not 0 <= score <= 2:
+                    raise ValueError(f"Word score at index {i} has invalid phones-accuracy value: {score} (must be between 0 and 2)")
+            
+            # Validate mispronunciations
+            for mis in word_score["mispronunciations"]:
+                if not isinstance(mis, dict) or "canonical-phone" not in mis \
+                        or ("produced-phone" not in mis and "pronounced-phone" not in mis):
+                    raise ValueError(f"Word score at index {i} has invalid mispronunciation: missing canonical-phone or produced-phone")
+        
+        return word_scores
+    except (json.JSONDecodeError, ValueError, TypeError, KeyError, AttributeError) as e:
+        # TypeError, KeyError, AttributeError: values of the wrong type or shape, e.g. "phones": null
+        raise ValueError(f"Invalid word_scores JSON: {str(e)}")
+
+def validate_scores(scores):
+    """
+    Validate the scores of a new utterance with the same rules as the command-line arguments.
+    
+    Args:
+        scores (dict): Utterance-level scores and "word_scores".
+    
+    Returns:
+        dict: The scores, with the utterance-level scores as floats.
+    
+    Raises:
+        ValueError: If a score is missing, malformed or out of range.
+    """
+    if not isinstance(scores, dict):
+        raise ValueError("scores must be an object")
+    missing = [field for field in SCORE_FIELDS + ["word_scores"] if field not in scores]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+    validated = dict(scores)
+    for name in SCORE_FIELDS:
+        validated[name] = validate_score(scores[name], name)
+    validated["word_scores"] = validate_word_scores(scores["word_scores"])
+    return validated
+
+def check_stored_scores(scores):
+    """
+    Check that utterance scores have the shape the database's derived state reads.
+    
+    Looser than `validate_scores`: only types and lengths are checked, so scores
+    built from the speechocean762 sources (words without mispronunciations,
+    compact records) pass. Database.replace_utterance calls this before it
+    changes anything, so a malformed utterance is rejected as a whole.
+    
+    Raises:
+        ValueError: If the scores cannot be stored.
+    """
+    if not isinstance(scores, Mapping):
+        raise ValueError("scores must be an object")
+    for name in SCORE_FIELDS + ["total"]:
+        value = scores.get(name)
+        # The speaker aggregates sum accuracy, fluency and prosodic; the sources leave some completeness scores empty
+        if not isinstance(value, Real) and (value is not None or name in ("accuracy", "fluency", "prosodic")):
+            raise ValueError(f"Invalid {name}: {value!r} is not a number")
+    word_scores = scores.get("word_scores", [])
+    if not isinstance(word_scores, list):
+        raise ValueError("word_scores must be a list of word score objects")
+    for i, word in enumerate(word_scores):
+        if not isinstance(word, Mapping):
+            raise ValueError(f"Word score at index {i} must be an object")
+        if not all(isinstance(word.get(name), Real) for name in ("accuracy", "stress")):
+            raise ValueError(f"Word score at index {i} has a non-numeric accuracy or stress")
+        phones = word.get("phones")
+        phones_accuracy = word.get("phones-accuracy")
+        if not isinstance(phones, list) or not all(isinstance(phone, str) for phone in phones) \
+                or not isinstance(phones_accuracy, list) or not all(isinstance(score, Real) for score in phones_accuracy) \
+                or len(phones) != len(phones_accuracy):
+            raise ValueError(f"Word score at index {i} needs equally long phones and numeric phones-accuracy lists")
+        mispronunciations = word.get("mispronunciations") or []
+        if not isinstance(mispronunciations, list):
+            raise ValueError(f"Word score at index {i} has invalid mispronunciations")
+        for mis in mispronunciations:
+            index = mis.get("index") if isinstance(mis, Mapping) else None
+            if not isinstance(mis, Mapping) or not isinstance(mis.get("canonical-phone"), str) \
+                    or not (index is None or type(index) is int):
+                raise ValueError(f"Word score at index {i} has invalid mispronunciation: {mis!r}")
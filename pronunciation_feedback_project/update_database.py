@@ -0,0 +1,37 @@
+import argparse
+import os
+from src.database import (Database, DEFAULT_DATABASE_PATH, DEFAULT_SCORES_DETAIL_PATH, DEFAULT_TEXT_PHONE_PATH,
+                          DEFAULT_UTT2SPK_PATH)
+from src.database_updater import update_database
+from src.instrumentation import add_command_arguments, instrumented_command
+from src.storage import open_storage
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-derive the database utterances whose speechocean762 sources changed.")
+    parser.add_argument("--database_path", default=DEFAULT_DATABASE_PATH, help=f"Database to update (default: {DEFAULT_DATABASE_PATH})")
+    parser.add_argument("--scores_detail_path", default=DEFAULT_SCORES_DETAIL_PATH, help=f"(default: {DEFAULT_SCORES_DETAIL_PATH})")
+    parser.add_argument("--text_phone_path", default=DEFAULT_TEXT_PHONE_PATH, help=f"(default: {DEFAULT_TEXT_PHONE_PATH})")
+    parser.add_argument("--utt2spk_path", default=DEFAULT_UTT2SPK_PATH, help=f"(default: {DEFAULT_UTT2SPK_PATH})")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes scoring changed utterances (default: 1)")
+    parser.add_argument("--dry_run", action="store_true", help="Only report what would change")
+    add_command_arguments(parser)
+    args = parser.parse_args()
+    
+    storage = open_storage(args.database_path)
+    exists = storage.exists()
+    storage.close()
+    if not exists:
+        parser.error(f"{args.database_path} not found. Run build_database.py first.")
+    for path in (args.scores_detail_path, args.text_phone_path, args.utt2spk_path):
+        if not os.path.exists(path):
+            parser.error(f"{path} not found")
+    
+    # Only the speakers of changed utterances are read
+    with instrumented_command(args):
+        db = Database(database_path=args.database_path, lazy=True)
+        update_database(db, args.scores_detail_path, args.text_phone_path, args.utt2spk_path,
+                        workers=args.workers, dry_run=args.dry_run)
+        db.storage.close()
+
+if __name__ == "__main__":
+    main()